@@ -0,0 +1,263 @@
+"""Coarser time units derived from the hourly basin data.
+
+The 3h and 1D series are sums (streamflow and precipitation, in mm per time
+step) or means (the other variables) of the 1h series, so they do not need to
+be stored and read separately. :func:`aggregate_values` computes them by
+placing the hourly values on a dense grid aligned to the period boundaries and
+reducing the reshaped (period, step, variable) array. The periods are labelled
+like the stored series of the time unit: 3h periods start at 01:00, 04:00, ...,
+one hour after the day boundary (:data:`LABEL_OFFSETS`), 1D periods at 00:00.
+:class:`AggregatedBasinView` serves the result with the loader API of
+:class:`~hydroneimenggu.basin_store.BasinArrayStore`, keeping the most recently
+used basins in memory. The store of the 1h basin CSVs lives in
+:func:`hourly_store_dir` of the torchhydro cache folder.
+"""
+
+import os
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from hydroneimenggu.timeseries import TIME_COL
+
+BASE_TIME_UNIT = "1h"
+# fluxes in mm per time step are summed over a period, the other variables
+# (temperature, soil moisture, ...) are averaged
+SUM_VARIABLES = ("streamflow", "total_precipitation_hourly")
+# start of the first period of a day, as the time labels of the stored series;
+# the 3h data and the 3h experiment periods are labelled 01:00, 04:00, ...
+LABEL_OFFSETS = {pd.Timedelta("3h"): pd.Timedelta("1h")}
+
+
+def hourly_store_dir(cache_dir):
+    """Folder of the store of the 1h basin CSVs in the torchhydro cache folder"""
+    return os.path.join(cache_dir, "basin_store", "timeseries_1h")
+
+
+def steps_per_period(time_unit, base_time_unit=BASE_TIME_UNIT):
+    """How many base time steps make one period of a time unit, e.g. 24 for 1D"""
+    ratio = pd.Timedelta(time_unit) / pd.Timedelta(base_time_unit)
+    if ratio < 1 or ratio != int(ratio):
+        raise ValueError(
+            f"{time_unit} is not a whole multiple of {base_time_unit}"
+        )
+    return int(ratio)
+
+
+def label_offset(time_unit):
+    """How long after midnight the periods of a time unit start, see LABEL_OFFSETS"""
+    return LABEL_OFFSETS.get(pd.Timedelta(time_unit), pd.Timedelta(0))
+
+
+def aggregation_methods(variables, how=None):
+    """"sum" or "mean" for each variable; how overrides the defaults"""
+    how = {} if how is None else how
+    return [
+        how.get(var, "sum" if var in SUM_VARIABLES else "mean") for var in variables
+    ]
+
+
+def aggregate_values(
+    time,
+    values,
+    time_unit,
+    methods,
+    base_time_unit=BASE_TIME_UNIT,
+    min_count=None,
+    offset=None,
+):
+    """Aggregate base-unit series to a coarser time unit
+
+    Parameters
+    ----------
+    time : pd.DatetimeIndex
+        increasing times, on the grid of base_time_unit; gaps are allowed
+    values : np.ndarray
+        shape (len(time), n_variables); NaN marks missing values
+    time_unit : str
+        the target time unit, such as "3h" or "1D"
+    methods : list
+        "sum" or "mean" for each variable, see aggregation_methods
+    base_time_unit : str, optional
+        time step of the input, by default "1h"
+    min_count : int, optional
+        least number of valid steps a period needs, otherwise it is NaN; by
+        default a sum needs all steps of the period, so partial periods at the
+        ends or around gaps do not give too small totals, and a mean needs one
+    offset : str or pd.Timedelta, optional
+        start of the first period of a day; by default label_offset(time_unit),
+        so the periods match the labels of the stored series of time_unit
+
+    Returns
+    -------
+    tuple
+        (time, values): the period start times and an array of shape
+        (n_periods, n_variables)
+    """
+    time = pd.DatetimeIndex(time)
+    values = np.asarray(values, dtype=np.float64)
+    n_steps = steps_per_period(time_unit, base_time_unit)
+    period = pd.Timedelta(time_unit)
+    if time.size == 0:
+        return pd.DatetimeIndex([], name=time.name), values.reshape(0, -1)
+    offset = label_offset(time_unit) if offset is None else pd.Timedelta(offset)
+    first = (time[0] - offset).floor(period) + offset
+    positions = np.asarray((time - first) // pd.Timedelta(base_time_unit))
+    n_periods = int(positions[-1]) // n_steps + 1
+    dense = np.full((n_periods * n_steps, values.shape[1]), np.nan)
+    dense[positions] = values
+    blocks = dense.reshape(n_periods, n_steps, values.shape[1])
+    valid = ~np.isnan(blocks)
+    count = valid.sum(axis=1)
+    total = np.where(valid, blocks, 0.0).sum(axis=1)
+    is_sum = np.array([method == "sum" for method in methods], dtype=bool)
+    result = np.where(is_sum, total, total / np.maximum(count, 1))
+    if min_count is None:
+        needed = np.where(is_sum, n_steps, 1)
+    else:
+        needed = np.full(is_sum.shape, min_count)
+    result[count < needed] = np.nan
+    labels = pd.DatetimeIndex(first + np.arange(n_periods) * period, name=time.name)
+    return labels, result
+
+
+class AggregatedBasinView(object):
+    def __init__(
+        self,
+        store,
+        time_unit,
+        how=None,
+        min_count=None,
+        base_time_unit=BASE_TIME_UNIT,
+        max_cached_basins=8,
+    ):
+        """A coarser time unit of a store, computed on the fly
+
+        Parameters
+        ----------
+        store : BasinArrayStore
+            the store of the base time unit, usually 1h
+        time_unit : str
+            the time unit served, such as "3h" or "1D"
+        how : dict, optional
+            "sum" or "mean" per variable, overriding the defaults
+        min_count : int, optional
+            see aggregate_values
+        base_time_unit : str, optional
+            time unit of the store, by default "1h"
+        max_cached_basins : int, optional
+            how many aggregated basins are kept in memory, by default 8;
+            the least recently used ones are dropped first
+        """
+        steps_per_period(time_unit, base_time_unit)
+        self.store = store
+        self.time_unit = time_unit
+        self.how = how
+        self.min_count = min_count
+        self.base_time_unit = base_time_unit
+        self.max_cached_basins = max_cached_basins
+        self._basin_cache = OrderedDict()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_basin_cache"] = OrderedDict()
+        return state
+
+    @property
+    def basins(self):
+        return self.store.basins
+
+    @property
+    def variables(self):
+        return self.store.variables
+
+    def has_basin(self, basin_id):
+        return self.store.has_basin(basin_id)
+
+    def _cached(self, key, loader):
+        if key in self._basin_cache:
+            self._basin_cache.move_to_end(key)
+            return self._basin_cache[key]
+        value = loader()
+        self._basin_cache[key] = value
+        while len(self._basin_cache) > self.max_cached_basins:
+            self._basin_cache.popitem(last=False)
+        return value
+
+    def _aggregate_basin(self, basin_id, variables):
+        time, values = self.store.basin_values(basin_id, variables)
+        return aggregate_values(
+            time,
+            values,
+            self.time_unit,
+            aggregation_methods(variables, self.how),
+            base_time_unit=self.base_time_unit,
+            min_count=self.min_count,
+        )
+
+    def basin_values(self, basin_id, variables=None, start=None, end=None):
+        """The aggregated time axis and values of one basin
+
+        Same as BasinArrayStore.basin_values, for the periods of time_unit;
+        start and end select the periods whose start time is within them.
+        """
+        variables = list(self.variables if variables is None else variables)
+        time, values = self._cached(
+            (basin_id, tuple(variables)),
+            lambda: self._aggregate_basin(basin_id, variables),
+        )
+        first = 0 if start is None else time.searchsorted(pd.Timestamp(start))
+        stop = (
+            time.size
+            if end is None
+            else time.searchsorted(pd.Timestamp(end), side="right")
+        )
+        return time[first:stop], values[first:stop]
+
+    def load_basin(self, basin_id, variables=None, start=None, end=None):
+        """One aggregated basin as a DataFrame indexed by time"""
+        variables = list(self.variables if variables is None else variables)
+        time, values = self.basin_values(basin_id, variables, start, end)
+        return pd.DataFrame(
+            np.array(values),
+            index=pd.DatetimeIndex(time, name=TIME_COL),
+            columns=variables,
+        )
+
+    def clear(self):
+        self._basin_cache.clear()
+
+
+_views = {}
+
+
+def get_basin_loader(store, time_unit, base_time_unit=BASE_TIME_UNIT, **kwargs):
+    """The loader of a time unit: the store itself or a view aggregating it
+
+    Views are shared within a process, so their cached basins are reused.
+
+    Parameters
+    ----------
+    store : BasinArrayStore
+        the store of base_time_unit
+    time_unit : str
+        the time unit wanted
+    base_time_unit : str, optional
+        time unit of the store, by default "1h"
+    **kwargs
+        other arguments of AggregatedBasinView
+
+    Returns
+    -------
+    BasinArrayStore or AggregatedBasinView
+        an object with basin_values and load_basin
+    """
+    if pd.Timedelta(time_unit) == pd.Timedelta(base_time_unit):
+        return store
+    key = (os.path.abspath(store.store_dir), time_unit, base_time_unit)
+    if key not in _views or _views[key].store is not store:
+        _views[key] = AggregatedBasinView(
+            store, time_unit, base_time_unit=base_time_unit, **kwargs
+        )
+    return _views[key]
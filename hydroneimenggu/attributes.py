@@ -0,0 +1,199 @@
+"""Basin attributes and their normalized matrices, cached on disk.
+
+Every training, test and forecast reads the HydroATLAS attributes of VAR_C and
+standardizes them with the statistics of a training run. The result only
+depends on the basins, the attributes and the statistics, so
+:class:`AttributeMatrixCache` computes the normalized (basin, attribute) matrix
+of each combination once and keeps it in a ``.npy`` file. A manifest records
+the fingerprints of the statistics file (``dapengscaler_stat.json``) and of the
+attributes file it was computed from; when either changes, the matrix is
+computed again. Processes sharing the folder merge their entries into the
+manifest under a lock file. Matrices already loaded are kept in memory for the process.
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from hydroneimenggu.common import file_fingerprint, file_lock
+from hydroneimenggu.experiments import VAR_C
+from hydroneimenggu.manifest import Manifest
+from hydroneimenggu.scaling import normalize, read_scaler_params, read_stat_dict
+
+# yearly precipitation (mm), from which the mean precipitation is derived
+MEAN_PRCP_ATTRIBUTE = "pre_mm_syr"
+MANIFEST_FILE = "manifest.json"
+
+
+def read_basin_attributes(attr_file, basin_ids=None, variables=None):
+    """The attributes of basins from torchhydro's attributes NetCDF cache
+
+    Parameters
+    ----------
+    attr_file : str
+        the attributes file, such as CACHE_DIR/<dataset>_attributes.nc
+    basin_ids : list, optional
+        the basins, by default all
+    variables : list, optional
+        by default VAR_C and MEAN_PRCP_ATTRIBUTE
+
+    Returns
+    -------
+    pd.DataFrame
+        indexed by basin id
+    """
+    variables = VAR_C + [MEAN_PRCP_ATTRIBUTE] if variables is None else variables
+    with xr.open_dataset(attr_file) as ds:
+        ds = ds[list(variables)]
+        if basin_ids is not None:
+            ds = ds.sel(basin=[str(basin) for basin in basin_ids])
+        df = ds.to_dataframe()
+    df.index = df.index.astype(str)
+    return df
+
+
+def matrix_key(basin_ids, variables, stat_file, attr_file):
+    """Name of the cached matrix of basins, attributes, statistics and source"""
+    content = json.dumps(
+        [
+            [str(basin) for basin in basin_ids],
+            list(variables),
+            os.path.abspath(stat_file),
+            os.path.abspath(attr_file),
+        ]
+    )
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()[:16]
+
+
+class AttributeMatrixCache(object):
+    def __init__(self, cache_dir, attr_file):
+        """Normalized attribute matrices of one attributes file
+
+        Parameters
+        ----------
+        cache_dir : str
+            folder of the cached matrices and of their manifest
+        attr_file : str
+            the attributes file, see read_basin_attributes
+        """
+        self.cache_dir = cache_dir
+        self.attr_file = attr_file
+        self.manifest = Manifest(os.path.join(cache_dir, MANIFEST_FILE))
+        self._matrices = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_matrices"] = {}
+        return state
+
+    def _inputs(self, stat_file):
+        return {
+            "stat_file": file_fingerprint(stat_file),
+            "attr_file": file_fingerprint(self.attr_file),
+        }
+
+    def _compute(self, basin_ids, variables, stat_file):
+        stat_dict = read_stat_dict(stat_file)
+        scaler_params = read_scaler_params(os.path.dirname(stat_file))
+        attributes = read_basin_attributes(self.attr_file, basin_ids, variables)
+        return np.stack(
+            [
+                normalize(
+                    attributes[var].to_numpy(),
+                    var,
+                    stat_dict,
+                    scaler_params=scaler_params,
+                )
+                for var in variables
+            ],
+            axis=1,
+        ).astype(np.float32)
+
+    def _save(self, key, values, entry):
+        matrix_file = os.path.join(self.cache_dir, f"{key}.npy")
+        tmp_file = f"{matrix_file}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(tmp_file, "wb") as fp:
+                np.save(fp, values)
+            os.replace(tmp_file, matrix_file)
+            manifest_file = os.path.join(self.cache_dir, MANIFEST_FILE)
+            with file_lock(f"{manifest_file}.lock"):
+                # merge with the entries other processes saved since we read it
+                self.manifest = Manifest(manifest_file)
+                self.manifest.set(key, entry)
+                self.manifest.save()
+        except OSError as e:
+            # the cache is only an accelerator, a read-only folder is fine
+            print(f"Could not cache the attribute matrix {matrix_file}: {e}")
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+
+    def matrix(self, basin_ids, stat_file, variables=VAR_C):
+        """The normalized attributes of basins
+
+        Parameters
+        ----------
+        basin_ids : list
+            the basins
+        stat_file : str
+            the scaler statistics of a training run, dapengscaler_stat.json
+        variables : list, optional
+            the attributes, by default VAR_C
+
+        Returns
+        -------
+        pd.DataFrame
+            indexed by basin id, one column per attribute; NaN where an
+            attribute is missing
+        """
+        basin_ids = [str(basin) for basin in basin_ids]
+        variables = list(variables)
+        key = matrix_key(basin_ids, variables, stat_file, self.attr_file)
+        inputs = self._inputs(stat_file)
+        cached = self._matrices.get(key)
+        if cached is not None and cached[0] == inputs:
+            values = cached[1]
+        else:
+            matrix_file = os.path.join(self.cache_dir, f"{key}.npy")
+            if not self.manifest.is_fresh(key, inputs):
+                # the matrix may have been saved by another process
+                self.manifest = Manifest(os.path.join(self.cache_dir, MANIFEST_FILE))
+            if self.manifest.is_fresh(key, inputs) and os.path.exists(matrix_file):
+                values = np.load(matrix_file)
+            else:
+                values = self._compute(basin_ids, variables, stat_file)
+                self._save(
+                    key,
+                    values,
+                    {
+                        "inputs": inputs,
+                        "stat_file": os.path.abspath(stat_file),
+                        "variables": variables,
+                        "n_basins": len(basin_ids),
+                    },
+                )
+            # shared by all the callers
+            values.setflags(write=False)
+            self._matrices[key] = (inputs, values)
+        return pd.DataFrame(
+            values, index=pd.Index(basin_ids, name="basin"), columns=variables
+        )
+
+    def clear(self):
+        self._matrices.clear()
+
+
+_attribute_caches = {}
+
+
+def get_attribute_cache(cache_dir, attr_file):
+    """The AttributeMatrixCache of a folder and attributes file, shared in a process"""
+    key = (os.path.abspath(cache_dir), os.path.abspath(attr_file))
+    if key not in _attribute_caches:
+        _attribute_caches[key] = AttributeMatrixCache(cache_dir, attr_file)
+    return _attribute_caches[key]
@@ -0,0 +1,370 @@
+"""One memory-mapped basin x time x variable array per time unit.
+
+The data of a time unit is spread over the per-basin CSVs of
+DATASET_DIR/timeseries/<time unit> and the torchhydro cache NetCDF files whose
+name contains the time unit. :class:`BasinArrayStore` merges all of them once
+into a single ``data.npy`` of shape (basin, time, variable), with the time axis
+shared by all basins and NaN where a source has no value. The array is opened
+memory-mapped and read-only: the (time, variable) block of a basin is
+contiguous, so slicing one basin or one event reads only those pages, and
+worker processes opening the same store share the pages of the OS cache
+instead of each loading the whole dataset.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from hydroneimenggu.cache_index import get_basin_file_index
+from hydroneimenggu.common import file_fingerprint
+from hydroneimenggu.memmap_store import MemmapStore
+from hydroneimenggu.timeseries import (
+    TIME_COL,
+    _csv_engine,
+    parse_times,
+    read_timeseries_csv,
+)
+
+DATA_FILE = "data.npy"
+TIME_FILE = "time.npy"
+
+
+def _scan_source(file_path, basin_coord):
+    """The basins, time axis and variable dtypes of a source, without its values
+
+    A NetCDF file without a time dimension, such as the attributes cache, has
+    no (basin, time) variables and is returned without basins.
+    """
+    if file_path.endswith(".csv"):
+        columns = pd.read_csv(file_path, nrows=0).columns
+        time = parse_times(
+            pd.read_csv(file_path, usecols=[TIME_COL], engine=_csv_engine())[
+                TIME_COL
+            ].to_numpy()
+        )
+        basins = [os.path.splitext(os.path.basename(file_path))[0]]
+        variables = {col: np.dtype(np.float64) for col in columns if col != TIME_COL}
+        return basins, time.to_numpy(dtype="datetime64[ns]"), variables
+    with xr.open_dataset(file_path) as ds:
+        if "time" not in ds.dims or basin_coord not in ds.dims:
+            print(f"Skipping {file_path}: no {basin_coord} and time dimensions")
+            return [], np.array([], dtype="datetime64[ns]"), {}
+        basins = [str(basin) for basin in ds[basin_coord].values]
+        time = ds.indexes["time"].to_numpy(dtype="datetime64[ns]")
+        variables = {
+            var: ds[var].dtype
+            for var in ds.data_vars
+            if set(ds[var].dims) == {basin_coord, "time"}
+        }
+    return basins, time, variables
+
+
+def _load_source(file_path, basin_coord, variables):
+    """Yield (variable, values) of a source, values with shape (basin, time)"""
+    if file_path.endswith(".csv"):
+        _, values = read_timeseries_csv(file_path, variables)
+        for var, var_values in zip(variables, values):
+            yield var, var_values[np.newaxis]
+        return
+    with xr.open_dataset(file_path) as ds:
+        for var in variables:
+            yield var, ds[var].transpose(basin_coord, "time").values
+
+
+def time_unit_sources(time_unit, csv_dir=None, cache_dir=None, basin_coord="basin"):
+    """The source files of a time unit, in the order they are merged
+
+    Parameters
+    ----------
+    time_unit : str
+        such as "1h", "3h" or "1D"
+    csv_dir : str, optional
+        folder with the basin CSVs of the time unit, e.g.
+        DATASET_DIR/timeseries/1h
+    cache_dir : str, optional
+        the torchhydro cache directory; its NetCDF files whose name contains
+        time_unit are used
+    basin_coord : str, optional
+        name of the basin coordinate, by default "basin"
+
+    Returns
+    -------
+    list
+        paths of the CSVs (sorted) followed by the NetCDF files (sorted)
+    """
+    sources = []
+    if csv_dir is not None and os.path.isdir(csv_dir):
+        sources += [
+            os.path.join(csv_dir, file_name)
+            for file_name in sorted(os.listdir(csv_dir))
+            if file_name.endswith(".csv")
+        ]
+    if cache_dir is not None:
+        index = get_basin_file_index(cache_dir, basin_coord=basin_coord)
+        sources += [
+            os.path.join(cache_dir, file_name)
+            for file_name in sorted(index.files)
+            if time_unit in file_name and index.files[file_name]["basins"]
+        ]
+    return sources
+
+
+class BasinArrayStore(MemmapStore):
+    def __init__(
+        self,
+        store_dir,
+        sources=None,
+        basin_coord="basin",
+        dtype=None,
+        refresh=True,
+    ):
+        """Memory-mapped (basin, time, variable) array of one time unit
+
+        Parameters
+        ----------
+        store_dir : str
+            folder of the store, with ``data.npy``, ``time.npy`` and a manifest
+        sources : list, optional
+            CSV and NetCDF files the store is built from, see time_unit_sources;
+            a value present in several sources is taken from the first one, as
+            BasinFileIndex.find picks the first file of a basin. None opens an
+            existing store as it is, as worker processes do
+        basin_coord : str, optional
+            name of the basin coordinate of the NetCDF files, by default "basin"
+        dtype : optional
+            dtype of the stored values; by default the widest float dtype of
+            the source variables, so values are stored exactly
+        refresh : bool, optional
+            rebuild a stale store right away, by default True
+        """
+        super(BasinArrayStore, self).__init__(store_dir)
+        self.sources = None if sources is None else list(sources)
+        self.basin_coord = basin_coord
+        self.dtype = None if dtype is None else np.dtype(dtype)
+        self._data = None
+        self._time = None
+        self._rows = None
+        if refresh and self.sources is not None:
+            self.refresh()
+
+    def __getstate__(self):
+        # the memory map is reopened by the copy in the other process
+        state = self.__dict__.copy()
+        state["_data"] = None
+        state["_time"] = None
+        state["_rows"] = None
+        return state
+
+    def source_fingerprints(self):
+        return {
+            os.path.abspath(source): file_fingerprint(source)
+            for source in self.sources
+        }
+
+    def is_fresh(self):
+        """Whether the store was built from the current sources"""
+        return super(BasinArrayStore, self).is_fresh() and (
+            self.dtype is None or self._entry["dtype"] == self.dtype.str
+        )
+
+    def _write(self, tmp_dir, inputs, previous):
+        # first pass: basins, variables and time axes
+        scans = [_scan_source(source, self.basin_coord) for source in self.sources]
+        basins, variables = [], []
+        dtype = np.dtype(np.float32)
+        for source_basins, _, source_variables in scans:
+            basins += [basin for basin in source_basins if basin not in basins]
+            variables += [var for var in source_variables if var not in variables]
+            dtype = np.result_type(dtype, *source_variables.values())
+        dtype = dtype if self.dtype is None else self.dtype
+        time = np.unique(
+            np.concatenate(
+                [np.array([], dtype="datetime64[ns]")] + [scan[1] for scan in scans]
+            )
+        )
+        np.save(os.path.join(tmp_dir, TIME_FILE), time)
+        data = np.lib.format.open_memmap(
+            os.path.join(tmp_dir, DATA_FILE),
+            mode="w+",
+            dtype=dtype,
+            shape=(len(basins), time.size, len(variables)),
+        )
+        data[:] = np.nan
+        # second pass: the values, one source and variable at a time; the
+        # sources are written last to first, so that the first one wins
+        rows = {basin: row for row, basin in enumerate(basins)}
+        columns = {var: column for column, var in enumerate(variables)}
+        ranges = {}
+        for source, (source_basins, source_time, source_variables) in reversed(
+            list(zip(self.sources, scans))
+        ):
+            positions = np.searchsorted(time, source_time)
+            source_rows = [rows[basin] for basin in source_basins]
+            for var, values in _load_source(
+                source, self.basin_coord, list(source_variables)
+            ):
+                for row, basin_values in zip(source_rows, values):
+                    data[row, positions, columns[var]] = basin_values
+            if positions.size:
+                for basin in source_basins:
+                    start, stop = ranges.get(basin, [time.size, 0])
+                    ranges[basin] = [
+                        min(start, int(positions.min())),
+                        max(stop, int(positions.max()) + 1),
+                    ]
+        data.flush()
+        del data
+        return {
+            "basins": basins,
+            "variables": variables,
+            "ranges": {basin: ranges.get(basin, [0, 0]) for basin in basins},
+            "dtype": dtype.str,
+        }
+
+    @property
+    def basins(self):
+        return self._entry["basins"]
+
+    @property
+    def variables(self):
+        return self._entry["variables"]
+
+    @property
+    def time(self):
+        """The time axis shared by all basins"""
+        if self._time is None:
+            self._time = pd.DatetimeIndex(
+                np.load(os.path.join(self.store_dir, TIME_FILE))
+            )
+        return self._time
+
+    @property
+    def time_step(self):
+        """The smallest step of the time axis, such as 1h; None for one time"""
+        if self.time.size < 2:
+            return None
+        return pd.Timedelta(np.diff(self.time.values).min())
+
+    @property
+    def data(self):
+        """The read-only memory-mapped (basin, time, variable) array"""
+        if self._data is None:
+            self._data = np.load(
+                os.path.join(self.store_dir, DATA_FILE), mmap_mode="r"
+            )
+        return self._data
+
+    def has_basin(self, basin_id):
+        return basin_id in self._basin_rows()
+
+    def _basin_rows(self):
+        if self._rows is None:
+            self._rows = {basin: row for row, basin in enumerate(self.basins)}
+        return self._rows
+
+    def _columns(self, variables):
+        if variables is None:
+            return slice(None), list(self.variables)
+        variables = list(variables)
+        return [self.variables.index(var) for var in variables], variables
+
+    def _time_slice(self, basin_id, start=None, end=None):
+        """Positions of a basin's time range, optionally cut to [start, end]"""
+        first, stop = self._entry["ranges"][basin_id]
+        if start is not None:
+            first = max(first, int(self.time.searchsorted(pd.Timestamp(start))))
+        if end is not None:
+            stop = min(
+                stop, int(self.time.searchsorted(pd.Timestamp(end), side="right"))
+            )
+        return slice(first, max(first, stop))
+
+    def basin_values(self, basin_id, variables=None, start=None, end=None):
+        """The time axis and values of one basin, without reading other basins
+
+        Parameters
+        ----------
+        basin_id : str
+            the basin id
+        variables : list, optional
+            the variables, all by default
+        start, end : optional
+            inclusive time bounds; by default the range covered by the sources
+            of the basin
+
+        Returns
+        -------
+        tuple
+            (time, values): time is a pd.DatetimeIndex and values a read-only
+            array of shape (n_time, len(variables)); for all variables it is a
+            view of the memory map, so only the pages that are used are read
+        """
+        row = self._basin_rows()[basin_id]
+        columns, _ = self._columns(variables)
+        time_slice = self._time_slice(basin_id, start, end)
+        return self.time[time_slice], self.data[row, time_slice][:, columns]
+
+    def load_basin(self, basin_id, variables=None, start=None, end=None):
+        """One basin as a DataFrame indexed by time, see basin_values"""
+        columns, variables = self._columns(variables)
+        time, values = self.basin_values(basin_id, None, start, end)
+        return pd.DataFrame(
+            np.array(values[:, columns]),
+            index=pd.DatetimeIndex(time, name=TIME_COL),
+            columns=variables,
+        )
+
+    def to_dataset(self):
+        """The whole store as an xr.Dataset whose variables view the memory map
+
+        Selecting a basin and loading it reads only the pages of that basin.
+        """
+        return xr.Dataset(
+            {
+                var: ((self.basin_coord, "time"), self.data[:, :, column])
+                for column, var in enumerate(self.variables)
+            },
+            coords={self.basin_coord: self.basins, "time": self.time},
+        )
+
+    def close(self):
+        self._data = None
+        self._time = None
+        self._rows = None
+
+
+def is_basin_store(path):
+    """Whether a path is the folder of a BasinArrayStore"""
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, DATA_FILE))
+
+
+_basin_stores = {}
+
+
+def get_basin_store(store_dir, sources=None, **kwargs):
+    """The BasinArrayStore of a folder, shared within a process
+
+    Parameters
+    ----------
+    store_dir : str
+        folder of the store
+    sources : list, optional
+        when given, the store is refreshed from them on every call
+    **kwargs
+        other arguments of BasinArrayStore
+
+    Returns
+    -------
+    BasinArrayStore
+        the store
+    """
+    key = os.path.abspath(store_dir)
+    if key not in _basin_stores:
+        _basin_stores[key] = BasinArrayStore(store_dir, sources, **kwargs)
+    elif sources is not None:
+        store = _basin_stores[key]
+        store.sources = list(sources)
+        store.refresh()
+    return _basin_stores[key]
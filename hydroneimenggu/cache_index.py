@@ -0,0 +1,186 @@
+"""Persistent basin -> NetCDF file index for the torchhydro cache directory.
+
+The analysis scripts used to open every ``.nc`` file in ``CACHE_DIR`` for every
+basin just to find the one containing it. This module scans each file once,
+reading only its ``basin`` coordinate, and keeps the result in a JSON file next
+to the cache files. An entry is rescanned only when the file's mtime or size
+changes.
+"""
+
+import json
+import os
+
+import xarray as xr
+
+from hydroneimenggu.common import file_fingerprint
+
+INDEX_FILE_NAME = "basin_nc_index.json"
+INDEX_VERSION = 1
+
+
+class BasinFileIndex(object):
+    def __init__(self, cache_dir, basin_coord="basin", index_file=None):
+        """Index of which cache NetCDF file holds which basins
+
+        Parameters
+        ----------
+        cache_dir : str
+            directory with the torchhydro cache NetCDF files
+        basin_coord : str, optional
+            name of the basin coordinate, by default "basin"
+        index_file : str, optional
+            where the index is persisted, by default ``cache_dir/basin_nc_index.json``
+        """
+        self.cache_dir = cache_dir
+        self.basin_coord = basin_coord
+        self.index_file = (
+            index_file
+            if index_file is not None
+            else os.path.join(cache_dir, INDEX_FILE_NAME)
+        )
+        self.files = {}
+        self._basin_to_files = {}
+        self._load()
+        self.refresh()
+
+    def _load(self):
+        if not os.path.exists(self.index_file):
+            return
+        try:
+            with open(self.index_file, "r") as fp:
+                content = json.load(fp)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable basin index {self.index_file}: {e}")
+            return
+        if (
+            content.get("version") == INDEX_VERSION
+            and content.get("basin_coord") == self.basin_coord
+        ):
+            self.files = content.get("files", {})
+
+    def _save(self):
+        tmp_file = f"{self.index_file}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_file, "w") as fp:
+                json.dump(
+                    {
+                        "version": INDEX_VERSION,
+                        "basin_coord": self.basin_coord,
+                        "files": self.files,
+                    },
+                    fp,
+                )
+            os.replace(tmp_file, self.index_file)
+        except OSError as e:
+            # the index is only an accelerator, a read-only cache dir is fine
+            print(f"Could not write basin index {self.index_file}: {e}")
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+
+    def _scan_file(self, file_path):
+        """Read only the basin coordinate of one NetCDF file"""
+        with xr.open_dataset(file_path, decode_times=False) as ds:
+            if self.basin_coord not in ds.variables:
+                return []
+            return [str(basin) for basin in ds[self.basin_coord].values]
+
+    def refresh(self):
+        """Rescan new or modified files and forget deleted ones
+
+        Returns
+        -------
+        bool
+            True if the index changed
+        """
+        changed = False
+        nc_files = sorted(
+            file_name
+            for file_name in os.listdir(self.cache_dir)
+            if file_name.endswith(".nc")
+        )
+        for file_name in set(self.files) - set(nc_files):
+            del self.files[file_name]
+            changed = True
+        for file_name in nc_files:
+            file_path = os.path.join(self.cache_dir, file_name)
+            fingerprint = file_fingerprint(file_path)
+            if fingerprint is None:
+                # deleted since the listing: forget it like the other deleted files
+                if self.files.pop(file_name, None) is not None:
+                    changed = True
+                continue
+            entry = self.files.get(file_name)
+            if entry is not None and entry["fingerprint"] == fingerprint:
+                continue
+            try:
+                basins = self._scan_file(file_path)
+            except Exception as e:
+                # no entry, so the file is scanned again on the next refresh
+                # instead of hiding its basins until it is modified
+                print(f"Error reading {file_name}: {e}")
+                if self.files.pop(file_name, None) is not None:
+                    changed = True
+                continue
+            self.files[file_name] = {"fingerprint": fingerprint, "basins": basins}
+            changed = True
+        self._rebuild_lookup()
+        if changed:
+            self._save()
+        return changed
+
+    def _rebuild_lookup(self):
+        self._basin_to_files = {}
+        for file_name in sorted(self.files):
+            for basin in self.files[file_name]["basins"]:
+                self._basin_to_files.setdefault(basin, []).append(file_name)
+
+    def find(self, basin_id, time_unit=None):
+        """Find the cache file holding a basin
+
+        Parameters
+        ----------
+        basin_id : str
+            the basin id
+        time_unit : str, optional
+            only consider files whose name contains it, such as "1D" or "3h"
+
+        Returns
+        -------
+        str
+            full path of the first matching file; None if no file has the basin
+        """
+        for file_name in self._basin_to_files.get(basin_id, []):
+            if time_unit is None or time_unit in file_name:
+                return os.path.join(self.cache_dir, file_name)
+        return None
+
+
+_INDEXES = {}
+
+
+def get_basin_file_index(cache_dir, basin_coord="basin"):
+    """Return the per-process index of a cache directory, building it on first use"""
+    key = (os.path.abspath(cache_dir), basin_coord)
+    if key not in _INDEXES:
+        _INDEXES[key] = BasinFileIndex(cache_dir, basin_coord=basin_coord)
+    return _INDEXES[key]
+
+
+def find_basin_nc_file(target_basin_id, time_unit, cache_dir):
+    """Find the cache NetCDF file with a basin for a time unit
+
+    Parameters
+    ----------
+    target_basin_id : str
+        the basin id
+    time_unit : str
+        time unit in the file name, such as "1D" or "3h"
+    cache_dir : str
+        the torchhydro cache directory
+
+    Returns
+    -------
+    str
+        path of the file; None if no file has the basin
+    """
+    return get_basin_file_index(cache_dir).find(target_basin_id, time_unit)
@@ -1,7 +1,114 @@
 """The common module contains common functions and classes used by the other modules.
 """
 
+import contextlib
+import os
+import time
+import tracemalloc
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
 def hello_world():
     """Prints "Hello World!" to the console.
     """
-    print("Hello World!")
\ No newline at end of file
+    print("Hello World!")
+
+
+def file_fingerprint(file_path):
+    """Cheap fingerprint of a file used to decide whether derived data is stale.
+
+    Parameters
+    ----------
+    file_path : str
+        path of the file
+
+    Returns
+    -------
+    dict
+        {"mtime_ns": ..., "size": ...}; None if the file does not exist
+    """
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+
+@contextlib.contextmanager
+def trace_peak_memory(enabled=True):
+    """Measure the peak memory allocated by Python and NumPy inside a block
+
+    Parameters
+    ----------
+    enabled : bool, optional
+        when False nothing is traced and the result stays empty, by default True
+
+    Yields
+    ------
+    dict
+        filled on exit with "peak_mb" (peak traced memory in MB, relative to the
+        start of the block) and "seconds"
+    """
+    usage = {}
+    if not enabled:
+        yield usage
+        return
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    start_size, _ = tracemalloc.get_traced_memory()
+    if was_tracing and hasattr(tracemalloc, "reset_peak"):
+        # Python 3.9+; a fresh trace starts with no peak anyway
+        tracemalloc.reset_peak()
+    begin = time.perf_counter()
+    try:
+        yield usage
+    finally:
+        _, peak = tracemalloc.get_traced_memory()
+        usage["peak_mb"] = (peak - start_size) / 2**20
+        usage["seconds"] = time.perf_counter() - begin
+        if not was_tracing:
+            tracemalloc.stop()
+
+
+@contextlib.contextmanager
+def file_lock(lock_file):
+    """Hold an exclusive lock on a file while a block runs
+
+    Processes entering a block with the same lock file run it one at a time;
+    the others wait. The operating system releases the lock when its process
+    dies, so a crashed run never leaves a stale lock behind.
+
+    Parameters
+    ----------
+    lock_file : str
+        path of the lock file, created if missing
+    """
+    folder = os.path.dirname(lock_file)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    with open(lock_file, "a+") as fp:
+        if fcntl is not None:
+            fcntl.flock(fp.fileno(), fcntl.LOCK_EX)
+        else:
+            fp.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(fp.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK gives up after about 10 seconds, keep waiting
+                    pass
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fp.fileno(), fcntl.LOCK_UN)
+            else:
+                fp.seek(0)
+                msvcrt.locking(fp.fileno(), msvcrt.LK_UNLCK, 1)
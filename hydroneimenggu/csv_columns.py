@@ -0,0 +1,137 @@
+"""Renaming and dropping columns of the basin time series CSV files.
+
+``scripts/timeseries_columns_trans.py`` applies rename and drop rules to every
+CSV of a folder. A file whose header needs no change is not touched at all.
+Otherwise only the kept columns are read, as strings, so the values are written
+back exactly as they were, and the result replaces the file only when it is
+complete.
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+SUMMARY_COLUMNS = ["file", "status", "dropped", "renamed", "error"]
+
+
+def plan_columns(columns, rename, drop):
+    """The columns to keep and their new names
+
+    Parameters
+    ----------
+    columns : list
+        the header of a file
+    rename : dict
+        old name -> new name
+    drop : collection
+        names of the columns to drop
+
+    Returns
+    -------
+    tuple
+        (kept columns, their new names); both equal columns when the header
+        needs no change
+    """
+    keep = [col for col in columns if col not in drop]
+    return keep, [rename.get(col, col) for col in keep]
+
+
+def transform_csv(file_path, rename, drop):
+    """Rename and drop the columns of one CSV file
+
+    The result is written to a temporary file next to it, which then replaces
+    the file, so a failure or an interruption leaves the original intact.
+
+    Parameters
+    ----------
+    file_path : str
+        the CSV file
+    rename : dict
+        old name -> new name
+    drop : collection
+        names of the columns to drop
+
+    Returns
+    -------
+    dict
+        the file name, its status ("unchanged", "changed" or "failed"), the
+        dropped and renamed columns and the error, see SUMMARY_COLUMNS
+    """
+    summary = {
+        "file": os.path.basename(file_path),
+        "status": "unchanged",
+        "dropped": "",
+        "renamed": "",
+        "error": "",
+    }
+    tmp_file = f"{file_path}.{os.getpid()}.tmp"
+    try:
+        columns = list(pd.read_csv(file_path, nrows=0).columns)
+        keep, new_columns = plan_columns(columns, rename, drop)
+        if keep == columns and new_columns == columns:
+            return summary
+        df = pd.read_csv(
+            file_path, usecols=keep, dtype=str, keep_default_na=False
+        )[keep]
+        df.columns = new_columns
+        df.to_csv(tmp_file, index=False)
+        os.replace(tmp_file, file_path)
+        summary["status"] = "changed"
+        summary["dropped"] = ";".join(col for col in columns if col not in keep)
+        summary["renamed"] = ";".join(
+            f"{old}->{new}" for old, new in zip(keep, new_columns) if old != new
+        )
+    except Exception as e:
+        print(f"Could not transform {file_path}: {e}")
+        summary["status"] = "failed"
+        summary["error"] = f"{type(e).__name__}: {e}"
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+    return summary
+
+
+def transform_folder(folder_path, rename, drop, workers=1):
+    """Rename and drop the columns of all CSV files of a folder
+
+    Parameters
+    ----------
+    folder_path : str
+        the folder
+    rename, drop
+        see transform_csv
+    workers : int, optional
+        number of processes; by default 1, one file after the other
+
+    Returns
+    -------
+    pd.DataFrame
+        one row per file, see transform_csv
+    """
+    file_paths = [
+        os.path.join(folder_path, filename)
+        for filename in sorted(os.listdir(folder_path))
+        if filename.endswith(".csv")
+    ]
+    begin = time.perf_counter()
+    if workers > 1 and len(file_paths) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            summaries = list(
+                executor.map(
+                    transform_csv,
+                    file_paths,
+                    [rename] * len(file_paths),
+                    [drop] * len(file_paths),
+                )
+            )
+    else:
+        summaries = [transform_csv(file_path, rename, drop) for file_path in file_paths]
+    summary_df = pd.DataFrame(summaries, columns=SUMMARY_COLUMNS)
+    counts = summary_df["status"].value_counts()
+    print(
+        f"{len(summary_df)} files: {counts.get('changed', 0)} changed, "
+        f"{counts.get('unchanged', 0)} unchanged, {counts.get('failed', 0)} failed, "
+        f"in {time.perf_counter() - begin:.1f}s"
+    )
+    return summary_df
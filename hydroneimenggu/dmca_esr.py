@@ -0,0 +1,610 @@
+"""Vectorized DMCA-ESR rainfall-runoff event separation.
+
+The DMCA-ESR method (https://doi.org/10.1029/2021WR031283) as used in
+``notebook/get_events.ipynb``, with the per-event loops of the steps 4 to 11
+replaced by array operations. Every ``while`` walk of the original code over the
+rain or fluctuation series ("move the end of the event left while it rains") is
+answered for all events at once from a prefix maximum / suffix minimum of the
+positions where the walk stops, and the event volumes are segment sums over the
+whole series. The events found are the same as those of the loop version; the
+volumes agree up to the rounding of the sums.
+
+Differently from the notebook, the steps 6 to 11 work on integer positions on
+the time axis instead of times, so no ``np.where(time == t)`` lookups are
+needed; :func:`rainfall_runoff_event_identify` converts them to times at the end.
+"""
+
+import numpy as np
+import pandas as pd
+
+EPS = np.finfo(np.float64).eps
+
+
+def movmean(X, n):
+    ones = np.ones(X.shape)
+    kernel = np.ones(n)
+    return np.convolve(X, kernel, mode="same") / np.convolve(ones, kernel, mode="same")
+
+
+def window_fluctuations(x_int, half_widths, begin, end):
+    """Fluctuations of a series around its moving means for several windows
+
+    ``x_int[i] - movmean(x_int, 2 * h + 1)[i]`` for the positions ``begin`` to
+    ``end`` and every half width ``h``. All moving means come from one
+    cumulative sum over the positions the windows cover. The series is shifted
+    to start at zero there, which keeps the cumulative sum small and its
+    rounding error at the level of the direct convolution.
+
+    Parameters
+    ----------
+    x_int : np.ndarray
+        the (accumulated) series
+    half_widths : np.ndarray
+        half widths of the odd windows, window = 2 * h + 1
+    begin : int
+        first position
+    end : int
+        position after the last one
+
+    Returns
+    -------
+    np.ndarray
+        shape (len(half_widths), end - begin)
+    """
+    half_widths = np.asarray(half_widths)[:, np.newaxis]
+    lo = max(begin - int(half_widths.max()), 0)
+    hi = min(end + int(half_widths.max()) + 1, x_int.size)
+    anchor = x_int[lo]
+    csum = np.concatenate(([0.0], np.cumsum(x_int[lo:hi] - anchor)))
+    positions = np.arange(begin, end)
+    # windows are cut at the ends of the series, as movmean does
+    left = np.maximum(positions - half_widths, 0)
+    right = np.minimum(positions + half_widths + 1, x_int.size)
+    means = (csum[right - lo] - csum[left - lo]) / (right - left)
+    return (x_int[begin:end] - anchor) - means
+
+
+def step1_step2_tr_and_fluctuations_timeseries(
+    rain, flow, rain_min, max_window, block_size=256
+):
+    """Catchment response time and the rainfall and streamflow fluctuations
+
+    The fluctuations of all windows are computed block by block along time from
+    cumulative sums (see :func:`window_fluctuations`), so the cost is O(N) per
+    window and the memory is O(block_size) per window; only the fluctuations of
+    the chosen window are kept for the whole series.
+
+    Parameters
+    ----------
+    rain : np.ndarray
+        unit is mm/h
+    flow : np.ndarray
+        unit is mm/h
+    rain_min : float
+        minimum rainfall threshold
+    max_window : int
+        maximum window size, which limits the length of the events
+    block_size : int, optional
+        number of time steps computed at once for all windows, by default 256
+
+    Returns
+    -------
+    tuple
+        (Tr, fluct_rain_Tr, fluct_flow_Tr, fluct_bivariate_Tr)
+    """
+    rain_int = np.nancumsum(rain)
+    flow_int = np.nancumsum(flow)
+    T = rain.size
+    # windows 3, 5, ..., max_window
+    half_widths = np.arange(1, (max_window - 1) // 2 + 1)
+    F_rain = np.zeros(half_widths.size)
+    F_flow = np.zeros(half_widths.size)
+    F_rain_flow = np.zeros(half_widths.size)
+    for begin in range(0, T, block_size):
+        end = min(begin + block_size, T)
+        fluct_rain = window_fluctuations(rain_int, half_widths, begin, end)
+        fluct_flow = window_fluctuations(flow_int, half_widths, begin, end)
+        # the variances of a window use the positions h + 1 to T - h
+        positions = np.arange(begin, end)
+        inside = (positions >= half_widths[:, np.newaxis] + 1) & (
+            positions < T - half_widths[:, np.newaxis]
+        )
+        F_rain += np.sum(fluct_rain**2, axis=1, where=inside)
+        F_flow += np.sum(fluct_flow**2, axis=1, where=inside)
+        F_rain_flow += np.sum(fluct_rain * fluct_flow, axis=1, where=inside)
+    n_samples = T - (2 * half_widths + 1) + 1
+    # a series without fluctuations (no rain, or constant) gives a NaN rho
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rho = (F_rain_flow / n_samples) / (
+            np.sqrt(F_rain / n_samples) * np.sqrt(F_flow / n_samples)
+        )
+    pos_min = np.argmin(rho)
+    Tr = pos_min + 1
+    fluct_rain_Tr = np.empty(T)
+    fluct_flow_Tr = np.empty(T)
+    for begin in range(0, T, block_size):
+        end = min(begin + block_size, T)
+        fluct_rain_Tr[begin:end] = window_fluctuations(rain_int, [Tr], begin, end)
+        fluct_flow_Tr[begin:end] = window_fluctuations(flow_int, [Tr], begin, end)
+    tol_fluct_rain = (rain_min / (2 * Tr + 1)) * Tr
+    tol_fluct_flow = flow_int[-1] / 1e15
+    fluct_rain_Tr[np.fabs(fluct_rain_Tr) < tol_fluct_rain] = 0
+    fluct_flow_Tr[np.fabs(fluct_flow_Tr) < tol_fluct_flow] = 0
+    fluct_bivariate_Tr = fluct_rain_Tr * fluct_flow_Tr
+    fluct_bivariate_Tr[np.fabs(fluct_bivariate_Tr) < EPS] = 0
+    return Tr, fluct_rain_Tr, fluct_flow_Tr, fluct_bivariate_Tr
+
+
+def step3_core_identification(fluct_bivariate_Tr):
+    """Positions of the first and last time steps of the event cores"""
+    d = np.diff(fluct_bivariate_Tr, prepend=[0], append=[0])
+    d[np.fabs(d) < EPS] = 0
+    d = np.logical_not(d)
+    d0 = np.logical_not(np.convolve(d, [1, 1], "valid"))
+    valid = np.logical_or(fluct_bivariate_Tr, d0)
+    d_ = np.diff(valid, prepend=[0], append=[0])
+    beginning_core = np.flatnonzero(d_ == 1)
+    end_core = np.flatnonzero(d_ == -1) - 1
+    return beginning_core, end_core
+
+
+def _walk_left(start, stop, cont):
+    """Vectorized ``k = start; while k > stop and cont[k]: k -= 1``
+
+    Parameters
+    ----------
+    start : np.ndarray
+        start positions of the walks
+    stop : np.ndarray or int
+        the walks never go below these positions
+    cont : np.ndarray
+        boolean series, the walks continue while it is True
+
+    Returns
+    -------
+    np.ndarray
+        the positions where the walks end
+    """
+    positions = np.arange(cont.size)
+    # the last position at or before every index where a walk would stop
+    last_stop = np.maximum.accumulate(np.where(cont, -1, positions))
+    moved = np.maximum(last_stop[np.clip(start, 0, cont.size - 1)], stop)
+    return np.where(start > stop, moved, start)
+
+
+def _walk_right(start, stop, cont):
+    """Vectorized ``k = start; while k < stop and cont[k]: k += 1``"""
+    positions = np.arange(cont.size)
+    # the first position at or after every index where a walk would stop
+    next_stop = np.minimum.accumulate(np.where(cont, cont.size, positions)[::-1])[
+        ::-1
+    ]
+    moved = np.minimum(next_stop[np.clip(start, 0, cont.size - 1)], stop)
+    return np.where(start < stop, moved, start)
+
+
+def _quiet_after(end_core, fluct_rain_Tr):
+    """Whether the rainfall fluctuation is zero at the two steps after each core"""
+    n = fluct_rain_Tr.size
+    zero = np.fabs(fluct_rain_Tr) < EPS
+    return (
+        (end_core + 2 < n)
+        & zero[np.minimum(end_core + 1, n - 1)]
+        & zero[np.minimum(end_core + 2, n - 1)]
+    )
+
+
+def _quiet_before(beginning_core, fluct_rain_Tr):
+    """Whether the rainfall fluctuation is zero at the two steps before each core"""
+    zero = np.fabs(fluct_rain_Tr) < EPS
+    return (
+        (beginning_core >= 2)
+        & zero[np.maximum(beginning_core - 1, 0)]
+        & zero[np.maximum(beginning_core - 2, 0)]
+    )
+
+
+def step4_end_rain_events(beginning_core, end_core, rain, fluct_rain_Tr, rain_min):
+    """Positions of the ends of the rainfall events"""
+    no_rain = np.fabs(rain) < EPS
+    raining = rain > rain_min
+    quiet_after = _quiet_after(end_core, fluct_rain_Tr)
+    case1 = quiet_after & no_rain[end_core]
+    case2 = quiet_after & ~no_rain[end_core]
+    # case 1: back to the last step with rain in the core
+    end_case1 = _walk_left(end_core, beginning_core, no_rain)
+    # case 2: forward while it rains, at most to the next core
+    bound = np.append(beginning_core[1:], rain.size)
+    end_case2 = _walk_right(end_core, bound, raining) - 1
+    # case 3: skip the rain, then the steps below rain_min
+    end_case3 = _walk_left(end_core, beginning_core - 1, raining)
+    end_case3 = _walk_left(end_case3, beginning_core - 1, rain < rain_min)
+    return np.select([case1, case2], [end_case1, end_case2], end_case3)
+
+
+def step5_beginning_rain_events(
+    beginning_core, end_rain, rain, fluct_rain_Tr, rain_min
+):
+    """Positions of the beginnings of the rainfall events"""
+    no_rain = np.fabs(rain) < EPS
+    case1 = _quiet_before(beginning_core, fluct_rain_Tr) & no_rain[beginning_core]
+    # case 1: forward to the first step with rain
+    beginning_case1 = _walk_right(beginning_core, end_rain, no_rain)
+    # case 2&3: back while it rains, at most to the end of the previous event
+    bound = np.insert(end_rain[:-1], 0, -1)
+    beginning_case23 = _walk_left(beginning_core, bound, rain > rain_min) + 1
+    return np.where(case1, beginning_case1, beginning_case23)
+
+
+def step6_checks_on_rain_events(
+    beginning_rain, end_rain, rain, rain_min, beginning_core, end_core
+):
+    """Drop the rainfall events that are cut by the series ends or reversed"""
+    # without any event core (a series without rain) there is nothing to check
+    if beginning_rain.size > 0 and beginning_rain[0] == 0:
+        beginning_rain = beginning_rain[1:]
+        end_rain = end_rain[1:]
+        beginning_core = beginning_core[1:]
+        end_core = end_core[1:]
+    if end_rain.size > 0 and end_rain[-1] == rain.size - 1:
+        beginning_rain = beginning_rain[:-2]
+        end_rain = end_rain[:-2]
+        beginning_core = beginning_core[:-2]
+        end_core = end_core[:-2]
+    error_time_reversed = beginning_rain > end_rain
+    error_wrong_delimiter = np.logical_or(
+        rain[beginning_rain - 1] > rain_min, rain[end_rain + 1] > rain_min
+    )
+    keep = ~(error_time_reversed | error_wrong_delimiter)
+    return beginning_rain[keep], end_rain[keep], beginning_core[keep], end_core[keep]
+
+
+def step7_end_flow_events(
+    end_rain_checked, beginning_core, end_core, rain, fluct_rain_Tr, fluct_flow_Tr, Tr
+):
+    """Positions of the ends of the streamflow events"""
+    quiet_after = _quiet_after(end_core, fluct_rain_Tr)
+    # case 1: skip the falling flow, then forward while the flow rises
+    bound = np.minimum(np.append(beginning_core[1:] + Tr, rain.size), rain.size)
+    end_case1 = _walk_right(end_rain_checked, bound, fluct_flow_Tr <= 0)
+    end_case1 = _walk_right(end_case1, bound, fluct_flow_Tr > 0) - 1
+    # case 2: back to the last rising step of the core
+    end_case2 = _walk_left(end_core, beginning_core - 1, fluct_flow_Tr <= 0)
+    return np.where(quiet_after, end_case1, end_case2)
+
+
+def step8_beginning_flow_events(
+    beginning_rain_checked,
+    end_rain_checked,
+    rain,
+    beginning_core,
+    fluct_rain_Tr,
+    fluct_flow_Tr,
+):
+    """Positions of the beginnings of the streamflow events"""
+    start = np.where(
+        _quiet_before(beginning_core, fluct_rain_Tr),
+        beginning_rain_checked,
+        beginning_core,
+    )
+    return _walk_right(start, end_rain_checked, fluct_flow_Tr >= 0)
+
+
+def step9_checks_on_flow_events(
+    beginning_rain_checked, end_rain_checked, beginning_flow, end_flow, fluct_flow_Tr
+):
+    """Drop the events whose streamflow event is reversed or misplaced"""
+    invalid = (
+        (end_flow <= beginning_flow)
+        | (fluct_flow_Tr[beginning_flow] > 0)
+        | (fluct_flow_Tr[end_flow] < 0)
+        | (beginning_flow < beginning_rain_checked)
+        | (end_flow < end_rain_checked)
+    )
+    keep = ~invalid
+    return (
+        beginning_rain_checked[keep],
+        end_rain_checked[keep],
+        beginning_flow[keep],
+        end_flow[keep],
+    )
+
+
+def step10_checks_on_overlapping_events(
+    beginning_rain_ungrouped,
+    end_rain_ungrouped,
+    beginning_flow_ungrouped,
+    end_flow_ungrouped,
+):
+    """Merge runs of overlapping events into one event
+
+    An event overlaps the next one when its rain or flow ends after the next one
+    begins. Every run of consecutive overlapping events is merged with the event
+    following the run. As in the loop version, the last overlap is left as it is
+    when it is a run of its own; a last run of several overlaps, on which the
+    loop version fails with an IndexError, is merged like the others.
+
+    Returns
+    -------
+    tuple
+        (beginning_rain, end_rain, beginning_flow, end_flow) as positions
+    """
+    beginning_rain = np.asarray(beginning_rain_ungrouped)
+    end_rain = np.array(end_rain_ungrouped)
+    beginning_flow = np.asarray(beginning_flow_ungrouped)
+    end_flow = np.array(end_flow_ungrouped)
+    markers = np.flatnonzero(
+        (end_rain[:-1] > beginning_rain[1:]) | (end_flow[:-1] > beginning_flow[1:])
+    )
+    keep = np.ones(beginning_rain.size, dtype=bool)
+    if markers.size > 0:
+        breaks = np.flatnonzero(np.diff(markers) != 1) + 1
+        first_pos = np.insert(breaks, 0, 0)
+        last_pos = np.append(breaks - 1, markers.size - 1)
+        grouped = first_pos < markers.size - 1
+        first = markers[first_pos[grouped]]
+        last = markers[last_pos[grouped]]
+        end_rain[first] = end_rain[last + 1]
+        end_flow[first] = end_flow[last + 1]
+        # the merged events, first + 1 to last + 1, are dropped
+        dropped = np.zeros(keep.size + 1, dtype=int)
+        np.add.at(dropped, first + 1, 1)
+        np.add.at(dropped, last + 2, -1)
+        keep = np.cumsum(dropped[:-1]) == 0
+    return beginning_rain[keep], end_rain[keep], beginning_flow[keep], end_flow[keep]
+
+
+def _segment_reduce(ufunc, values, starts, ends, empty=np.nan):
+    """``ufunc.reduce(values[starts[i]:ends[i]])`` for all segments at once
+
+    Parameters
+    ----------
+    ufunc : np.ufunc
+        such as np.add or np.maximum
+    values : np.ndarray
+        the series
+    starts : np.ndarray
+        first positions of the segments
+    ends : np.ndarray
+        positions after the last ones (exclusive)
+    empty : float, optional
+        result for empty segments, by default nan
+
+    Returns
+    -------
+    np.ndarray
+        one value per segment
+    """
+    if len(starts) == 0:
+        return np.empty(0, dtype=values.dtype)
+    # reduceat over interleaved bounds; the results at odd positions are the
+    # spans between segments and are discarded
+    bounds = np.column_stack((starts, np.maximum(ends, starts))).ravel()
+    reduced = ufunc.reduceat(np.append(values, empty), bounds)[::2]
+    return np.where(ends > starts, reduced, empty)
+
+
+def _zero_nan(values):
+    return np.where(np.isnan(values), 0.0, values)
+
+
+def baseflow_curve(beginning_flow, end_flow, flow):
+    """Baseflow as straight lines between the bounds of the streamflow events
+
+    Parameters
+    ----------
+    beginning_flow : np.ndarray
+        positions of the beginnings of the streamflow events
+    end_flow : np.ndarray
+        positions of the ends of the streamflow events
+    flow : np.ndarray
+        the streamflow series
+
+    Returns
+    -------
+    np.ndarray
+        the baseflow, never above the streamflow
+    """
+    baseflow = np.copy(flow)
+    bounds = np.column_stack((beginning_flow, end_flow)).ravel()
+    nan_count = np.concatenate(([0], np.cumsum(np.isnan(flow))))
+    # one step per segment between two bounds; each segment is filled as a slice
+    for index_beg, index_end in zip(bounds[:-1], bounds[1:]):
+        length = max(index_end + 1 - index_beg, 0)
+        n_nan = nan_count[index_end + 1] - nan_count[index_beg] if length else 0
+        if n_nan >= length * 0.9:
+            baseflow[index_beg : index_end + 1] = np.nan
+        elif index_end - index_beg == 1:
+            baseflow[index_beg] = flow[index_beg]
+            baseflow[index_end] = flow[index_end]
+        elif flow[index_beg] < flow[index_end]:
+            increment = (flow[index_end] - flow[index_beg]) / (index_end - index_beg)
+            baseflow[index_beg + 1 : index_end] = baseflow[
+                index_beg
+            ] + increment * np.arange(1, index_end - index_beg)
+        elif flow[index_beg] > flow[index_end]:
+            increment = (flow[index_beg] - flow[index_end]) / (index_end - index_beg)
+            baseflow[index_beg + 1 : index_end] = baseflow[
+                index_beg
+            ] - increment * np.arange(1, index_end - index_beg)
+    return np.where(flow < baseflow, flow, baseflow)
+
+
+def step11_event_analysis(
+    beginning_rain,
+    end_rain,
+    beginning_flow,
+    end_flow,
+    rain,
+    flow,
+    time,
+    flow_threshold,
+    multiple=1,
+    flag=0,
+    duration_max=2400,
+):
+    """Durations, volumes and runoff ratios of the events, and a last check
+
+    Parameters
+    ----------
+    beginning_rain, end_rain, beginning_flow, end_flow : np.ndarray
+        positions of the event bounds on the time axis
+    rain : np.ndarray
+        the rainfall series
+    flow : np.ndarray
+        the streamflow series
+    time : np.ndarray
+        the time axis
+    flow_threshold : float
+        events with max flow lower than it are removed; unit is mm/h
+    multiple : int
+        1 for hourly data, 24 for daily data
+    flag : int, optional
+        if flag != 1, the runoff volume is that of flow - baseflow,
+        if flag == 1, it is that of flow; by default 0
+    duration_max : int, optional
+        maximum duration of the events, unit is hour; by default 2400
+
+    Returns
+    -------
+    pd.DataFrame
+        one row per kept event, indexed by the position of the event in the input
+    """
+    duration_rain = (
+        (time[end_rain] - time[beginning_rain])
+        / np.timedelta64(1, "s")
+        / (60 * 60 * multiple)
+    )
+    duration_runoff = (
+        (time[end_flow] - time[beginning_flow])
+        / np.timedelta64(1, "s")
+        / (60 * 60 * multiple)
+    )
+    volume_rain = (
+        _segment_reduce(np.add, _zero_nan(rain), beginning_rain, end_rain, 0.0)
+        * multiple
+    )
+    if flag == 1:
+        runoff = flow
+    else:
+        runoff = flow - baseflow_curve(beginning_flow, end_flow, flow)
+    volume_runoff = (
+        _segment_reduce(np.add, _zero_nan(runoff), beginning_flow, end_flow, 0.0)
+        * multiple
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        runoff_ratio = volume_runoff / volume_rain
+    peak_flow = _segment_reduce(np.maximum, flow, beginning_flow, end_flow)
+    drop = (
+        (peak_flow < flow_threshold)
+        | (duration_rain > duration_max)
+        | (duration_runoff > duration_max)
+        | (volume_rain == 0)
+        | (volume_runoff == 0)
+        | (runoff_ratio > 1)
+    )
+    result_df = pd.DataFrame(
+        {
+            "BEGINNING_RAIN": time[beginning_rain],
+            "END_RAIN": time[end_rain],
+            "DURATION_RAIN": duration_rain,
+            "BEGINNING_FLOW": time[beginning_flow],
+            "END_FLOW": time[end_flow],
+            "DURATION_RUNOFF": duration_runoff,
+            "VOLUME_RAIN": volume_rain,
+            "VULUME_RUNOFF": volume_runoff,
+            "RUNOFF_RATIO": runoff_ratio,
+        }
+    )
+    return result_df[~drop]
+
+
+def rainfall_runoff_event_identify(
+    rain, flow, rain_min=0.001, max_window=150, multiple=24, flow_threshold=0.0001
+):
+    """Full process for identification of rainfall-runoff events
+
+    Parameters
+    ----------
+    rain : pd.Series
+        rainfall time series; its unit must match the time interval,
+        for example mm/day when the time interval is day
+    flow : pd.Series
+        streamflow time series, with the same unit requirement as rain
+    rain_min : float
+        minimum rainfall threshold; its unit is mm/h
+    max_window : int
+        maximum window size in the first two steps, as a number of time steps
+    multiple : int
+        24 for daily data, meaning convert unit from mm/day to mm/h;
+        1 for hourly data
+    flow_threshold : float
+        events with max flow lower than it will be removed; its unit is mm/h
+
+    Returns
+    -------
+    pd.DataFrame
+        one row per event, with the same columns as the notebook version
+    """
+    time = rain.index.to_numpy()
+    rain = rain.to_numpy() / multiple
+    flow = flow.to_numpy() / multiple
+    (
+        Tr,
+        fluct_rain_Tr,
+        fluct_flow_Tr,
+        fluct_bivariate_Tr,
+    ) = step1_step2_tr_and_fluctuations_timeseries(rain, flow, rain_min, max_window)
+    beginning_core, end_core = step3_core_identification(fluct_bivariate_Tr)
+    end_rain = step4_end_rain_events(
+        beginning_core, end_core, rain, fluct_rain_Tr, rain_min
+    )
+    beginning_rain = step5_beginning_rain_events(
+        beginning_core, end_rain, rain, fluct_rain_Tr, rain_min
+    )
+    (
+        beginning_rain_checked,
+        end_rain_checked,
+        beginning_core,
+        end_core,
+    ) = step6_checks_on_rain_events(
+        beginning_rain, end_rain, rain, rain_min, beginning_core, end_core
+    )
+    end_flow = step7_end_flow_events(
+        end_rain_checked,
+        beginning_core,
+        end_core,
+        rain,
+        fluct_rain_Tr,
+        fluct_flow_Tr,
+        Tr,
+    )
+    beginning_flow = step8_beginning_flow_events(
+        beginning_rain_checked,
+        end_rain_checked,
+        rain,
+        beginning_core,
+        fluct_rain_Tr,
+        fluct_flow_Tr,
+    )
+    events = step9_checks_on_flow_events(
+        beginning_rain_checked,
+        end_rain_checked,
+        beginning_flow,
+        end_flow,
+        fluct_flow_Tr,
+    )
+    beginning_rain, end_rain, beginning_flow, end_flow = (
+        step10_checks_on_overlapping_events(*events)
+    )
+    return step11_event_analysis(
+        beginning_rain,
+        end_rain,
+        beginning_flow,
+        end_flow,
+        rain,
+        flow,
+        time,
+        flow_threshold,
+        multiple=multiple,
+    )
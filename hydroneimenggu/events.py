@@ -0,0 +1,97 @@
+"""Loading rainfall-runoff event tables written by the event splitting.
+
+An events CSV has one row per event with the columns ``BASIN``,
+``BEGINNING_RAIN`` and ``END_RAIN``. The times are parsed once, in a single
+vectorized call, and the parsed table is cached per file (keyed on its path,
+mtime and size), so the metrics and plotting scripts never re-parse event
+times per event.
+"""
+
+import functools
+import os
+
+import numpy as np
+import pandas as pd
+
+from hydroneimenggu.common import file_fingerprint
+
+EVENT_COLUMNS = ["BASIN", "BEGINNING_RAIN", "END_RAIN"]
+
+
+@functools.lru_cache(maxsize=256)
+def _read_events_table(csv_file_path, mtime_ns, size):
+    events = pd.read_csv(csv_file_path, usecols=EVENT_COLUMNS, dtype={"BASIN": str})
+    events["BEGINNING_RAIN"] = pd.to_datetime(events["BEGINNING_RAIN"])
+    events["END_RAIN"] = pd.to_datetime(events["END_RAIN"])
+    return events[EVENT_COLUMNS]
+
+
+def read_events_table(csv_file_path):
+    """Read an events CSV with parsed event times
+
+    The result is cached until the file changes; do not modify it in place.
+
+    Parameters
+    ----------
+    csv_file_path : str
+        path of the events CSV
+
+    Returns
+    -------
+    pd.DataFrame
+        columns BASIN (str), BEGINNING_RAIN and END_RAIN (datetime64)
+    """
+    fingerprint = file_fingerprint(csv_file_path)
+    if fingerprint is None:
+        raise FileNotFoundError(csv_file_path)
+    return _read_events_table(
+        os.path.abspath(csv_file_path), fingerprint["mtime_ns"], fingerprint["size"]
+    )
+
+
+def events_by_basin(events):
+    """Split an events table into one table per basin
+
+    Parameters
+    ----------
+    events : pd.DataFrame
+        a table from read_events_table
+
+    Returns
+    -------
+    dict
+        basin id -> events of that basin, in file order
+    """
+    return {
+        basin: basin_events.reset_index(drop=True)
+        for basin, basin_events in events.groupby("BASIN", sort=False)
+    }
+
+
+def read_basin_events(csv_file_path, basin_id):
+    """Events of one basin from an events CSV; an empty table if it has none"""
+    events = read_events_table(csv_file_path)
+    return events[events["BASIN"] == basin_id].reset_index(drop=True)
+
+
+def event_time_indices(time_index, start_times, end_times):
+    """Convert event bounds to integer positions on a time axis
+
+    Parameters
+    ----------
+    time_index : pd.DatetimeIndex
+        sorted time axis of the basin series
+    start_times : array-like of datetime64
+        first time of every event (inclusive)
+    end_times : array-like of datetime64
+        last time of every event (inclusive)
+
+    Returns
+    -------
+    tuple
+        (starts, ends) as integer arrays, ends exclusive, so that
+        ``series[starts[i]:ends[i]]`` equals ``series.sel(time=slice(start, end))``
+    """
+    starts = time_index.searchsorted(pd.DatetimeIndex(start_times), side="left")
+    ends = time_index.searchsorted(pd.DatetimeIndex(end_times), side="right")
+    return np.asarray(starts, dtype=np.intp), np.asarray(ends, dtype=np.intp)
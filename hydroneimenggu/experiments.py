@@ -0,0 +1,494 @@
+"""Train and test experiments of the dataset x time unit x task matrix.
+
+The ``train_with_*`` and ``test_with_*`` scripts each build one torchhydro
+configuration that differs from the others only in the training dataset (its
+gage list), the time unit (1D or 3h) and the task (streamflow only, "stlflow",
+or streamflow and surface soil moisture, "mtlflowssm"). Run as separate
+scripts, every experiment pays again for importing torchhydro and torch and for
+reading the gage lists. :func:`experiment_args` builds the arguments of any
+cell of the matrix from the shared settings below, and :func:`run_experiments`
+runs a list of them one after the other in a single interpreter, so torchhydro
+is imported once. Test runs read the scaler statistics and the best weights
+saved by the matching training run instead of computing them again.
+
+A test can also be run as a sweep over several hydrological years (November to
+October): :func:`run_test_sweep` loads the weights, the statistics and the data
+once and tests the whole span in one pass, then :func:`split_test_results`
+writes the observations and predictions of each year into its own project
+folder ``<name>_<year>``, as the separate per-year test runs did.
+"""
+
+import functools
+import itertools
+import os
+import time
+import traceback
+
+import pandas as pd
+import xarray as xr
+
+from hydroneimenggu.session import OBS_FILE_NAME, PRED_FILE_NAME
+
+MODES = ("train", "test")
+TIME_UNITS = ("1D", "3h")
+GAGE_ID_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "gage_ids"
+)
+# training gage list of each dataset; all test runs evaluate the Neimenggu basins
+GAGE_FILES = {
+    "camels": "basin_us.csv",
+    "camelsandneimeng": "basin_us_and_neimeng.csv",
+    "nmg": "basin_neimenggu.csv",
+}
+TEST_GAGE_FILE = "basin_neimenggu.csv"
+VAR_C = [
+    "area",  # basin area
+    "ele_mt_smn",  # elevation (spatial mean)
+    "slp_dg_sav",  # terrain slope (spatial mean)
+    "sgr_dk_sav",  # stream gradient (mean)
+    "for_pc_sse",  # forest cover
+    "glc_cl_smj",  # land cover class
+    "run_mm_syr",  # land surface runoff (spatial mean)
+    "inu_pc_slt",  # inundation extent (long-term maximum)
+    "cmi_ix_syr",  # climate moisture index
+    "aet_mm_syr",  # actual evapotranspiration (annual mean)
+    "snw_pc_syr",  # snow cover extent (annual mean)
+    "swc_pc_syr",  # soil water content
+    "gwt_cm_sav",  # groundwater table depth
+    "cly_pc_sav",  # clay, silt and sand fractions of the soil
+    "dor_pc_pva",  # degree of regulation
+]
+COMMON_ARGS = {
+    "model_name": "Seq2Seq",
+    "model_loader": {"load_way": "best"},
+    "batch_size": 256,
+    "var_c": VAR_C,
+    "dataset": "Seq2SeqDataset",
+    "sampler": "BasinBatchSampler",
+    "scaler": "DapengScaler",
+    "train_epoch": 100,
+    "save_epoch": 1,
+    "loss_func": "MultiOutLoss",
+    "opt": "Adam",
+    "lr_scheduler": {"lr": 0.0001, "lr_factor": 0.9},
+    "which_first_tensor": "batch",
+    "calc_metrics": False,
+    "early_stopping": True,
+    "rolling": True,
+    "patience": 10,
+    "model_type": "MTL",
+}
+TIME_UNIT_ARGS = {
+    "1D": {
+        "min_time_unit": "D",
+        "min_time_interval": 1,
+        "forecast_history": 365,
+        "forecast_length": 1,
+    },
+    "3h": {
+        "min_time_unit": "h",
+        "min_time_interval": 3,
+        "forecast_history": 240,
+        "forecast_length": 8,
+    },
+}
+TASKS = {
+    "stlflow": {
+        "var_t": ["total_precipitation_hourly"],
+        "var_out": ["streamflow"],
+        "item_weight": [1],
+    },
+    "mtlflowssm": {
+        "var_t": ["total_precipitation_hourly", "sm_surface"],
+        "var_out": ["streamflow", "sm_surface"],
+        "item_weight": [0.8, 0.2],
+    },
+}
+# periods of the training runs (train, valid, test) and of the test runs, by
+# whether the training dataset is the Neimenggu one; 3h times carry the hour
+PERIODS = {
+    ("train", "nmg", "1D"): {
+        "train_period": ["2015-06-01", "2020-10-31"],
+        "valid_period": ["2020-10-01", "2023-10-31"],
+        "test_period": ["2020-10-31", "2023-10-31"],
+    },
+    ("train", "nmg", "3h"): {
+        "train_period": ["2015-06-01-01", "2020-12-31-01"],
+        "valid_period": ["2020-10-01-01", "2023-10-31-01"],
+        "test_period": ["2020-10-31-01", "2023-10-31-01"],
+    },
+    ("train", "other", "1D"): {
+        "train_period": ["2015-06-01", "2022-06-01"],
+        "valid_period": ["2022-06-01", "2023-12-01"],
+        "test_period": ["2022-06-01", "2023-12-01"],
+    },
+    ("train", "other", "3h"): {
+        "train_period": ["2015-06-01-01", "2022-11-01-01"],
+        "valid_period": ["2022-11-01-01", "2023-12-01-01"],
+        "test_period": ["2022-11-01-01", "2023-12-01-01"],
+    },
+    ("test", "nmg", "1D"): {"test_period": ["2019-06-01", "2020-12-01"]},
+    ("test", "nmg", "3h"): {"test_period": ["2019-06-01-01", "2020-11-01-01"]},
+    ("test", "other", "1D"): {"test_period": ["2015-06-01", "2020-10-31"]},
+    ("test", "other", "3h"): {"test_period": ["2019-10-31-01", "2020-10-31-01"]},
+}
+# the data of the self-made dataset begin in June 2015
+FIRST_TEST_START = "2015-06-01"
+
+
+def experiment_name(mode, dataset, time_unit, task):
+    """Project name of an experiment, e.g. test_with_nmg_1D_era5land_mtlflowssm"""
+    return f"{mode}_with_{dataset}_{time_unit}_era5land_{task}"
+
+
+@functools.lru_cache(maxsize=None)
+def read_gage_ids(gage_file):
+    """The basin ids of a gage list CSV with an "id" column, read once per process
+
+    Parameters
+    ----------
+    gage_file : str
+        file name in gage_ids/ or a path
+
+    Returns
+    -------
+    tuple
+        the basin ids
+    """
+    if not os.path.isabs(gage_file):
+        gage_file = os.path.join(GAGE_ID_DIR, gage_file)
+    return tuple(pd.read_csv(gage_file, dtype={"id": str})["id"].values.tolist())
+
+
+def experiment_matrix(datasets, time_units=TIME_UNITS, tasks=tuple(TASKS), modes=MODES):
+    """All combinations of modes, datasets, time units and tasks
+
+    Training runs come before the test runs, which need their weights.
+
+    Returns
+    -------
+    list
+        (mode, dataset, time_unit, task) tuples
+    """
+    for key, values, known in [
+        ("dataset", datasets, GAGE_FILES),
+        ("time unit", time_units, TIME_UNIT_ARGS),
+        ("task", tasks, TASKS),
+        ("mode", modes, MODES),
+    ]:
+        unknown = [value for value in values if value not in known]
+        if unknown:
+            raise ValueError(f"Unknown {key} {unknown}, expected one of {list(known)}")
+    modes = [mode for mode in MODES if mode in modes]
+    return list(itertools.product(modes, datasets, time_units, tasks))
+
+
+def model_hyperparam(time_unit, task):
+    """Hyperparameters of the Seq2Seq model of a time unit and task
+
+    The encoder reads the precipitation, the attributes and the other forcings
+    of task (its var_t after the precipitation); the decoder reads the
+    precipitation, the attributes and its previous output. The names are those
+    of torchhydro 0.2.0's GeneralSeq2Seq; hindcast_output_window is called
+    prec_window in the scripts written for older versions.
+    """
+    task_args = TASKS[task]
+    n_in = len(task_args["var_t"]) + len(VAR_C)
+    return {
+        "en_input_size": n_in,
+        "de_input_size": n_in + 1,
+        "output_size": len(task_args["var_out"]),
+        "hidden_size": 256,
+        "forecast_length": TIME_UNIT_ARGS[time_unit]["forecast_length"],
+        "hindcast_output_window": 1,
+        "teacher_forcing_ratio": 0.5,
+    }
+
+
+def experiment_args(
+    mode,
+    dataset,
+    time_unit,
+    task,
+    dataset_dir,
+    result_dir,
+    device=0,
+    overrides=None,
+):
+    """Keyword arguments of torchhydro's ``cmd`` for one experiment
+
+    Parameters
+    ----------
+    mode : str
+        "train" or "test"; a test run loads the best weights and the scaler
+        statistics of the training run with the same dataset, time unit and task
+    dataset : str
+        the training dataset, a key of GAGE_FILES
+    time_unit : str
+        "1D" or "3h"
+    task : str
+        a key of TASKS
+    dataset_dir : str
+        folder of the self-made hydro dataset
+    result_dir : str
+        folder with the results of the training runs
+    device : int, optional
+        the GPU, by default 0
+    overrides : dict, optional
+        arguments replacing the defaults, such as {"train_epoch": 20}
+
+    Returns
+    -------
+    dict
+        the arguments
+    """
+    task_args = TASKS[task]
+    unit_args = TIME_UNIT_ARGS[time_unit]
+    n_out = len(task_args["var_out"])
+    gage_file = GAGE_FILES[dataset] if mode == "train" else TEST_GAGE_FILE
+    args = dict(
+        COMMON_ARGS,
+        sub=os.path.join(
+            f"{mode}_with_era5land", experiment_name(mode, dataset, time_unit, task)
+        ),
+        source_cfgs={
+            "source_name": "selfmadehydrodataset",
+            "source_path": dataset_dir,
+            "other_settings": {"time_unit": [time_unit]},
+        },
+        ctx=[device],
+        model_hyperparam=model_hyperparam(time_unit, task),
+        gage_id=list(read_gage_ids(gage_file)),
+        var_t=task_args["var_t"],
+        var_out=task_args["var_out"],
+        loss_param={
+            "loss_funcs": "RMSESum",
+            "data_gap": [0] * n_out,
+            "device": [device],
+            "item_weight": task_args["item_weight"],
+        },
+        **unit_args,
+    )
+    args.update(PERIODS[(mode, "nmg" if dataset == "nmg" else "other", time_unit)])
+    if mode == "test":
+        train_dir = os.path.join(
+            result_dir, experiment_name("train", dataset, time_unit, task)
+        )
+        args.update(
+            train_mode=False,
+            stat_dict_file=os.path.join(train_dir, "dapengscaler_stat.json"),
+            weight_path=os.path.join(train_dir, "best_model.pth"),
+            continue_train=False,
+        )
+    if overrides:
+        args.update(overrides)
+    return args
+
+
+def hydro_year_periods(years, time_unit, first_start=FIRST_TEST_START):
+    """Test periods of hydrological years, from Oct 31 of the year before
+
+    Parameters
+    ----------
+    years : list
+        the years, each named after the year its period ends in
+    time_unit : str
+        "1D" or "3h"; 3h times carry the hour, as in the test configurations
+    first_start : str, optional
+        no period starts before this date, by default the start of the data
+
+    Returns
+    -------
+    dict
+        year -> [start, end]
+    """
+    hour = "-01" if time_unit == "3h" else ""
+    periods = {}
+    for year in sorted(int(year) for year in years):
+        start = max(pd.Timestamp(f"{year - 1}-10-31"), pd.Timestamp(first_start))
+        periods[year] = [f"{start:%Y-%m-%d}{hour}", f"{year}-10-31{hour}"]
+    return periods
+
+
+def _parse_period_time(value):
+    # "2019-10-31-01" is a date with the hour appended
+    date, _, hour = value[:10], value[10:11], value[11:]
+    return pd.Timestamp(date) + pd.Timedelta(hours=int(hour) if hour else 0)
+
+
+def split_test_results(
+    test_dir, periods, output_dir, file_names=(OBS_FILE_NAME, PRED_FILE_NAME)
+):
+    """Write the results of one test run in one folder per period
+
+    Parameters
+    ----------
+    test_dir : str
+        folder with the NetCDF results of the test over the whole span
+    periods : dict
+        name of each output folder -> [start, end], see hydro_year_periods;
+        both ends are included
+    output_dir : str
+        the output folders are created in this folder
+    file_names : tuple, optional
+        the files to split, by default the observations and the predictions
+
+    Returns
+    -------
+    list
+        the output folders
+    """
+    folders = []
+    for name, (start, end) in periods.items():
+        folder = os.path.join(output_dir, name)
+        os.makedirs(folder, exist_ok=True)
+        for file_name in file_names:
+            output_file = os.path.join(folder, file_name)
+            tmp_file = f"{output_file}.{os.getpid()}.tmp"
+            with xr.open_dataset(os.path.join(test_dir, file_name)) as ds:
+                ds.sel(
+                    time=slice(_parse_period_time(start), _parse_period_time(end))
+                ).to_netcdf(tmp_file)
+            os.replace(tmp_file, output_file)
+        folders.append(folder)
+    return folders
+
+
+def _run_config(args):
+    from torchhydro.configs.config import cmd, default_config_file, update_cfg
+    from torchhydro.trainers.trainer import train_and_evaluate
+
+    config_data = default_config_file()
+    update_cfg(config_data, cmd(**args))
+    train_and_evaluate(config_data)
+    # the results folder; older torchhydro versions call it test_path
+    data_cfgs = config_data["data_cfgs"]
+    return data_cfgs.get("case_dir") or data_cfgs.get("test_path")
+
+
+def run_test_sweep(
+    dataset,
+    time_unit,
+    task,
+    years,
+    dataset_dir,
+    result_dir,
+    device=0,
+    overrides=None,
+    first_start=FIRST_TEST_START,
+):
+    """Test a trained model on several hydrological years in one pass
+
+    Instead of one test run per year, each loading the weights, the scaler
+    statistics and the data again, the model is tested once on the span of all
+    years and the results are split by year afterwards. Every year but the
+    first is then predicted with the real data before it as its history.
+
+    Parameters
+    ----------
+    dataset, time_unit, task, dataset_dir, result_dir, device, overrides
+        see experiment_args
+    years : list
+        the years, see hydro_year_periods
+    first_start : str, optional
+        see hydro_year_periods
+
+    Returns
+    -------
+    list
+        the folders <name>_<year> next to the folder of the sweep run, each with
+        the observations and predictions of one year
+    """
+    periods = hydro_year_periods(years, time_unit, first_start)
+    first, last = min(periods), max(periods)
+    name = experiment_name("test", dataset, time_unit, task)
+    args = experiment_args(
+        "test",
+        dataset,
+        time_unit,
+        task,
+        dataset_dir,
+        result_dir,
+        device=device,
+        overrides=overrides,
+    )
+    args["sub"] = os.path.join(os.path.dirname(args["sub"]), f"{name}_sweep")
+    args["test_period"] = [periods[first][0], periods[last][1]]
+    test_dir = _run_config(args)
+    return split_test_results(
+        test_dir,
+        {f"{name}_{year}": period for year, period in periods.items()},
+        os.path.dirname(test_dir),
+    )
+
+
+def run_experiments(
+    experiments,
+    dataset_dir,
+    result_dir,
+    device=0,
+    overrides=None,
+    stop_on_error=False,
+    sweep_years=None,
+):
+    """Run experiments one after the other in this process
+
+    torchhydro is imported on the first call only. A failing experiment is
+    reported and the next one runs, unless stop_on_error is set.
+
+    Parameters
+    ----------
+    experiments : list
+        (mode, dataset, time_unit, task) tuples, see experiment_matrix
+    dataset_dir, result_dir, device, overrides
+        see experiment_args
+    stop_on_error : bool, optional
+        raise the error of a failing experiment, by default False
+    sweep_years : list, optional
+        run the test experiments as sweeps over these years, see run_test_sweep
+
+    Returns
+    -------
+    dict
+        name of each experiment -> None if it finished, else the error message
+    """
+    results = {}
+    for i, (mode, dataset, time_unit, task) in enumerate(experiments, 1):
+        name = experiment_name(mode, dataset, time_unit, task)
+        print(f"[{i}/{len(experiments)}] {name}")
+        begin = time.perf_counter()
+        try:
+            if mode == "test" and sweep_years:
+                run_test_sweep(
+                    dataset,
+                    time_unit,
+                    task,
+                    sweep_years,
+                    dataset_dir,
+                    result_dir,
+                    device=device,
+                    overrides=overrides,
+                )
+            else:
+                _run_config(
+                    experiment_args(
+                        mode,
+                        dataset,
+                        time_unit,
+                        task,
+                        dataset_dir,
+                        result_dir,
+                        device=device,
+                        overrides=overrides,
+                    )
+                )
+        except Exception as e:
+            if stop_on_error:
+                raise
+            traceback.print_exc()
+            results[name] = f"{type(e).__name__}: {e}"
+            print(f"{name} failed after {time.perf_counter() - begin:.1f}s")
+            continue
+        results[name] = None
+        print(f"{name} finished in {time.perf_counter() - begin:.1f}s")
+    return results
@@ -0,0 +1,522 @@
+"""Forecasts of a trained Seq2Seq model without a torchhydro test run.
+
+A torchhydro test (``train_and_evaluate`` with ``train_mode=False``) rebuilds
+the dataset, normalizes the whole test period, loads the weights and writes
+NetCDF files, which is far too much for issuing the next forecast of the
+Neimenggu basins every time step. :class:`Seq2SeqForecaster` loads the weights
+and the scaler statistics of a training run once, keeps the model in memory
+and turns a batch of basins' latest windows into denormalized forecasts with
+one forward pass on the CPU, without gradients.
+
+For operational forecasts every time step, :class:`StreamingForecast` keeps
+the normalized history windows of the basins in a ring buffer, so each cycle
+normalizes only the newest step instead of the whole history.
+
+The inputs are assembled as torchhydro 0.2.0's ``Seq2SeqDataset`` does, time
+first, and normalized as ``DapengScaler`` does (see :mod:`hydroneimenggu.scaling`),
+so the forecasts match those of a test run over the same windows.
+"""
+
+import inspect
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from hydroneimenggu.experiments import (
+    COMMON_ARGS,
+    TASKS,
+    TIME_UNIT_ARGS,
+    VAR_C,
+    experiment_name,
+    model_hyperparam,
+)
+from hydroneimenggu.attributes import MEAN_PRCP_ATTRIBUTE
+from hydroneimenggu.scaling import (
+    mean_precipitation,
+    normalize,
+    read_scaler_params,
+    read_stat_dict,
+)
+
+
+def _interpolate_gaps(values):
+    # (basin, time) series: linear in time, the ends filled with the nearest value
+    if not np.isnan(values).any():
+        return values
+    return (
+        pd.DataFrame(values.T)
+        .interpolate(limit_direction="both")
+        .fillna(0.0)
+        .to_numpy()
+        .T
+    )
+
+
+def seq2seq_inputs(precip, attributes, history, forcings=None):
+    """Encoder and decoder inputs of normalized windows, as in Seq2SeqDataset
+
+    Parameters
+    ----------
+    precip : np.ndarray
+        shape (basin, history + horizon), the precipitation of the history and
+        of the forecast periods
+    attributes : np.ndarray
+        shape (basin, n_attributes)
+    history : int
+        number of history periods
+    forcings : np.ndarray, optional
+        shape (basin, history, n_forcings), the other forcings of the encoder,
+        each one time step before the history precipitation
+
+    Returns
+    -------
+    tuple
+        (encoder input, decoder input) with time first, of shapes
+        (history, basin, 1 + n_attributes + n_forcings) and
+        (horizon, basin, 1 + n_attributes)
+    """
+    p = np.transpose(precip)[:, :, np.newaxis]
+    c = np.broadcast_to(
+        attributes[np.newaxis], (precip.shape[1],) + attributes.shape
+    )
+    encoder = [p[:history], c[:history]]
+    if forcings is not None:
+        encoder.append(np.transpose(forcings, (1, 0, 2)))
+    decoder = [p[history:], c[history:]]
+    return (
+        np.concatenate(encoder, axis=2).astype(np.float32),
+        np.concatenate(decoder, axis=2).astype(np.float32),
+    )
+
+
+def _check_window(name, values, n_basins, length):
+    values = np.asarray(values, dtype=np.float64)
+    if values.shape != (n_basins, length):
+        raise ValueError(
+            f"{name} has shape {values.shape}, expected ({n_basins}, {length})"
+        )
+    return values
+
+
+def model_kwargs(model_class, hyperparam):
+    """The hyperparameters the constructor of a model takes
+
+    prec_window, the name of hindcast_output_window in the scripts written for
+    torchhydro before 0.2.0, is renamed; other arguments the constructor does
+    not take are dropped, as its signature has no **kwargs.
+
+    Parameters
+    ----------
+    model_class : type
+        the model, e.g. pytorch_model_dict["Seq2Seq"]
+    hyperparam : dict
+        the hyperparameters, see experiments.model_hyperparam
+
+    Returns
+    -------
+    dict
+        keyword arguments of model_class
+    """
+    params = inspect.signature(model_class).parameters
+    kwargs = dict(hyperparam)
+    if any(param.kind == param.VAR_KEYWORD for param in params.values()):
+        return kwargs
+    if "prec_window" not in params and "hindcast_output_window" in params:
+        prec_window = kwargs.pop("prec_window", None)
+        if prec_window is not None:
+            kwargs.setdefault("hindcast_output_window", prec_window)
+    return {key: value for key, value in kwargs.items() if key in params}
+
+
+class Seq2SeqForecaster(object):
+    def __init__(
+        self,
+        weight_path,
+        stat_dict_file,
+        attributes,
+        time_unit,
+        task,
+        hyperparam=None,
+        n_threads=None,
+        attribute_cache=None,
+    ):
+        """A trained Seq2Seq model kept in memory to forecast batches of basins
+
+        Parameters
+        ----------
+        weight_path : str
+            the weights saved by the training run, such as best_model.pth
+        stat_dict_file : str
+            the scaler statistics saved by the training run
+        attributes : pd.DataFrame
+            the attributes of the basins, indexed by basin id, with the columns
+            VAR_C and MEAN_PRCP_ATTRIBUTE; see attributes.read_basin_attributes
+        time_unit : str
+            "1D" or "3h"
+        task : str
+            a key of TASKS
+        hyperparam : dict, optional
+            hyperparameters of the model, by default those of model_hyperparam
+        n_threads : int, optional
+            number of CPU threads of torch, by default torch's default
+        attribute_cache : AttributeMatrixCache, optional
+            when given, the normalized VAR_C attributes are taken from it and
+            attributes only needs the column MEAN_PRCP_ATTRIBUTE
+        """
+        self.weight_path = weight_path
+        self.stat_dict_file = stat_dict_file
+        self.time_unit = time_unit
+        self.task = task
+        self.hyperparam = (
+            model_hyperparam(time_unit, task) if hyperparam is None else hyperparam
+        )
+        self.n_threads = n_threads
+        self.history = TIME_UNIT_ARGS[time_unit]["forecast_history"]
+        self.horizon = TIME_UNIT_ARGS[time_unit]["forecast_length"]
+        self.var_t = TASKS[task]["var_t"]
+        self.var_out = TASKS[task]["var_out"]
+        self.stat_dict = read_stat_dict(stat_dict_file)
+        # the columns DapengScaler transformed, from the training configuration
+        self.scaler_params = read_scaler_params(os.path.dirname(stat_dict_file))
+        # the attributes are static: normalize them once for all forecasts
+        self.basins = [str(basin) for basin in attributes.index]
+        self._rows = {basin: i for i, basin in enumerate(self.basins)}
+        if attribute_cache is None:
+            normalized = np.stack(
+                [
+                    self.normalize(attributes[var].to_numpy(), var)
+                    for var in VAR_C
+                ],
+                axis=1,
+            )
+        else:
+            normalized = attribute_cache.matrix(self.basins, stat_dict_file).to_numpy()
+        self._attributes = np.nan_to_num(normalized).astype(np.float32)
+        self._mean_prcp = mean_precipitation(
+            attributes[MEAN_PRCP_ATTRIBUTE].to_numpy(), time_unit
+        )
+        self._model = None
+        self.last_latency = {}
+
+    @classmethod
+    def from_experiment(
+        cls, dataset, time_unit, task, result_dir, attributes, **kwargs
+    ):
+        """The forecaster of the training run of a dataset, time unit and task
+
+        Parameters
+        ----------
+        dataset, time_unit, task
+            see experiments.experiment_args
+        result_dir : str
+            folder with the results of the training runs
+        attributes : pd.DataFrame
+            see Seq2SeqForecaster
+        **kwargs
+            other arguments of Seq2SeqForecaster
+        """
+        train_dir = os.path.join(
+            result_dir, experiment_name("train", dataset, time_unit, task)
+        )
+        return cls(
+            os.path.join(train_dir, "best_model.pth"),
+            os.path.join(train_dir, "dapengscaler_stat.json"),
+            attributes,
+            time_unit,
+            task,
+            **kwargs,
+        )
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_model"] = None
+        return state
+
+    @property
+    def model(self):
+        """The model in evaluation mode on the CPU, loaded on first use"""
+        if self._model is None:
+            import torch
+            from torchhydro.models.model_dict_function import pytorch_model_dict
+
+            if self.n_threads is not None:
+                torch.set_num_threads(self.n_threads)
+            model_class = pytorch_model_dict[COMMON_ARGS["model_name"]]
+            model = model_class(**model_kwargs(model_class, self.hyperparam))
+            model.load_state_dict(torch.load(self.weight_path, map_location="cpu"))
+            self._model = model.eval()
+        return self._model
+
+    def forecast(self, basin_ids, precip, forcings=None):
+        """Forecast the next horizon time steps of a batch of basins
+
+        The timings of the last call, in seconds, are kept in last_latency.
+
+        Parameters
+        ----------
+        basin_ids : list
+            the basins, all in the attributes
+        precip : np.ndarray
+            shape (basin, history + horizon): the precipitation of the last
+            history periods and of the horizon periods to forecast
+        forcings : dict, optional
+            the other encoder variables of the task (var_t after the
+            precipitation, e.g. sm_surface) -> array of shape (basin, history),
+            each window starting one time step before that of the precipitation
+
+        Returns
+        -------
+        xr.Dataset
+            the denormalized forecasts of var_out, with dims (basin, lead); lead
+            is the number of time steps ahead, from 1 to horizon
+        """
+        begin = time.perf_counter()
+        basin_ids = [str(basin) for basin in basin_ids]
+        rows = self.basin_rows(basin_ids)
+        n_basins = len(basin_ids)
+        precip_var = self.var_t[0]
+        precip = _check_window(
+            precip_var, precip, n_basins, self.history + self.horizon
+        )
+        forcings = {} if forcings is None else forcings
+        encoder_forcings = []
+        for var in self.var_t[1:]:
+            if var not in forcings:
+                raise ValueError(f"The task {self.task} needs the {var} windows")
+            values = _check_window(var, forcings[var], n_basins, self.history)
+            encoder_forcings.append(
+                _interpolate_gaps(self.normalize(values, var))
+            )
+        encoder, decoder = seq2seq_inputs(
+            _interpolate_gaps(self.normalize(precip, precip_var)),
+            self._attributes[rows],
+            self.history,
+            np.stack(encoder_forcings, axis=2) if encoder_forcings else None,
+        )
+        return self.run(basin_ids, rows, encoder, decoder, begin)
+
+    def normalize(self, values, var, mean_prcp=None, to_norm=True):
+        """scaling.normalize with the statistics and columns of the training run"""
+        return normalize(
+            values,
+            var,
+            self.stat_dict,
+            mean_prcp=mean_prcp,
+            to_norm=to_norm,
+            scaler_params=self.scaler_params,
+        )
+
+    def basin_rows(self, basin_ids):
+        """Rows of the basins in the attributes"""
+        unknown = [basin for basin in basin_ids if str(basin) not in self._rows]
+        if unknown:
+            raise ValueError(f"No attributes for the basins {unknown}")
+        return [self._rows[str(basin)] for basin in basin_ids]
+
+    def run(self, basin_ids, rows, encoder, decoder, begin):
+        """Run the model on normalized inputs and denormalize its output
+
+        Parameters
+        ----------
+        basin_ids : list
+            the basins
+        rows : list
+            their rows, see basin_rows
+        encoder, decoder : np.ndarray
+            the inputs, see seq2seq_inputs
+        begin : float
+            time.perf_counter() when the preparation of the inputs began
+
+        Returns
+        -------
+        xr.Dataset
+            see forecast
+        """
+        prepared = time.perf_counter()
+
+        import torch
+
+        with torch.no_grad():
+            output = self.model(torch.from_numpy(encoder), torch.from_numpy(decoder))
+        # (horizon, basin, var_out) -> (basin, horizon, var_out)
+        output = output[-self.horizon :].numpy().transpose(1, 0, 2)
+        predicted = time.perf_counter()
+
+        mean_prcp = self._mean_prcp[rows]
+        ds = xr.Dataset(
+            {
+                var: (
+                    ("basin", "lead"),
+                    self.normalize(
+                        output[:, :, i], var, mean_prcp=mean_prcp, to_norm=False
+                    ),
+                )
+                for i, var in enumerate(self.var_out)
+            },
+            coords={"basin": basin_ids, "lead": np.arange(1, self.horizon + 1)},
+        )
+        end = time.perf_counter()
+        self.last_latency = {
+            "prepare": prepared - begin,
+            "model": predicted - prepared,
+            "denormalize": end - predicted,
+            "total": end - begin,
+        }
+        return ds
+
+
+class StreamingForecast(object):
+    def __init__(self, forecaster, basin_ids, end_time, precip, forcings=None):
+        """Forecasts of successive time steps from rolling input windows
+
+        Forecasting every time step with Seq2SeqForecaster.forecast reads and
+        normalizes the whole history window of each basin again, although only
+        one time step is new. Here the normalized history is kept in a ring
+        buffer: append normalizes the newest step and writes it over the oldest
+        one. The buffer is stored twice in a row, so the history from the oldest
+        to the newest step is always a contiguous slice, and the model inputs
+        are allocated once with the static attributes already in place; a
+        forecast only copies the history into them and normalizes the horizon
+        precipitation.
+
+        Parameters
+        ----------
+        forecaster : Seq2SeqForecaster
+            the model
+        basin_ids : list
+            the basins
+        end_time : str or pd.Timestamp
+            time of the last step of the initial windows
+        precip : np.ndarray
+            shape (basin, history + 1), the precipitation up to end_time
+        forcings : dict, optional
+            the other encoder variables of the task -> array of shape
+            (basin, history + 1), up to end_time; the encoder reads them one
+            time step before the precipitation, as in Seq2SeqDataset
+        """
+        self.forecaster = forecaster
+        self.basin_ids = [str(basin) for basin in basin_ids]
+        self._rows = forecaster.basin_rows(self.basin_ids)
+        self.step = pd.Timedelta(forecaster.time_unit)
+        self.end_time = pd.Timestamp(end_time)
+        n_basins = len(self.basin_ids)
+        size = forecaster.history + 1
+        steps = self._steps(
+            precip, {} if forcings is None else forcings, (n_basins, size)
+        )
+        steps = [_interpolate_gaps(values) for values in steps]
+        # (2 * size, basin, var_t), time first as the model inputs
+        self._buffer = np.tile(np.stack(steps, axis=2).transpose(1, 0, 2), (2, 1, 1))
+        # index of the oldest step in the buffer
+        self._head = 0
+        attributes = forecaster._attributes[self._rows]
+        n_attributes = attributes.shape[1]
+        self._encoder = np.empty(
+            (forecaster.history, n_basins, 1 + n_attributes + len(steps) - 1),
+            dtype=np.float32,
+        )
+        self._encoder[:, :, 1 : 1 + n_attributes] = attributes
+        self._decoder = np.empty(
+            (forecaster.horizon, n_basins, 1 + n_attributes), dtype=np.float32
+        )
+        self._decoder[:, :, 1:] = attributes
+
+    def __len__(self):
+        return len(self.basin_ids)
+
+    def _steps(self, precip, forcings, shape):
+        # the normalized values of each variable of var_t
+        forecaster = self.forecaster
+        steps = []
+        for i, var in enumerate(forecaster.var_t):
+            values = precip if i == 0 else forcings.get(var)
+            if values is None:
+                raise ValueError(f"The task {forecaster.task} needs the {var} values")
+            values = _check_window(var, values, *shape)
+            steps.append(forecaster.normalize(values, var))
+        return steps
+
+    def append(self, time_step, precip, forcings=None):
+        """Add the newest time step of all basins
+
+        Missing values repeat the previous step of the basin.
+
+        Parameters
+        ----------
+        time_step : str or pd.Timestamp
+            its time, one time unit after the last step
+        precip : np.ndarray
+            shape (basin,)
+        forcings : dict, optional
+            the other encoder variables -> array of shape (basin,)
+        """
+        time_step = pd.Timestamp(time_step)
+        if time_step != self.end_time + self.step:
+            raise ValueError(
+                f"Expected the step after {self.end_time}, got {time_step}; "
+                "start a new StreamingForecast after a gap"
+            )
+        size = self._buffer.shape[0] // 2
+        forcings = {} if forcings is None else forcings
+        steps = self._steps(
+            np.reshape(precip, (-1, 1)),
+            {var: np.reshape(values, (-1, 1)) for var, values in forcings.items()},
+            (len(self), 1),
+        )
+        step = np.concatenate(steps, axis=1)
+        newest = self._buffer[self._head + size - 1]
+        step = np.where(np.isnan(step), newest, step)
+        self._buffer[self._head] = step
+        self._buffer[self._head + size] = step
+        self._head = (self._head + 1) % size
+        self.end_time = time_step
+
+    def inputs(self, precip):
+        """The model inputs of the forecast after end_time
+
+        Parameters
+        ----------
+        precip : np.ndarray
+            shape (basin, horizon), the precipitation of the forecast periods
+
+        Returns
+        -------
+        tuple
+            (encoder input, decoder input), see seq2seq_inputs; the arrays are
+            reused by the next call
+        """
+        forecaster = self.forecaster
+        precip_var = forecaster.var_t[0]
+        precip = _check_window(precip_var, precip, len(self), forecaster.horizon)
+        size = self._buffer.shape[0] // 2
+        history = self._buffer[self._head : self._head + size]
+        n_attributes = forecaster._attributes.shape[1]
+        self._encoder[:, :, 0] = history[1:, :, 0]
+        self._encoder[:, :, 1 + n_attributes :] = history[:-1, :, 1:]
+        self._decoder[:, :, 0] = _interpolate_gaps(
+            forecaster.normalize(precip, precip_var)
+        ).T
+        return self._encoder, self._decoder
+
+    def forecast(self, precip):
+        """Forecast the horizon steps after end_time
+
+        Parameters
+        ----------
+        precip : np.ndarray
+            shape (basin, horizon), the precipitation of the forecast periods
+
+        Returns
+        -------
+        xr.Dataset
+            see Seq2SeqForecaster.forecast, with the times of the forecasts as
+            the "time" coordinate along lead
+        """
+        begin = time.perf_counter()
+        encoder, decoder = self.inputs(precip)
+        ds = self.forecaster.run(self.basin_ids, self._rows, encoder, decoder, begin)
+        lead_times = self.end_time + ds["lead"].values * self.step
+        return ds.assign_coords(time=("lead", lead_times))
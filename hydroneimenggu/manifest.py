@@ -0,0 +1,52 @@
+"""A small JSON manifest recording which inputs produced which outputs.
+
+Scripts use it to skip work whose inputs have not changed since the last run:
+each output is stored under a string key together with the fingerprints of its
+inputs (see :func:`hydroneimenggu.common.file_fingerprint`).
+"""
+
+import json
+import os
+
+
+class Manifest(object):
+    def __init__(self, manifest_file):
+        """Load a manifest; a missing or unreadable file gives an empty one
+
+        Parameters
+        ----------
+        manifest_file : str
+            path of the JSON file
+        """
+        self.manifest_file = manifest_file
+        self.entries = {}
+        if os.path.exists(manifest_file):
+            try:
+                with open(manifest_file, "r") as fp:
+                    self.entries = json.load(fp)
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable manifest {manifest_file}: {e}")
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def set(self, key, value):
+        self.entries[key] = value
+
+    def pop(self, key):
+        return self.entries.pop(key, None)
+
+    def is_fresh(self, key, inputs):
+        """Whether the entry of a key was produced from exactly these inputs"""
+        entry = self.entries.get(key)
+        return entry is not None and entry.get("inputs") == inputs
+
+    def save(self):
+        """Write the manifest atomically, so an interrupted run never corrupts it"""
+        folder = os.path.dirname(self.manifest_file)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        tmp_file = f"{self.manifest_file}.{os.getpid()}.tmp"
+        with open(tmp_file, "w") as fp:
+            json.dump(self.entries, fp, indent=1, sort_keys=True)
+        os.replace(tmp_file, self.manifest_file)
@@ -0,0 +1,124 @@
+"""Folders of memory-mapped arrays built from source files.
+
+:class:`~hydroneimenggu.timeseries.TimeseriesCache` and
+:class:`~hydroneimenggu.basin_store.BasinArrayStore` both convert source files
+into ``.npy`` arrays that are opened memory-mapped. :class:`MemmapStore` holds
+what they share: a manifest entry recording the fingerprints of the sources,
+the freshness check, and a build that writes the new files into a temporary
+folder and swaps it in only when it is complete, so readers never see a
+half-written store. Builds hold a lock file next to the store folder, so when
+several processes find the store stale only the first rebuilds it and the
+others use its result.
+"""
+
+import os
+import shutil
+
+from hydroneimenggu.common import file_lock
+from hydroneimenggu.manifest import Manifest
+
+MANIFEST_FILE = "manifest.json"
+
+
+class MemmapStore(object):
+    # key of the store's entry in its manifest
+    entry_key = "store"
+
+    def __init__(self, store_dir):
+        """Base of a folder of arrays built from source files
+
+        Subclasses implement source_fingerprints, _write and close.
+
+        Parameters
+        ----------
+        store_dir : str
+            folder of the arrays and of their manifest
+        """
+        self.store_dir = store_dir
+        self.manifest = Manifest(os.path.join(store_dir, MANIFEST_FILE))
+
+    def source_fingerprints(self):
+        """The fingerprints of the current sources, recorded in the manifest"""
+        raise NotImplementedError
+
+    def _write(self, tmp_dir, inputs, previous):
+        """Write the arrays into tmp_dir and return the rest of the manifest entry
+
+        inputs are the source fingerprints of the new store; previous is the
+        manifest entry of the current store, whose files may be reused for
+        unchanged sources, or None.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Drop the opened memory maps"""
+        raise NotImplementedError
+
+    def is_fresh(self):
+        """Whether the store was built from the current sources"""
+        return self.manifest.is_fresh(self.entry_key, self.source_fingerprints())
+
+    def refresh(self, force=False):
+        """Rebuild the store if its sources changed since it was built
+
+        Returns
+        -------
+        bool
+            True if the store was rebuilt
+        """
+        self._reload_manifest()
+        if not force and self.is_fresh():
+            return False
+        with file_lock(f"{self.store_dir}.lock"):
+            # another process may have rebuilt the store while we waited
+            self._reload_manifest()
+            if not force and self.is_fresh():
+                return False
+            self.build(reuse=not force)
+        return True
+
+    def _reload_manifest(self):
+        manifest = Manifest(os.path.join(self.store_dir, MANIFEST_FILE))
+        if manifest.entries != self.manifest.entries:
+            # rebuilt by another process since we opened it
+            self.manifest = manifest
+            self.close()
+
+    def build(self, reuse=False):
+        """Build from the sources; the new files replace the old ones when complete
+
+        Call it through refresh, which lets only one process build at a time.
+
+        Parameters
+        ----------
+        reuse : bool, optional
+            let the subclass reuse the current files for unchanged sources, by
+            default False
+        """
+        inputs = self.source_fingerprints()
+        tmp_dir = f"{self.store_dir}.{os.getpid()}.tmp"
+        if os.path.exists(tmp_dir):
+            shutil.rmtree(tmp_dir)
+        os.makedirs(tmp_dir)
+        previous = self.manifest.get(self.entry_key) if reuse else None
+        entry = self._write(tmp_dir, inputs, previous)
+        manifest = Manifest(os.path.join(tmp_dir, MANIFEST_FILE))
+        manifest.set(self.entry_key, dict(entry, inputs=inputs))
+        manifest.save()
+        self.close()
+        old_dir = f"{self.store_dir}.{os.getpid()}.old"
+        if os.path.exists(self.store_dir):
+            os.replace(self.store_dir, old_dir)
+        os.replace(tmp_dir, self.store_dir)
+        if os.path.exists(old_dir):
+            shutil.rmtree(old_dir)
+        self.manifest = Manifest(os.path.join(self.store_dir, MANIFEST_FILE))
+
+    @property
+    def _entry(self):
+        entry = self.manifest.get(self.entry_key)
+        if entry is None:
+            raise FileNotFoundError(
+                f"No {type(self).__name__} in {self.store_dir}, build it first"
+            )
+        return entry
@@ -0,0 +1,235 @@
+"""Consolidated, partitioned Parquet store of the event flow metrics.
+
+``scripts/metrics.py`` writes one CSV per project and time unit. The same rows
+can also go into a single Parquet dataset partitioned by ``project`` and
+``time_unit`` (hive layout, ``project=.../time_unit=.../*.parquet``), so that
+comparisons across the test projects read only the partitions and columns they
+need. Partitions of projects that no longer exist are removed with
+:func:`prune_metrics_partitions`. Parquet support needs ``pyarrow``.
+
+:func:`plan_basin_metrics` and :func:`record_basin_metrics` keep the manifest of
+the per-basin metrics: rows are reused only for basins whose inputs have not
+changed since they were computed successfully, so a basin that failed is
+computed again on the next run.
+"""
+
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from hydroneimenggu.event_metrics import METRICS_COLUMNS
+
+PARTITION_COLS = ["project", "time_unit"]
+FLOAT_COLUMNS = METRICS_COLUMNS[4:]
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError as e:
+        raise ImportError(
+            "The Parquet metrics store needs pyarrow: `pip install pyarrow`"
+        ) from e
+
+
+def typed_metrics_frame(metrics):
+    """Event metrics with explicit column types
+
+    Parameters
+    ----------
+    metrics : list of dict or pd.DataFrame
+        rows with the columns in METRICS_COLUMNS
+
+    Returns
+    -------
+    pd.DataFrame
+        ids and names as strings, event bounds as datetime64, metrics as float64
+    """
+    df = pd.DataFrame(metrics, columns=METRICS_COLUMNS)
+    df["basin_id"] = df["basin_id"].astype(str)
+    df["basin_name"] = df["basin_name"].astype(str)
+    df["event_start"] = pd.to_datetime(df["event_start"])
+    df["event_end"] = pd.to_datetime(df["event_end"])
+    df[FLOAT_COLUMNS] = df[FLOAT_COLUMNS].astype(np.float64)
+    return df
+
+
+def metrics_key(task):
+    return "/".join(task)
+
+
+def plan_basin_metrics(manifest, tasks, fingerprints, existing, force=False):
+    """Split the metric tasks into reusable rows and tasks to compute
+
+    Parameters
+    ----------
+    manifest : hydroneimenggu.manifest.Manifest
+        the manifest of the per-basin metrics
+    tasks : list
+        (project, time_unit, basin_id) tuples
+    fingerprints : dict
+        task -> fingerprints of its input files
+    existing : dict
+        (project, time_unit) -> {basin_id: rows} already written
+    force : bool, optional
+        compute every task, ignoring the manifest; by default False
+
+    Returns
+    -------
+    tuple
+        (task -> reused rows, list of the tasks to compute)
+    """
+    reused = {}
+    to_compute = []
+    for task in tasks:
+        key = metrics_key(task)
+        rows = existing.get(task[:2], {}).get(task[2], [])
+        if (
+            not force
+            and manifest.is_fresh(key, fingerprints[task])
+            and manifest.get(key).get("n_rows") == len(rows)
+        ):
+            reused[task] = rows
+        else:
+            to_compute.append(task)
+    return reused, to_compute
+
+
+def record_basin_metrics(manifest, tasks, results, fingerprints):
+    """Record the computed metrics of tasks in the manifest
+
+    Parameters
+    ----------
+    manifest : hydroneimenggu.manifest.Manifest
+        the manifest of the per-basin metrics
+    tasks : list
+        the computed (project, time_unit, basin_id) tuples
+    results : list
+        rows of each task, None for a task that failed
+    fingerprints : dict
+        task -> fingerprints of its input files
+
+    Returns
+    -------
+    dict
+        task -> rows; a failed task has no rows and no manifest entry, so it
+        is computed again on the next run
+    """
+    basin_metrics = {}
+    for task, metrics in zip(tasks, results):
+        key = metrics_key(task)
+        if metrics is None:
+            manifest.pop(key)
+            basin_metrics[task] = []
+            continue
+        manifest.set(key, {"inputs": fingerprints[task], "n_rows": len(metrics)})
+        basin_metrics[task] = metrics
+    return basin_metrics
+
+
+def partition_dir(store_dir, project, time_unit):
+    return os.path.join(store_dir, f"project={project}", f"time_unit={time_unit}")
+
+
+def write_metrics_partition(store_dir, project, time_unit, metrics):
+    """Replace the partition of one project and time unit in the store
+
+    Parameters
+    ----------
+    store_dir : str
+        root folder of the Parquet dataset
+    project : str
+        name of the test project
+    time_unit : str
+        such as "1D" or "3h"
+    metrics : list of dict or pd.DataFrame
+        rows with the columns in METRICS_COLUMNS; empty removes the partition
+    """
+    _require_pyarrow()
+    target = partition_dir(store_dir, project, time_unit)
+    if os.path.exists(target):
+        shutil.rmtree(target)
+    if len(metrics) == 0:
+        return
+    df = typed_metrics_frame(metrics)
+    df["project"] = project
+    df["time_unit"] = time_unit
+    df.to_parquet(
+        store_dir, engine="pyarrow", partition_cols=PARTITION_COLS, index=False
+    )
+
+
+def prune_metrics_partitions(store_dir, keep):
+    """Remove the partitions of the projects and time units not in keep
+
+    Parameters
+    ----------
+    store_dir : str
+        root folder of the Parquet dataset
+    keep : collection
+        the (project, time_unit) pairs whose partitions stay
+
+    Returns
+    -------
+    list
+        the removed (project, time_unit) pairs
+    """
+    if not os.path.isdir(store_dir):
+        return []
+    keep = {(str(project), str(time_unit)) for project, time_unit in keep}
+    removed = []
+    for project_folder in sorted(os.listdir(store_dir)):
+        if not project_folder.startswith("project="):
+            continue
+        project = project_folder[len("project=") :]
+        project_dir = os.path.join(store_dir, project_folder)
+        for unit_folder in sorted(os.listdir(project_dir)):
+            time_unit = unit_folder[len("time_unit=") :]
+            if not unit_folder.startswith("time_unit="):
+                continue
+            if (project, time_unit) not in keep:
+                shutil.rmtree(os.path.join(project_dir, unit_folder))
+                removed.append((project, time_unit))
+        if not os.listdir(project_dir):
+            os.rmdir(project_dir)
+    return removed
+
+
+def load_flow_metrics(store_dir, columns=None, projects=None, time_units=None):
+    """Load event metrics from the store, reading only what is asked for
+
+    Parameters
+    ----------
+    store_dir : str
+        root folder of the Parquet dataset
+    columns : list, optional
+        columns to read; "project" and "time_unit" are always included
+    projects : list, optional
+        only read these projects
+    time_units : list, optional
+        only read these time units
+
+    Returns
+    -------
+    pd.DataFrame
+        the selected metrics
+    """
+    _require_pyarrow()
+    filters = []
+    if projects is not None:
+        filters.append(("project", "in", list(projects)))
+    if time_units is not None:
+        filters.append(("time_unit", "in", list(time_units)))
+    if columns is not None:
+        columns = list(columns) + [col for col in PARTITION_COLS if col not in columns]
+    df = pd.read_parquet(
+        store_dir,
+        engine="pyarrow",
+        columns=columns,
+        filters=filters or None,
+    )
+    for col in PARTITION_COLS:
+        df[col] = df[col].astype(str)
+    return df
@@ -0,0 +1,1094 @@
+"""Rendering many event plots with one figure.
+
+The event plotting scripts used to create a new pyplot figure for every event,
+reload the SimHei font and set rcParams each time, and never close the
+figures, so memory grew with the number of events. :class:`EventPlotRenderer`
+sets the fonts up once, draws on a single Agg figure that is not registered
+with pyplot, and only swaps the data of its artists from one event to the next,
+so rendering thousands of events runs in flat memory. :class:`PanelPlotRenderer`
+draws several periods of one basin, such as the years of a test period, as the
+panels of a single figure. :class:`RenderCache` lets the scripts skip images
+whose inputs have not changed since they were rendered.
+
+:class:`EventPlotJob` lists and renders the event plots of the test projects
+for one target variable, serially or in a process pool; each process opens the
+data files of a project once and keeps one renderer for all its tasks.
+:class:`YearPlotJob` renders the years of the test period of every basin, one
+image per year or one panel per year, reading each basin only once. Both read
+the forcing from the store of the 1h CSVs, aggregated to the time unit of the
+project, when the store exists and has the basin (see
+:func:`~hydroneimenggu.session.find_basin_forcing`).
+
+Long series, such as a year of 1h data, can be drawn downsampled: the flow
+lines are reduced to the min/max envelope of each pixel column
+(:func:`minmax_envelope`) and the precipitation to a step fill of the maximum
+of each column (:func:`bucket_max`) instead of one bar patch per time step.
+Both keep the extremes of every column, so no peak is lost.
+"""
+
+import functools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+import numpy as np
+import pandas as pd
+import xarray as xr
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.font_manager import FontProperties, fontManager
+
+from hydroneimenggu.aggregation import (
+    hourly_store_dir,
+    label_offset,
+    steps_per_period,
+)
+from hydroneimenggu.common import file_fingerprint
+from hydroneimenggu.events import read_basin_events
+from hydroneimenggu.manifest import Manifest
+from hydroneimenggu.session import (
+    OBS_FILE_NAME,
+    PRED_FILE_NAME,
+    ProjectSession,
+    find_basin_forcing,
+    forcing_fingerprint,
+)
+
+DEFAULT_FONT_PATH = os.path.join(os.path.expanduser("~"), ".fonts/SimHei.ttf")
+
+
+@functools.lru_cache(maxsize=None)
+def setup_fonts(font_path=DEFAULT_FONT_PATH):
+    """Register a font as the default font family, once per process
+
+    Parameters
+    ----------
+    font_path : str, optional
+        the font file, by default ~/.fonts/SimHei.ttf
+
+    Returns
+    -------
+    FontProperties
+        properties of the font; the default font if the file does not exist
+    """
+    matplotlib.rcParams["axes.unicode_minus"] = False
+    if not os.path.exists(font_path):
+        print(f"Font {font_path} not found, using the default font")
+        return FontProperties()
+    fontManager.addfont(font_path)
+    font_prop = FontProperties(fname=font_path)
+    matplotlib.rcParams["font.family"] = font_prop.get_name()
+    return font_prop
+
+
+def flow_to_discharge(flow, time_unit, basin_area):
+    """Convert a flow depth in mm per time step to a discharge in m^3/s
+
+    Parameters
+    ----------
+    flow : array-like
+        flow in mm per time step of time_unit
+    time_unit : str
+        such as "1h", "3h" or "1D"
+    basin_area : float
+        basin area in km^2
+
+    Returns
+    -------
+    array-like
+        discharge in m^3/s
+    """
+    return flow / steps_per_period(time_unit) * basin_area / 3.6
+
+
+def _add_flow_lines(ax_flow, show_obs=True):
+    obs_line = None
+    if show_obs:
+        (obs_line,) = ax_flow.plot([], [], color="green", linestyle="-", label="观测值")
+    (pred_line,) = ax_flow.plot([], [], color="red", linestyle="--", label="预测值")
+    return obs_line, pred_line
+
+
+def _set_line_data(line, time, values, n_bins=None):
+    if n_bins is not None:
+        time, values = minmax_envelope(time, values, n_bins)
+    line.set_data(time, values)
+
+
+def _draw_precip_flow(
+    ax_precip, ax_flow, obs_line, pred_line, time, precip, obs, pred, n_bins=None
+):
+    """Draw the precipitation and set the flow lines of one pair of axes
+
+    With n_bins the series are downsampled to that many pixel columns and the
+    precipitation is a step fill instead of bars. Returns the new bars or fill,
+    which the caller removes before drawing again.
+    """
+    time = np.asarray(time, dtype="datetime64[ns]")
+    precip = np.asarray(precip, dtype=float)
+    if n_bins is None:
+        bars = ax_precip.bar(
+            time, precip, width=0.1, color="blue", alpha=0.6, label="Precipitation"
+        )
+    else:
+        bars = _draw_precip_steps(ax_precip, time, precip, n_bins)
+    # precipitation hangs from the top, using about a fifth of the height
+    precip_max = np.nanmax(precip) if precip.size else np.nan
+    if np.isfinite(precip_max) and precip_max > 0:
+        ax_precip.set_ylim(precip_max * 5, 0)
+    else:
+        ax_precip.set_ylim(1, 0)
+    pred = np.asarray(pred, dtype=float)
+    has_flow = np.isfinite(pred).any()
+    _set_line_data(pred_line, time, pred, n_bins)
+    if obs_line is not None:
+        obs = np.asarray(obs, dtype=float)
+        has_flow = has_flow or np.isfinite(obs).any()
+        _set_line_data(obs_line, time, obs, n_bins)
+    # the x axis is shared, so both data limits are reset before autoscaling
+    ax_precip.relim()
+    ax_flow.relim()
+    ax_flow.autoscale_view()
+    ax_precip.autoscale_view(scaley=False)
+    # without data autoscaling keeps the limits of the previous event, so an
+    # empty event gets the limits of an empty new figure instead
+    if not time.size:
+        ax_precip.set_xlim(0, 1)
+    if not has_flow:
+        ax_flow.set_ylim(0, 1)
+    return bars
+
+
+def _buckets(values, n_bins, fill):
+    # consecutive samples grouped into at most n_bins rows of equal length; the
+    # last row is padded with fill
+    size = -(-values.size // n_bins)
+    n_rows = -(-values.size // size)
+    padded = np.full(n_rows * size, fill)
+    padded[: values.size] = values
+    return padded.reshape(n_rows, size), size
+
+
+def minmax_envelope(time, values, n_bins):
+    """Downsample a series to the minimum and maximum of each of n_bins buckets
+
+    The samples are split into n_bins buckets of consecutive time steps, about
+    one per pixel column of the plot, and only the smallest and largest value of
+    each bucket are kept, in time order, with the first and last sample. A line
+    through them covers exactly the same range in every column as the full
+    series, so peaks and troughs are never lost. A bucket without valid values
+    keeps one NaN, which still breaks the line there.
+
+    Parameters
+    ----------
+    time : array-like
+        time steps of the series
+    values : array-like
+        the values; NaN marks missing values
+    n_bins : int
+        number of buckets; series shorter than two samples per bucket are
+        returned unchanged
+
+    Returns
+    -------
+    tuple
+        (time, values) of the kept samples
+    """
+    time = np.asarray(time, dtype="datetime64[ns]")
+    values = np.asarray(values, dtype=float)
+    if values.size <= 2 * n_bins:
+        return time, values
+    finite = np.isfinite(values)
+    low, size = _buckets(np.where(finite, values, np.inf), n_bins, np.inf)
+    high, _ = _buckets(np.where(finite, values, -np.inf), n_bins, -np.inf)
+    starts = np.arange(low.shape[0]) * size
+    keep = np.concatenate(
+        [
+            [0, values.size - 1],
+            starts + low.argmin(axis=1),
+            starts + high.argmax(axis=1),
+        ]
+    )
+    keep = np.unique(keep[keep < values.size])
+    return time[keep], values[keep]
+
+
+def bucket_max(time, values, n_bins):
+    """Downsample a series to the maximum of each of n_bins buckets
+
+    Used for precipitation drawn as steps: each bucket of consecutive time
+    steps becomes one step at the time of its first sample with the largest
+    value of the bucket, so the highest intensities stay visible.
+
+    Parameters
+    ----------
+    time : array-like
+        time steps of the series
+    values : array-like
+        the values; NaN marks missing values
+    n_bins : int
+        number of buckets; shorter series are returned unchanged
+
+    Returns
+    -------
+    tuple
+        (time, values): the start time and the maximum of each bucket, NaN for
+        buckets without valid values
+    """
+    time = np.asarray(time, dtype="datetime64[ns]")
+    values = np.asarray(values, dtype=float)
+    if values.size <= n_bins:
+        return time, values
+    high, size = _buckets(np.where(np.isnan(values), -np.inf, values), n_bins, -np.inf)
+    maxima = high.max(axis=1)
+    maxima[np.isneginf(maxima)] = np.nan
+    return time[::size], maxima
+
+
+def _draw_precip_steps(ax_precip, time, precip, n_bins):
+    time, precip = bucket_max(time, precip, n_bins)
+    if time.size:
+        # the last step lasts as long as the one before it
+        step = time[-1] - time[-2] if time.size > 1 else np.timedelta64(1, "h")
+        time = np.append(time, time[-1] + step)
+        precip = np.append(precip, precip[-1])
+    return ax_precip.fill_between(
+        time, 0, precip, step="post", color="blue", alpha=0.6, linewidth=0
+    )
+
+
+class EventPlotRenderer(object):
+    def __init__(
+        self,
+        flow_label="径流值 (m^3/s)",
+        title="{name}水文站 降雨与径流时序图",
+        font_path=DEFAULT_FONT_PATH,
+        figsize=(10, 6),
+        dpi=100,
+        show_obs=True,
+        downsample=False,
+    ):
+        """Precipitation / observed and predicted flow plot of events
+
+        The figure, its axes, labels and lines are created once; every call of
+        render only replaces the plotted data and saves the figure.
+
+        Parameters
+        ----------
+        flow_label : str, optional
+            label of the flow axis
+        title : str, optional
+            title template, formatted with the station name as ``name``
+        font_path : str, optional
+            font for the Chinese labels, see setup_fonts
+        figsize : tuple, optional
+            figure size in inches, by default (10, 6)
+        dpi : int, optional
+            resolution of the saved images, by default 100
+        show_obs : bool, optional
+            draw the observed flow, by default True; without it only the
+            predictions are plotted
+        downsample : bool, optional
+            reduce the series to the pixel columns of the figure, see
+            minmax_envelope and bucket_max, and draw the precipitation as steps;
+            by default False, every time step is drawn
+        """
+        self.title = title
+        self.dpi = dpi
+        self.n_bins = int(figsize[0] * dpi) if downsample else None
+        self.font_prop = setup_fonts(font_path)
+        self.figure = Figure(figsize=figsize)
+        FigureCanvasAgg(self.figure)
+        self.ax_precip = self.figure.add_subplot(111)
+        self.ax_precip.xaxis_date()
+        self.ax_precip.set_ylabel(
+            "降雨值 (mm)", color="blue", fontproperties=self.font_prop
+        )
+        self.ax_precip.tick_params(axis="y", labelcolor="blue")
+        self.ax_flow = self.ax_precip.twinx()
+        self.ax_flow.set_ylabel(flow_label, color="red", fontproperties=self.font_prop)
+        self.ax_flow.tick_params(axis="y", labelcolor="red")
+        self.obs_line, self.pred_line = _add_flow_lines(self.ax_flow, show_obs)
+        self.ax_flow.legend(loc="upper left", prop=self.font_prop)
+        self.title_text = self.ax_flow.set_title("", fontproperties=self.font_prop)
+        self._bars = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def render(self, output_file, time, precip, obs, pred, name):
+        """Draw one event and save it
+
+        Parameters
+        ----------
+        output_file : str
+            path of the image
+        time : array-like
+            time steps of the event
+        precip, obs, pred : array-like
+            precipitation, observed and predicted flow at the time steps; obs
+            is ignored and may be None when the renderer does not show it
+        name : str
+            station name used in the title
+        """
+        if self._bars is not None:
+            self._bars.remove()
+        self._bars = _draw_precip_flow(
+            self.ax_precip,
+            self.ax_flow,
+            self.obs_line,
+            self.pred_line,
+            time,
+            precip,
+            obs,
+            pred,
+            self.n_bins,
+        )
+        self.title_text.set_text(self.title.format(name=name))
+        self.figure.savefig(output_file, dpi=self.dpi)
+
+    def close(self):
+        """Drop the figure and its artists"""
+        if self.figure is not None:
+            self.figure.clear()
+            self.figure = None
+            self._bars = None
+
+
+class PanelPlotRenderer(object):
+    def __init__(
+        self,
+        flow_label="径流值 (m^3/s)",
+        title="{name}水文站 降雨与径流时序图",
+        font_path=DEFAULT_FONT_PATH,
+        panel_size=(10, 3),
+        dpi=100,
+        show_obs=True,
+        downsample=False,
+    ):
+        """Precipitation / flow plot of several periods of one basin, one panel each
+
+        Every panel has the layout of :class:`EventPlotRenderer`. The number of
+        panels changes from basin to basin, so each call of render draws on a
+        new Agg figure, which is cleared right after it is saved.
+
+        Parameters
+        ----------
+        flow_label, title, font_path, dpi, show_obs, downsample
+            as for EventPlotRenderer
+        panel_size : tuple, optional
+            size of one panel in inches, by default (10, 3)
+        """
+        self.flow_label = flow_label
+        self.title = title
+        self.panel_size = panel_size
+        self.dpi = dpi
+        self.show_obs = show_obs
+        self.n_bins = int(panel_size[0] * dpi) if downsample else None
+        self.font_prop = setup_fonts(font_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def render(self, output_file, panels, name):
+        """Draw the periods of one basin into one image
+
+        Parameters
+        ----------
+        output_file : str
+            path of the image
+        panels : list
+            (label, time, precip, obs, pred) of each period, top to bottom;
+            label is shown as the panel title, the other items are as for
+            EventPlotRenderer.render
+        name : str
+            station name used in the figure title
+        """
+        width, height = self.panel_size
+        figure = Figure(
+            figsize=(width, height * max(len(panels), 1)), constrained_layout=True
+        )
+        FigureCanvasAgg(figure)
+        for i, (label, time, precip, obs, pred) in enumerate(panels):
+            ax_precip = figure.add_subplot(len(panels), 1, i + 1)
+            ax_precip.xaxis_date()
+            ax_precip.set_ylabel(
+                "降雨值 (mm)", color="blue", fontproperties=self.font_prop
+            )
+            ax_precip.tick_params(axis="y", labelcolor="blue")
+            ax_flow = ax_precip.twinx()
+            ax_flow.set_ylabel(
+                self.flow_label, color="red", fontproperties=self.font_prop
+            )
+            ax_flow.tick_params(axis="y", labelcolor="red")
+            obs_line, pred_line = _add_flow_lines(ax_flow, self.show_obs)
+            _draw_precip_flow(
+                ax_precip,
+                ax_flow,
+                obs_line,
+                pred_line,
+                time,
+                precip,
+                obs,
+                pred,
+                self.n_bins,
+            )
+            ax_flow.set_title(str(label), fontproperties=self.font_prop)
+            if i == 0:
+                ax_flow.legend(loc="upper left", prop=self.font_prop)
+        figure.suptitle(self.title.format(name=name), fontproperties=self.font_prop)
+        figure.savefig(output_file, dpi=self.dpi)
+        figure.clear()
+
+    def close(self):
+        """Nothing to release, the figures are not kept between calls"""
+
+
+class RenderCache(object):
+    def __init__(self, manifest_file):
+        """Record of the inputs each generated image was rendered from
+
+        Every image is stored under its path relative to the manifest folder
+        together with its inputs, typically the fingerprints of the data files
+        (see :func:`hydroneimenggu.common.file_fingerprint`), the basin, the
+        time window and the plot parameters. An image whose inputs are
+        unchanged and which still exists does not need to be rendered again.
+
+        Parameters
+        ----------
+        manifest_file : str
+            path of the JSON manifest, usually in the root folder of the images
+        """
+        self.manifest = Manifest(manifest_file)
+        self.root = os.path.dirname(os.path.abspath(manifest_file))
+
+    def _key(self, output_file):
+        return os.path.relpath(os.path.abspath(output_file), self.root)
+
+    @staticmethod
+    def _normalize(inputs):
+        # compare inputs as they come back from the JSON file: tuples become
+        # lists, timestamps and other objects their string form
+        return json.loads(json.dumps(inputs, default=str, sort_keys=True))
+
+    def is_fresh(self, output_file, inputs):
+        """Whether an image exists and was rendered from exactly these inputs"""
+        return os.path.exists(output_file) and self.manifest.is_fresh(
+            self._key(output_file), self._normalize(inputs)
+        )
+
+    def record(self, output_file, inputs):
+        """Remember the inputs of a rendered image; call save() to persist"""
+        self.manifest.set(self._key(output_file), {"inputs": self._normalize(inputs)})
+
+    def save(self):
+        self.manifest.save()
+
+
+@functools.lru_cache(maxsize=8)
+def _read_station_dict(basin_info_file, mtime_ns, size):
+    basin_info = pd.read_csv(basin_info_file)
+    return basin_info.set_index("basin_id")[["name", "basin_area"]].to_dict(
+        orient="index"
+    )
+
+
+def read_station_dict(basin_info_file):
+    """Name and area (km^2) of the stations of a basin_info.csv, by basin id
+
+    The result is cached until the file changes; do not modify it in place.
+    """
+    fingerprint = file_fingerprint(basin_info_file)
+    if fingerprint is None:
+        raise FileNotFoundError(basin_info_file)
+    return _read_station_dict(
+        os.path.abspath(basin_info_file), fingerprint["mtime_ns"], fingerprint["size"]
+    )
+
+
+def event_window(time_unit, time_start, time_end):
+    """Plotted time range of an event; 3h data are labelled one hour later
+
+    The event times are shifted by the label offset of the time unit, see
+    :func:`hydroneimenggu.aggregation.label_offset`.
+    """
+    offset = label_offset(time_unit)
+    return pd.to_datetime(time_start) + offset, pd.to_datetime(time_end) + offset
+
+
+def year_window(time_unit, year):
+    """Plotted time range of a year, January 1 to October 31, see event_window"""
+    return event_window(time_unit, f"{year}-01-01", f"{year}-10-31")
+
+
+# state of each (worker) process: the data files of a project are opened once
+# and one renderer draws all the tasks the process runs
+_worker_sessions = {}
+_worker_renderers = {}
+
+
+def _worker_session(project_dir, time_unit=None):
+    key = (project_dir, time_unit)
+    if key not in _worker_sessions:
+        _worker_sessions[key] = ProjectSession(project_dir, time_unit=time_unit)
+    return _worker_sessions[key]
+
+
+def _worker_renderer(renderer_class, renderer_kwargs):
+    key = (renderer_class.__name__, json.dumps(renderer_kwargs, sort_keys=True))
+    if key not in _worker_renderers:
+        _worker_renderers[key] = renderer_class(**renderer_kwargs)
+    return _worker_renderers[key]
+
+
+def close_worker_state():
+    """Close the project sessions and renderers of this process"""
+    for session in _worker_sessions.values():
+        session.close()
+    _worker_sessions.clear()
+    for renderer in _worker_renderers.values():
+        renderer.close()
+    _worker_renderers.clear()
+
+
+class _ProjectPlotJob(object):
+    # folder of result_dir with the images and their manifest
+    folder = None
+
+    def __init__(
+        self,
+        result_dir,
+        cache_dir,
+        basin_info_file,
+        var,
+        file_label,
+        manifest_name,
+        renderer_kwargs,
+        precip_var,
+    ):
+        self.result_dir = result_dir
+        self.cache_dir = cache_dir
+        self.basin_info_file = basin_info_file
+        self.var = var
+        self.file_label = file_label
+        self.manifest_name = manifest_name
+        self.renderer_kwargs = dict(renderer_kwargs or {})
+        self.precip_var = precip_var
+
+    @property
+    def plot_dir(self):
+        return os.path.join(self.result_dir, self.folder)
+
+    def render_cache(self):
+        return RenderCache(os.path.join(self.plot_dir, self.manifest_name))
+
+    def forcing_file(self, basin_id, time_unit):
+        """The 1h store or the cache file with the forcing of a basin, or None"""
+        nc_file = find_basin_forcing(
+            basin_id, time_unit, self.cache_dir, hourly_store_dir(self.cache_dir)
+        )
+        if nc_file is not None:
+            print(f"Found basin {basin_id} in file: {os.path.basename(nc_file)}")
+        return nc_file
+
+    def _image_name(self, basin_name):
+        return f"{basin_name}_{self.file_label}" if self.file_label else basin_name
+
+
+class EventPlotJob(_ProjectPlotJob):
+    folder = "events"
+
+    def __init__(
+        self,
+        result_dir,
+        cache_dir,
+        basin_info_file,
+        var="streamflow",
+        file_label="",
+        manifest_name="plot_manifest_streamflow.json",
+        renderer_kwargs=None,
+        precip_var="total_precipitation_hourly",
+    ):
+        """Precipitation / observed and predicted plots of the events of test projects
+
+        The events of a basin are read from
+        ``result_dir/events/<basin>/<basin>_1D_events.csv`` and its images are
+        saved in ``result_dir/events/<basin>/<project>/``. A task is the tuple
+        (project, time unit, basin, forcing file, event start, event end,
+        image, inputs); it only holds names, so it is cheap to send to a worker
+        process.
+
+        Parameters
+        ----------
+        result_dir : str
+            folder of the test projects and of the events
+        cache_dir : str
+            torchhydro cache folder of the forcing NetCDF files and of the 1h
+            store, see aggregation.hourly_store_dir
+        basin_info_file : str
+            CSV of the station names and areas, see read_station_dict
+        var : str, optional
+            the plotted variable of the obs/pred files, by default "streamflow"
+        file_label : str, optional
+            added after the station name in the image names, such as
+            "sm_surface"; by default nothing
+        manifest_name : str, optional
+            the RenderCache manifest in result_dir/events
+        renderer_kwargs : dict, optional
+            arguments of EventPlotRenderer; they are part of the inputs of every
+            image, so changing them renders the images again
+        precip_var : str, optional
+            precipitation variable of the forcing files
+        """
+        super(EventPlotJob, self).__init__(
+            result_dir,
+            cache_dir,
+            basin_info_file,
+            var,
+            file_label,
+            manifest_name,
+            renderer_kwargs,
+            precip_var,
+        )
+
+    def output_file(
+        self, project_name, basin_id, basin_name, time_unit, time_start, time_end
+    ):
+        """Path of the image of one event"""
+        time_start, time_end = event_window(time_unit, time_start, time_end)
+        return os.path.join(
+            self.plot_dir,
+            basin_id,
+            project_name,
+            f"{self._image_name(basin_name)}_{time_start}-{time_end}.png",
+        )
+
+    def tasks(self, time_unit, project_name):
+        """The tasks of all events of all basins of a project
+
+        The inputs of a task are the fingerprints of the data files, the
+        basin, the event and the plot parameters, from which RenderCache
+        decides whether the image has to be rendered again.
+        """
+        station_dict = read_station_dict(self.basin_info_file)
+        project_dir = os.path.join(self.result_dir, project_name)
+        project_files = {
+            "obs": file_fingerprint(os.path.join(project_dir, OBS_FILE_NAME)),
+            "pred": file_fingerprint(os.path.join(project_dir, PRED_FILE_NAME)),
+            "basin_info": file_fingerprint(self.basin_info_file),
+        }
+        params = {
+            "var": self.var,
+            "time_unit": time_unit,
+            "renderer": self.renderer_kwargs,
+        }
+        basin_ids = sorted(
+            folder
+            for folder in os.listdir(self.plot_dir)
+            if os.path.isdir(os.path.join(self.plot_dir, folder))
+        )
+        tasks = []
+        for basin_id in basin_ids:
+            nc_file = self.forcing_file(basin_id, time_unit)
+            if nc_file is None:
+                continue
+            if basin_id not in station_dict:
+                print(f"{basin_id} not found in station_dict")
+                continue
+            basin_name = station_dict[basin_id]["name"]
+            files = dict(project_files, cache=forcing_fingerprint(nc_file))
+            events = read_basin_events(
+                os.path.join(self.plot_dir, basin_id, f"{basin_id}_1D_events.csv"),
+                basin_id,
+            )
+            for start_time, end_time in zip(
+                events["BEGINNING_RAIN"], events["END_RAIN"]
+            ):
+                inputs = {
+                    "files": files,
+                    "basin": basin_id,
+                    "forcing": os.path.basename(nc_file),
+                    "window": [str(start_time), str(end_time)],
+                    "params": params,
+                }
+                output_file = self.output_file(
+                    project_name, basin_id, basin_name, time_unit, start_time, end_time
+                )
+                tasks.append(
+                    (
+                        project_name,
+                        time_unit,
+                        basin_id,
+                        nc_file,
+                        start_time,
+                        end_time,
+                        output_file,
+                        inputs,
+                    )
+                )
+        return tasks
+
+    def plot_event(self, renderer, session, task, station_dict):
+        """Draw the event of a task with a renderer and the session of its project
+
+        Returns
+        -------
+        bool
+            whether the image was saved
+        """
+        _, time_unit, basin_id, nc_file, time_start, time_end, output_file = task[:7]
+        time_start, time_end = event_window(time_unit, time_start, time_end)
+        try:
+            if not session.has_basin(basin_id, nc_file):
+                print(f"{basin_id} not found in {nc_file}")
+                return False
+            if basin_id not in station_dict:
+                print(f"{basin_id} not found in station_dict")
+                return False
+            basin_name = station_dict[basin_id]["name"]
+            basin_area = station_dict[basin_id]["basin_area"]
+            # the event is clipped to the time range both obs and pred cover
+            obs_pred_start, obs_pred_end = session.time_bounds(basin_id, self.var)
+            window = slice(max(time_start, obs_pred_start), min(time_end, obs_pred_end))
+            event = session.aligned_basin(
+                basin_id, nc_file, self.precip_var, self.var
+            ).sel(time=window)
+            os.makedirs(os.path.dirname(output_file), exist_ok=True)
+            renderer.render(
+                output_file,
+                event.indexes["time"],
+                event["precip"].values,
+                flow_to_discharge(event["obs"].values, time_unit, basin_area),
+                flow_to_discharge(event["pred"].values, time_unit, basin_area),
+                basin_name,
+            )
+            return True
+        except Exception as e:
+            print(f"An error occurred  {e}")
+            return False
+
+    def _plot_task(self, task):
+        # run in the serial loop and in the worker processes alike
+        return self.plot_event(
+            _worker_renderer(EventPlotRenderer, self.renderer_kwargs),
+            _worker_session(os.path.join(self.result_dir, task[0]), task[1]),
+            task,
+            read_station_dict(self.basin_info_file),
+        )
+
+    def run(self, tasks, workers=1, force=False):
+        """Render the images of tasks that are not up to date
+
+        Parameters
+        ----------
+        tasks : list
+            tasks from the tasks method, possibly of several projects
+        workers : int, optional
+            with more than 1 the tasks are spread over a process pool; in
+            order, so neighbouring events of a basin mostly go to one process
+        force : bool, optional
+            render all the images, even those whose inputs are unchanged
+
+        Returns
+        -------
+        int
+            number of saved images
+        """
+        render_cache = self.render_cache()
+        n_fresh = len(tasks)
+        if not force:
+            tasks = [
+                task for task in tasks if not render_cache.is_fresh(task[6], task[7])
+            ]
+        n_fresh -= len(tasks)
+        print(f"{n_fresh} event plots are up to date, {len(tasks)} to render")
+        begin = time.perf_counter()
+        n_tasks = len(tasks)
+        report_every = max(1, n_tasks // 20)
+        n_saved = 0
+
+        def report(n_done):
+            elapsed = time.perf_counter() - begin
+            print(
+                f"Rendered {n_done}/{n_tasks} events in {elapsed:.1f}s, "
+                f"{n_done / max(elapsed, 1e-9):.1f} per second"
+            )
+
+        if workers > 1 and n_tasks > 1:
+            print(f"Rendering with {workers} processes")
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = executor.map(
+                    self._plot_task,
+                    tasks,
+                    chunksize=max(1, n_tasks // (workers * 8)),
+                )
+                for n_done, (task, saved) in enumerate(zip(tasks, results), 1):
+                    if saved:
+                        n_saved += 1
+                        render_cache.record(task[6], task[7])
+                    if n_done % report_every == 0:
+                        report(n_done)
+        else:
+            try:
+                for n_done, task in enumerate(tasks, 1):
+                    if self._plot_task(task):
+                        n_saved += 1
+                        render_cache.record(task[6], task[7])
+                    if n_done % report_every == 0:
+                        report(n_done)
+            finally:
+                close_worker_state()
+        render_cache.save()
+        elapsed = time.perf_counter() - begin
+        print(
+            f"Saved {n_saved} of {n_tasks} event plots, {n_tasks - n_saved} failed "
+            f"or skipped, in {elapsed:.1f}s with {workers} processes"
+        )
+        return n_saved
+
+
+class YearPlotJob(_ProjectPlotJob):
+    folder = "year"
+
+    def __init__(
+        self,
+        result_dir,
+        cache_dir,
+        basin_info_file,
+        var="streamflow",
+        file_label="",
+        manifest_name="plot_manifest_streamflow.json",
+        renderer_kwargs=None,
+        precip_var="total_precipitation_hourly",
+        panels=False,
+        downsample=False,
+    ):
+        """Precipitation / flow plots of the years of the basins of test projects
+
+        The images of a project are saved in ``result_dir/year/<project>/``:
+        ``<year>/<station>.png`` for one image per year, or
+        ``<station>_<first year>-<last year>.png`` with one panel per year.
+
+        Parameters
+        ----------
+        result_dir, cache_dir, basin_info_file, var, file_label, precip_var
+            as for EventPlotJob
+        manifest_name : str, optional
+            the RenderCache manifest in result_dir/year
+        renderer_kwargs : dict, optional
+            arguments of the renderer, EventPlotRenderer or PanelPlotRenderer;
+            without ``show_obs=False`` the observations are plotted too. They
+            are part of the inputs of every image, so changing them renders
+            the images again
+        panels : bool, optional
+            one image per basin with a panel per year instead of one image per
+            year, by default False
+        downsample : bool, optional
+            downsample the series to the pixel columns of the image, see
+            minmax_envelope and bucket_max; by default False, every time step
+            is drawn
+        """
+        super(YearPlotJob, self).__init__(
+            result_dir,
+            cache_dir,
+            basin_info_file,
+            var,
+            file_label,
+            manifest_name,
+            renderer_kwargs,
+            precip_var,
+        )
+        self.panels = panels
+        self.downsample = downsample
+
+    @property
+    def show_obs(self):
+        return self.renderer_kwargs.get("show_obs", True)
+
+    def inputs(self, time_unit, project_name, basin_id, nc_file, years):
+        """Inputs of the image of some years of a basin, see RenderCache
+
+        The fingerprints of the data files, the basin, the time ranges and the
+        plot parameters, including the renderer settings.
+        """
+        project_dir = os.path.join(self.result_dir, project_name)
+        files = {}
+        if self.show_obs:
+            files["obs"] = file_fingerprint(os.path.join(project_dir, OBS_FILE_NAME))
+        files["pred"] = file_fingerprint(os.path.join(project_dir, PRED_FILE_NAME))
+        files["basin_info"] = file_fingerprint(self.basin_info_file)
+        files["cache"] = None if nc_file is None else forcing_fingerprint(nc_file)
+        windows = [[f"{year}-01-01", f"{year}-10-31"] for year in years]
+        params = {
+            "var": self.var,
+            "time_unit": time_unit,
+            "downsample": self.downsample,
+            "renderer": self.renderer_kwargs,
+        }
+        if self.panels:
+            params["panels"] = True
+        return {
+            "files": files,
+            "basin": basin_id,
+            "forcing": None if nc_file is None else os.path.basename(nc_file),
+            "window": windows if self.panels else windows[0],
+            "params": params,
+        }
+
+    def outputs(self, time_unit, project_name, basin_id, basin_name, nc_file, years):
+        """The images of a basin: {year or None for panels: (image, inputs)}"""
+        project_folder = os.path.join(self.plot_dir, project_name)
+        name = self._image_name(basin_name)
+        if self.panels:
+            return {
+                None: (
+                    os.path.join(project_folder, f"{name}_{years[0]}-{years[-1]}.png"),
+                    self.inputs(time_unit, project_name, basin_id, nc_file, years),
+                )
+            }
+        return {
+            year: (
+                os.path.join(project_folder, year, f"{name}.png"),
+                self.inputs(time_unit, project_name, basin_id, nc_file, [year]),
+            )
+            for year in years
+        }
+
+    def load_basin_years(
+        self, session, nc_file, basin_id, time_unit, years, station_dict
+    ):
+        """Read the series of a basin once and split them into years
+
+        Returns
+        -------
+        list
+            (year, time, precip, obs, pred) of the years with data; obs is None
+            when the observations are not shown, the flows are converted with
+            flow_to_discharge
+        """
+        if nc_file is None or not session.has_basin(basin_id, nc_file):
+            print(f"{basin_id} not found in {nc_file}")
+            return []
+        if basin_id not in station_dict:
+            print(f"{basin_id} not found in station_dict")
+            return []
+        basin_area = station_dict[basin_id]["basin_area"]
+        # the years are sliced from the common time steps of the series in memory
+        if self.show_obs:
+            basin_data = session.aligned_basin(
+                basin_id, nc_file, self.precip_var, self.var
+            )
+        else:
+            pred, precip = xr.align(
+                session.pred_series(basin_id, self.var),
+                session.basin_series(nc_file, basin_id, self.precip_var),
+                join="inner",
+            )
+            basin_data = xr.Dataset({"pred": pred, "precip": precip})
+        year_data = []
+        for year in years:
+            data = basin_data.sel(time=slice(*year_window(time_unit, year)))
+            if data.sizes["time"] == 0:
+                print(f"No data of {basin_id} in {year}")
+                continue
+            obs = None
+            if self.show_obs:
+                obs = flow_to_discharge(data["obs"].values, time_unit, basin_area)
+            year_data.append(
+                (
+                    year,
+                    data.indexes["time"],
+                    data["precip"].values,
+                    obs,
+                    flow_to_discharge(data["pred"].values, time_unit, basin_area),
+                )
+            )
+        return year_data
+
+    def run(self, time_unit, project_name, basin_ids, years, force=False):
+        """Render the images of some years of basins of a project
+
+        The project is opened once and the series of each basin are read once
+        for all its years; images whose inputs are unchanged are skipped.
+
+        Parameters
+        ----------
+        time_unit : str
+            "1D" or "3h"
+        project_name : str
+            the test project folder in result_dir
+        basin_ids : list
+            the basins
+        years : int, str or list
+            one year or several years
+        force : bool, optional
+            render all the images, even those whose inputs are unchanged
+
+        Returns
+        -------
+        int
+            number of saved images
+        """
+        years = [years] if isinstance(years, (int, str)) else list(years)
+        years = [str(year) for year in years]
+        station_dict = read_station_dict(self.basin_info_file)
+        render_cache = self.render_cache()
+        n_saved = 0
+        renderer_class = PanelPlotRenderer if self.panels else EventPlotRenderer
+        session = ProjectSession(
+            os.path.join(self.result_dir, project_name), time_unit=time_unit
+        )
+        renderer = renderer_class(downsample=self.downsample, **self.renderer_kwargs)
+        with session, renderer:
+            for basin_id in basin_ids:
+                if basin_id not in station_dict:
+                    print(f"{basin_id} not found in station_dict")
+                    continue
+                basin_name = station_dict[basin_id]["name"]
+                nc_file = self.forcing_file(basin_id, time_unit)
+                outputs = {
+                    key: (output_file, inputs)
+                    for key, (output_file, inputs) in self.outputs(
+                        time_unit, project_name, basin_id, basin_name, nc_file, years
+                    ).items()
+                    if force or not render_cache.is_fresh(output_file, inputs)
+                }
+                if not outputs:
+                    print(f"The images of {basin_name} are up to date")
+                    continue
+                try:
+                    year_data = self.load_basin_years(
+                        session,
+                        nc_file,
+                        basin_id,
+                        time_unit,
+                        years if self.panels else list(outputs),
+                        station_dict,
+                    )
+                    if self.panels and year_data:
+                        output_file, inputs = outputs[None]
+                        os.makedirs(os.path.dirname(output_file), exist_ok=True)
+                        renderer.render(output_file, year_data, basin_name)
+                        render_cache.record(output_file, inputs)
+                        n_saved += 1
+                    elif not self.panels:
+                        for year, time_index, precip, obs, pred in year_data:
+                            output_file, inputs = outputs[year]
+                            os.makedirs(os.path.dirname(output_file), exist_ok=True)
+                            renderer.render(
+                                output_file, time_index, precip, obs, pred, basin_name
+                            )
+                            render_cache.record(output_file, inputs)
+                            n_saved += 1
+                except Exception as e:
+                    print(f"An error occurred  {e}")
+        render_cache.save()
+        return n_saved
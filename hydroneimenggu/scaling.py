@@ -0,0 +1,162 @@
+"""Normalization of torchhydro's DapengScaler, in NumPy.
+
+A training run saves the statistics of its variables in
+``dapengscaler_stat.json``; :func:`normalize` applies them to new values (or
+inverts them) the way DapengScaler does, so models can be fed and their
+outputs denormalized outside of torchhydro.
+
+Which variables DapengScaler log-transforms, and which it divides by the mean
+precipitation, is set by the ``scaler_params`` of the training configuration.
+torchhydro saves that configuration as a JSON log in the training folder at the
+end of the run; :func:`read_scaler_params` reads it back.
+"""
+
+import functools
+import glob
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+# DapengScaler's own defaults, used when a training folder has no configuration
+# log: variables normalized as log10(sqrt(x) + 0.1) before standardizing; the
+# streamflow is divided by the mean precipitation first
+LOG_NORM_VARIABLES = (
+    "gpm_tp",
+    "sta_tp",
+    "total_precipitation_hourly",
+    "temperature_2m",
+    "dewpoint_temperature_2m",
+    "surface_net_solar_radiation",
+    "sm_surface",
+    "sm_rootzone",
+    "tp",
+    "streamflow",
+)
+PRCP_NORM_VARIABLES = ("streamflow",)
+
+
+@functools.lru_cache(maxsize=None)
+def _read_stat_dict(stat_file, mtime):
+    with open(stat_file, "r") as fp:
+        return json.load(fp)
+
+
+def read_stat_dict(stat_file):
+    """The scaler statistics saved by a training run, read once per file version
+
+    Returns
+    -------
+    dict
+        variable -> [p10, p90, mean, std]
+    """
+    return _read_stat_dict(os.path.abspath(stat_file), os.path.getmtime(stat_file))
+
+
+@functools.lru_cache(maxsize=None)
+def _read_scaler_params(config_file, mtime):
+    with open(config_file, "r") as fp:
+        data_cfgs = json.load(fp)["data_cfgs"]
+    if data_cfgs["scaler"] != "DapengScaler":
+        raise ValueError(f"{config_file} was not trained with DapengScaler")
+    params = data_cfgs["scaler_params"]
+    return {
+        "gamma_norm_cols": tuple(params["gamma_norm_cols"]),
+        "prcp_norm_cols": tuple(params["prcp_norm_cols"]),
+    }
+
+
+def read_scaler_params(train_dir):
+    """The DapengScaler columns of a training run, from its configuration log
+
+    Parameters
+    ----------
+    train_dir : str
+        the training folder, with dapengscaler_stat.json and the JSON logs of
+        the configuration
+
+    Returns
+    -------
+    dict
+        {"gamma_norm_cols": ..., "prcp_norm_cols": ...}, see normalize; None
+        if the folder has no configuration log
+    """
+    configs = []
+    for json_file in glob.glob(os.path.join(train_dir, "*.json")):
+        try:
+            with open(json_file, "r") as fp:
+                if "data_cfgs" in json.load(fp):
+                    configs.append(json_file)
+        except (OSError, ValueError):
+            continue
+    if not configs:
+        print(
+            f"No configuration log in {train_dir}, "
+            "using DapengScaler's default columns"
+        )
+        return None
+    # the latest run, if the folder was trained more than once
+    config_file = os.path.abspath(max(configs, key=os.path.getmtime))
+    return _read_scaler_params(config_file, os.path.getmtime(config_file))
+
+
+def mean_precipitation(yearly_prcp, time_unit):
+    """Mean precipitation per time step (mm) from the yearly precipitation"""
+    return np.asarray(yearly_prcp, dtype=np.float64) / (
+        pd.Timedelta("365D") / pd.Timedelta(time_unit)
+    )
+
+
+def normalize(
+    values, var, stat_dict, mean_prcp=None, to_norm=True, scaler_params=None
+):
+    """DapengScaler's normalization of one variable, or its inverse
+
+    Parameters
+    ----------
+    values : np.ndarray
+        values of var, with the basins on the first axis
+    var : str
+        the variable
+    stat_dict : dict
+        see read_stat_dict
+    mean_prcp : np.ndarray, optional
+        mean precipitation per time step of each basin, needed for the
+        variables divided by it
+    to_norm : bool, optional
+        normalize if True, else denormalize, by default True
+    scaler_params : dict, optional
+        the columns of the training run, see read_scaler_params; by default
+        LOG_NORM_VARIABLES and PRCP_NORM_VARIABLES
+
+    Returns
+    -------
+    np.ndarray
+        the normalized (or denormalized) values
+    """
+    if scaler_params is None:
+        log_norm, prcp_norm = LOG_NORM_VARIABLES, PRCP_NORM_VARIABLES
+    else:
+        prcp_norm = scaler_params["prcp_norm_cols"]
+        log_norm = tuple(scaler_params["gamma_norm_cols"]) + tuple(prcp_norm)
+    _, _, mean, std = stat_dict[var]
+    values = np.asarray(values, dtype=np.float64)
+    if var in prcp_norm:
+        if mean_prcp is None:
+            raise ValueError(f"{var} needs the mean precipitation of the basins")
+        scale = np.asarray(mean_prcp, dtype=np.float64).reshape(
+            (-1,) + (1,) * (values.ndim - 1)
+        )
+    if to_norm:
+        if var in prcp_norm:
+            values = values / scale
+        if var in log_norm:
+            values = np.log10(np.sqrt(np.abs(values)) + 0.1)
+        return (values - mean) / std
+    values = values * std + mean
+    if var in log_norm:
+        values = (np.power(10, values) - 0.1) ** 2
+    if var in prcp_norm:
+        values = values * scale
+    return values
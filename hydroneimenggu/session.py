@@ -0,0 +1,244 @@
+"""Project-level access to the NetCDF results of a torchhydro test run.
+
+A test project folder holds ``epochbest_model.pthflow_obs.nc`` and
+``epochbest_model.pthflow_pred.nc``; the forcing comes from the torchhydro cache
+files. :class:`ProjectSession` opens each of these files once, keeps them open
+and serves basin series from memory, so computing metrics or plotting many
+events of many basins no longer reopens the same files for every event. The
+forcing may also be the folder of a
+:class:`~hydroneimenggu.basin_store.BasinArrayStore`, which is opened
+memory-mapped instead. A session with a time unit serves a store of a finer
+time unit, such as the store of the 1h CSVs, aggregated to it (see
+:func:`~hydroneimenggu.aggregation.get_basin_loader`), so the 3h and 1D forcing
+does not need its own files; :func:`find_basin_forcing` picks that store when
+it has the basin.
+"""
+
+import os
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from hydroneimenggu.aggregation import get_basin_loader
+from hydroneimenggu.basin_store import (
+    DATA_FILE,
+    BasinArrayStore,
+    get_basin_store,
+    is_basin_store,
+)
+from hydroneimenggu.cache_index import find_basin_nc_file
+from hydroneimenggu.common import file_fingerprint
+
+OBS_FILE_NAME = "epochbest_model.pthflow_obs.nc"
+PRED_FILE_NAME = "epochbest_model.pthflow_pred.nc"
+
+
+def find_basin_forcing(basin_id, time_unit, cache_dir, store_dir=None):
+    """Where the forcing of a basin is read from
+
+    Parameters
+    ----------
+    basin_id : str
+        the basin id
+    time_unit : str
+        "1D" or "3h"
+    cache_dir : str
+        the torchhydro cache folder
+    store_dir : str, optional
+        folder of a basin store, such as the 1h store; it is used when it
+        exists and has the basin
+
+    Returns
+    -------
+    str
+        the store folder, otherwise the cache file of the basin; None if
+        neither has the basin
+    """
+    if (
+        store_dir is not None
+        and is_basin_store(store_dir)
+        and get_basin_store(store_dir).has_basin(basin_id)
+    ):
+        return store_dir
+    return find_basin_nc_file(basin_id, time_unit, cache_dir)
+
+
+def forcing_fingerprint(forcing_file):
+    """file_fingerprint of a forcing file, or of the data of a basin store"""
+    if is_basin_store(forcing_file):
+        return file_fingerprint(os.path.join(forcing_file, DATA_FILE))
+    return file_fingerprint(forcing_file)
+
+
+class ProjectSession(object):
+    def __init__(
+        self,
+        project_dir,
+        basin_coord="basin",
+        obs_file_name=OBS_FILE_NAME,
+        pred_file_name=PRED_FILE_NAME,
+        max_cached_basins=8,
+        time_unit=None,
+    ):
+        """Open datasets of one test project once and serve basin slices
+
+        Parameters
+        ----------
+        project_dir : str
+            folder of the test project with the obs/pred NetCDF files
+        basin_coord : str, optional
+            name of the basin coordinate, by default "basin"
+        obs_file_name : str, optional
+            file name of the observations
+        pred_file_name : str, optional
+            file name of the predictions
+        max_cached_basins : int, optional
+            how many basin series are kept in memory, by default 8;
+            the least recently used ones are dropped first
+        time_unit : str, optional
+            time unit of the project, such as "3h"; a basin store of a finer
+            time unit is then aggregated to it. By default stores are served as
+            they are
+        """
+        self.project_dir = project_dir
+        self.basin_coord = basin_coord
+        self.obs_file = os.path.join(project_dir, obs_file_name)
+        self.pred_file = os.path.join(project_dir, pred_file_name)
+        self.max_cached_basins = max_cached_basins
+        self.time_unit = time_unit
+        self._datasets = {}
+        self._basin_cache = OrderedDict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __getstate__(self):
+        # open file handles cannot be pickled; a copy sent to another process
+        # reopens the files the first time it needs them
+        state = self.__dict__.copy()
+        state["_datasets"] = {}
+        state["_basin_cache"] = OrderedDict()
+        return state
+
+    def dataset(self, file_path):
+        """The opened dataset of a file or store; each is opened only once"""
+        if file_path not in self._datasets:
+            if is_basin_store(file_path):
+                self._datasets[file_path] = BasinArrayStore(
+                    file_path, basin_coord=self.basin_coord
+                ).to_dataset()
+            else:
+                self._datasets[file_path] = xr.open_dataset(file_path)
+        return self._datasets[file_path]
+
+    @property
+    def obs(self):
+        return self.dataset(self.obs_file)
+
+    @property
+    def pred(self):
+        return self.dataset(self.pred_file)
+
+    def has_basin(self, basin_id, file_path=None):
+        """Whether a basin is in a dataset, by default in the observations"""
+        if file_path is not None and is_basin_store(file_path):
+            return get_basin_store(file_path).has_basin(basin_id)
+        ds = self.obs if file_path is None else self.dataset(file_path)
+        return basin_id in ds.indexes[self.basin_coord]
+
+    def _cached(self, key, loader):
+        if key in self._basin_cache:
+            self._basin_cache.move_to_end(key)
+            return self._basin_cache[key]
+        value = loader()
+        self._basin_cache[key] = value
+        while len(self._basin_cache) > self.max_cached_basins:
+            self._basin_cache.popitem(last=False)
+        return value
+
+    def basin_series(self, file_path, basin_id, var):
+        """The full series of a variable for one basin, loaded into memory
+
+        Parameters
+        ----------
+        file_path : str
+            the NetCDF file, one of obs_file, pred_file or a forcing cache file,
+            or the folder of a basin array store, see find_basin_forcing
+        basin_id : str
+            the basin id
+        var : str
+            the variable name
+
+        Returns
+        -------
+        xr.DataArray
+            series along time
+        """
+        if self.time_unit is not None and is_basin_store(file_path):
+            return self._cached(
+                (file_path, basin_id, var),
+                lambda: self._store_series(file_path, basin_id, var),
+            )
+        return self._cached(
+            (file_path, basin_id, var),
+            lambda: self.dataset(file_path)[var]
+            .sel({self.basin_coord: basin_id})
+            .load(),
+        )
+
+    def _store_series(self, store_dir, basin_id, var):
+        """A series of a basin store, aggregated to time_unit when it is finer"""
+        store = get_basin_store(store_dir, basin_coord=self.basin_coord)
+        loader = get_basin_loader(
+            store, self.time_unit, base_time_unit=store.time_step or self.time_unit
+        )
+        time, values = loader.basin_values(basin_id, [var])
+        return xr.DataArray(
+            np.array(values[:, 0]),
+            dims="time",
+            coords={"time": time, self.basin_coord: basin_id},
+            name=var,
+        )
+
+    def obs_series(self, basin_id, var="streamflow"):
+        return self.basin_series(self.obs_file, basin_id, var)
+
+    def pred_series(self, basin_id, var="streamflow"):
+        return self.basin_series(self.pred_file, basin_id, var)
+
+    def aligned_basin(self, basin_id, forcing_file, precip_var, var="streamflow"):
+        """Observations, predictions and precipitation of a basin on common time steps
+
+        Returns
+        -------
+        xr.Dataset
+            with the variables "obs", "pred" and "precip"
+        """
+        obs, pred, precip = xr.align(
+            self.obs_series(basin_id, var),
+            self.pred_series(basin_id, var),
+            self.basin_series(forcing_file, basin_id, precip_var),
+            join="inner",
+        )
+        return xr.Dataset({"obs": obs, "pred": pred, "precip": precip})
+
+    def time_bounds(self, basin_id, var="streamflow"):
+        """The common time range of observations and predictions of a basin"""
+        obs_time = self.obs_series(basin_id, var).indexes["time"]
+        pred_time = self.pred_series(basin_id, var).indexes["time"]
+        return (
+            max(pd.Timestamp(obs_time.min()), pd.Timestamp(pred_time.min())),
+            min(pd.Timestamp(obs_time.max()), pd.Timestamp(pred_time.max())),
+        )
+
+    def close(self):
+        """Close all opened datasets and drop the cached basin series"""
+        for ds in self._datasets.values():
+            ds.close()
+        self._datasets = {}
+        self._basin_cache.clear()
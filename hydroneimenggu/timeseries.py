@@ -0,0 +1,341 @@
+"""Reading the per-basin timeseries CSVs of DATASET_DIR/timeseries/<time unit>.
+
+Each CSV has a ``time`` column and one column per variable, such as
+``streamflow`` and ``total_precipitation_hourly``. The readers here parse only
+the requested columns, with explicit float dtypes and a fixed datetime format,
+and return the variables as rows of one array, so that callers can hand out
+views of it instead of copies. When ``pyarrow`` is installed it is used as the
+(multi-threaded) CSV parser, which also parses the ISO times itself.
+
+:class:`TimeseriesCache` goes one step further and converts the CSVs of a time
+unit once into memory-mappable ``.npy`` arrays, so that loading a basin is a
+page-in instead of a parse.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from hydroneimenggu.common import file_fingerprint
+from hydroneimenggu.memmap_store import MemmapStore
+
+TIME_COL = "time"
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+TIME_FILE = "time.npy"
+PRESENT_FILE = "present.npy"
+VARIABLES_DIR = "variables"
+
+
+def _csv_engine():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return "c"
+    return "pyarrow"
+
+
+def parse_times(values, time_format=TIME_FORMAT):
+    """Parse time strings with a fixed format
+
+    Parameters
+    ----------
+    values : array-like of str
+        the time strings; values already parsed to datetime64 are kept
+    time_format : str, optional
+        strftime format of the strings, by default "%Y-%m-%d %H:%M:%S";
+        strings that do not follow it (e.g. dates only) are parsed generically
+
+    Returns
+    -------
+    pd.DatetimeIndex
+        the parsed times
+    """
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.datetime64):
+        return pd.DatetimeIndex(values)
+    try:
+        return pd.DatetimeIndex(pd.to_datetime(values, format=time_format))
+    except (TypeError, ValueError):
+        return pd.DatetimeIndex(pd.to_datetime(values))
+
+
+def read_timeseries_csv(csv_file_path, variables, time_format=TIME_FORMAT):
+    """Read the time axis and some variables of a basin timeseries CSV
+
+    Parameters
+    ----------
+    csv_file_path : str
+        path of the CSV
+    variables : list
+        names of the variable columns to read; the other columns are skipped
+    time_format : str, optional
+        format of the time column, see parse_times
+
+    Returns
+    -------
+    tuple
+        (time, values): time is a pd.DatetimeIndex and values a float64 array of
+        shape (len(variables), n_time), one contiguous row per variable
+    """
+    variables = list(variables)
+    engine = _csv_engine()
+    # both parsers then read every number to the closest float64
+    options = {"float_precision": "round_trip"} if engine == "c" else {}
+    df = pd.read_csv(
+        csv_file_path,
+        usecols=[TIME_COL] + variables,
+        dtype={var: np.float64 for var in variables},
+        engine=engine,
+        **options,
+    )
+    time = parse_times(df[TIME_COL].to_numpy(), time_format)
+    values = np.ascontiguousarray(df[variables].to_numpy(dtype=np.float64).T)
+    return time, values
+
+
+def _variable_file(variable):
+    return os.path.join(VARIABLES_DIR, f"{variable}.npy")
+
+
+def _csv_files(csv_dir):
+    return {
+        os.path.splitext(file_name)[0]: os.path.join(csv_dir, file_name)
+        for file_name in sorted(os.listdir(csv_dir))
+        if file_name.endswith(".csv")
+    }
+
+
+class TimeseriesCache(MemmapStore):
+    entry_key = "cache"
+
+    def __init__(self, csv_dir, cache_dir, refresh=True):
+        """Binary columnar cache of the basin timeseries CSVs of one time unit
+
+        The CSVs of ``csv_dir`` (one per basin) are converted once into
+        ``cache_dir/time.npy``, the time axis shared by all basins, one
+        ``cache_dir/variables/<variable>.npy`` per variable with shape
+        (basin, time), NaN where a basin has no row, and
+        ``cache_dir/present.npy`` marking the rows each CSV has. The arrays are
+        opened memory-mapped, so loading one basin only reads its pages. The
+        cache is rebuilt when a CSV is added, removed or modified; the series
+        of the unchanged CSVs are then copied from the previous cache instead
+        of being parsed again.
+
+        Parameters
+        ----------
+        csv_dir : str
+            folder with the CSVs, such as DATASET_DIR/timeseries/1h
+        cache_dir : str
+            folder of the cache files
+        refresh : bool, optional
+            rebuild a stale cache right away, by default True
+        """
+        super(TimeseriesCache, self).__init__(cache_dir)
+        self.csv_dir = csv_dir
+        self._arrays = {}
+        self._time = None
+        if refresh:
+            self.refresh()
+
+    @property
+    def cache_dir(self):
+        return self.store_dir
+
+    def source_fingerprints(self):
+        return {
+            basin: file_fingerprint(csv_file)
+            for basin, csv_file in _csv_files(self.csv_dir).items()
+        }
+
+    def _unchanged_basins(self, inputs, previous):
+        # basins whose CSV has not changed since the current cache was built
+        if previous is None or not os.path.exists(
+            os.path.join(self.cache_dir, PRESENT_FILE)
+        ):
+            return set()
+        return {
+            basin
+            for basin in previous["basins"]
+            if inputs.get(basin) is not None
+            and previous["inputs"].get(basin) == inputs[basin]
+        }
+
+    def _write(self, tmp_dir, inputs, previous):
+        csv_files = _csv_files(self.csv_dir)
+        basins = list(csv_files)
+        # the series of unchanged basins are copied from the current cache,
+        # only the CSVs that were added or modified are parsed
+        unchanged = self._unchanged_basins(inputs, previous)
+        # first pass: the header and time axis of every basin
+        variables = []
+        basin_times = {}
+        for basin, csv_file in csv_files.items():
+            columns = pd.read_csv(csv_file, nrows=0).columns
+            variables += [
+                col for col in columns if col != TIME_COL and col not in variables
+            ]
+            if basin in unchanged:
+                basin_times[basin], _ = self.basin_arrays(basin, [])
+                continue
+            basin_times[basin] = parse_times(
+                pd.read_csv(csv_file, usecols=[TIME_COL], engine=_csv_engine())[
+                    TIME_COL
+                ].to_numpy()
+            )
+        time = np.unique(
+            np.concatenate(
+                [np.array([], dtype="datetime64[ns]")]
+                + [
+                    times.to_numpy(dtype="datetime64[ns]")
+                    for times in basin_times.values()
+                ]
+            )
+        )
+        os.makedirs(os.path.join(tmp_dir, VARIABLES_DIR))
+        np.save(os.path.join(tmp_dir, TIME_FILE), time)
+        arrays = {
+            var: np.lib.format.open_memmap(
+                os.path.join(tmp_dir, _variable_file(var)),
+                mode="w+",
+                dtype=np.float64,
+                shape=(len(basins), time.size),
+            )
+            for var in variables
+        }
+        for array in arrays.values():
+            array[:] = np.nan
+        present = np.lib.format.open_memmap(
+            os.path.join(tmp_dir, PRESENT_FILE),
+            mode="w+",
+            dtype=bool,
+            shape=(len(basins), time.size),
+        )
+        # second pass: the values, written row by row
+        ranges = {}
+        for row, (basin, csv_file) in enumerate(csv_files.items()):
+            columns = [
+                col for col in pd.read_csv(csv_file, nrows=0).columns if col in arrays
+            ]
+            if basin in unchanged:
+                basin_time, values = self.basin_arrays(basin, columns)
+            else:
+                basin_time, values = read_timeseries_csv(csv_file, columns)
+            positions = np.searchsorted(
+                time, basin_time.to_numpy(dtype="datetime64[ns]")
+            )
+            present[row, positions] = True
+            for var, var_values in zip(columns, values):
+                arrays[var][row, positions] = var_values
+            ranges[basin] = (
+                [int(positions.min()), int(positions.max()) + 1]
+                if positions.size
+                else [0, 0]
+            )
+        for array in list(arrays.values()) + [present]:
+            array.flush()
+        del arrays, present
+        return {"basins": basins, "variables": variables, "ranges": ranges}
+
+    @property
+    def basins(self):
+        return self._entry["basins"]
+
+    @property
+    def variables(self):
+        return self._entry["variables"]
+
+    @property
+    def time(self):
+        """The time axis shared by all basins"""
+        if self._time is None:
+            self._time = pd.DatetimeIndex(
+                np.load(os.path.join(self.cache_dir, TIME_FILE))
+            )
+        return self._time
+
+    @property
+    def present(self):
+        """(basin, time) boolean array, True where the CSV of a basin has a row"""
+        if PRESENT_FILE not in self._arrays:
+            self._arrays[PRESENT_FILE] = np.load(
+                os.path.join(self.cache_dir, PRESENT_FILE), mmap_mode="r"
+            )
+        return self._arrays[PRESENT_FILE]
+
+    def array(self, variable):
+        """The read-only memory-mapped (basin, time) array of a variable"""
+        if variable not in self._arrays:
+            self._arrays[variable] = np.load(
+                os.path.join(self.cache_dir, _variable_file(variable)), mmap_mode="r"
+            )
+        return self._arrays[variable]
+
+    def basin_arrays(self, basin_id, variables):
+        """The time axis and variables of one basin, as in its CSV
+
+        Parameters
+        ----------
+        basin_id : str
+            the basin, i.e. the CSV file name without ".csv"
+        variables : list
+            the variables to load
+
+        Returns
+        -------
+        tuple
+            (time, values): time is a pd.DatetimeIndex covering the rows of the
+            basin's CSV and values a float64 array of shape
+            (len(variables), n_time)
+        """
+        entry = self._entry
+        row = entry["basins"].index(basin_id)
+        start, stop = entry["ranges"][basin_id]
+        present = np.asarray(self.present[row, start:stop])
+        time = self.time[start:stop][present]
+        values = np.empty((len(variables), time.size))
+        for i, var in enumerate(variables):
+            values[i] = self.array(var)[row, start:stop][present]
+        return time, values
+
+    def load_basin(self, basin_id, variables=None):
+        """One basin as a DataFrame indexed by time; all variables by default"""
+        variables = self.variables if variables is None else list(variables)
+        time, values = self.basin_arrays(basin_id, variables)
+        return pd.DataFrame(
+            dict(zip(variables, values)), index=pd.DatetimeIndex(time, name=TIME_COL)
+        )
+
+    def close(self):
+        self._arrays = {}
+        self._time = None
+
+
+_timeseries_caches = {}
+
+
+def get_timeseries_cache(csv_dir, cache_dir, refresh=True):
+    """The TimeseriesCache of a CSV folder, shared within a process
+
+    Checking the CSVs stats every file, so it is done only the first time a
+    process opens the cache; call its refresh method to check them again.
+
+    Parameters
+    ----------
+    csv_dir : str
+        folder with the CSVs of one time unit
+    cache_dir : str
+        folder of the cache files
+    refresh : bool, optional
+        rebuild a stale cache when it is first opened, by default True; worker
+        processes pass False and use the cache their parent refreshed
+
+    Returns
+    -------
+    TimeseriesCache
+        the cache
+    """
+    key = (os.path.abspath(csv_dir), os.path.abspath(cache_dir))
+    if key not in _timeseries_caches:
+        _timeseries_caches[key] = TimeseriesCache(csv_dir, cache_dir, refresh=refresh)
+    return _timeseries_caches[key]
@@ -0,0 +1,132 @@
+"""
+对比 DMCA-ESR 第一、二步（响应时间与涨落序列）两种实现的耗时：
+原 notebook 中逐窗口调用 movmean（两次 np.convolve）的实现，
+与 hydroneimenggu.dmca_esr 中基于累积和、按时间分块计算所有窗口的实现。
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from hydroneimenggu.dmca_esr import (
+    movmean,
+    step1_step2_tr_and_fluctuations_timeseries,
+)
+
+
+def step1_step2_by_convolution(rain, flow, rain_min, max_window):
+    """notebook 中的原实现：每个窗口单独做滑动平均"""
+    rain_int = np.nancumsum(rain)
+    flow_int = np.nancumsum(flow)
+    T = rain.size
+    rho = np.empty((max_window - 1) // 2)
+    fluct_rain = np.empty(((max_window - 1) // 2, T))
+    fluct_flow = np.empty(((max_window - 1) // 2, T))
+    for window in np.arange(3, max_window + 1, 2):
+        int_index = int((window - 1) / 2 - 1)
+        start_slice = int(window - 0.5 * (window - 1))
+        dst_slice = int(T - 0.5 * (window - 1))
+        fluct_rain[int_index] = rain_int - movmean(rain_int, window)
+        fluct_flow[int_index] = flow_int - movmean(flow_int, window)
+        fr = fluct_rain[int_index, start_slice:dst_slice]
+        ff = fluct_flow[int_index, start_slice:dst_slice]
+        n = T - window + 1
+        rho[int_index] = (np.nansum(fr * ff) / n) / (
+            np.sqrt(np.nansum(fr**2) / n) * np.sqrt(np.nansum(ff**2) / n)
+        )
+    pos_min = np.argmin(rho)
+    return pos_min + 1, fluct_rain[pos_min], fluct_flow[pos_min]
+
+
+def synthetic_series(length, seed=0):
+    """生成带暴雨过程的小时降雨及其对应的径流序列"""
+    rng = np.random.default_rng(seed)
+    rain = np.zeros(length)
+    for start in rng.integers(0, length, max(length // 150, 1)):
+        duration = int(rng.integers(1, 36))
+        rain[start : start + duration] += rng.gamma(
+            1.5, 1.5, size=rain[start : start + duration].size
+        )
+    kernel = np.exp(-np.arange(240) / 30.0)
+    flow = np.convolve(rain, kernel / kernel.sum())[:length] * 0.3 + 0.02
+    return rain, flow
+
+
+def timed(func, *args, repeat=1):
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def run_benchmark(lengths, max_windows, rain_min=0.001, max_loop_length=200000):
+    rows = []
+    for length in lengths:
+        rain, flow = synthetic_series(length)
+        for max_window in max_windows:
+            fast_seconds, (tr_fast, *_) = timed(
+                step1_step2_tr_and_fluctuations_timeseries,
+                rain,
+                flow,
+                rain_min,
+                max_window,
+            )
+            # 原实现在长序列上非常慢，超过 max_loop_length 时跳过
+            if length <= max_loop_length:
+                loop_seconds, (tr_loop, *_) = timed(
+                    step1_step2_by_convolution, rain, flow, rain_min, max_window
+                )
+            else:
+                loop_seconds, tr_loop = np.nan, None
+            rows.append(
+                {
+                    "length": length,
+                    "max_window": max_window,
+                    "convolution_s": loop_seconds,
+                    "cumsum_s": fast_seconds,
+                    "speedup": loop_seconds / fast_seconds,
+                    "same_Tr": tr_loop == tr_fast if tr_loop is not None else None,
+                }
+            )
+            print(
+                f"长度 {length:>8d}  max_window {max_window:>4d}  "
+                f"卷积 {loop_seconds:8.3f}s  累积和 {fast_seconds:8.3f}s"
+            )
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="DMCA-ESR 涨落序列计算耗时对比")
+    parser.add_argument(
+        "--lengths",
+        type=int,
+        nargs="+",
+        default=[8760, 87600, 350400],
+        help="序列长度（时段数），默认为 1、10、40 年的小时序列",
+    )
+    parser.add_argument(
+        "--max_windows",
+        type=int,
+        nargs="+",
+        default=[51, 101, 151],
+        help="最大窗口",
+    )
+    parser.add_argument(
+        "--max_loop_length",
+        type=int,
+        default=200000,
+        help="原实现只在不超过该长度的序列上计时",
+    )
+    parser.add_argument("--output", default=None, help="结果 CSV 的保存路径")
+    args = parser.parse_args()
+    result = run_benchmark(
+        args.lengths, args.max_windows, max_loop_length=args.max_loop_length
+    )
+    print(result.to_string(index=False))
+    if args.output is not None:
+        result.to_csv(args.output, index=False)
+        print(f"结果已保存到 {args.output}")
@@ -0,0 +1,185 @@
+"""
+在 CPU 上测试训练好的 Seq2Seq 模型的预报耗时：模型权重和归一化统计量只加载一次，
+所有流域截至预报时刻的输入窗口组成一个批次，不计算梯度，一次前向计算得到所有流域的预报。
+指定 --cycles 时再测试流式预报：每个时段只追加最新数据，在滚动缓冲区上直接预报。
+
+示例：
+    python bench_inference.py --time_unit 3h --issue_time "2020-08-01 01:00"
+"""
+
+import argparse
+import glob
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from definitions import RESULT_DIR
+from torchhydro import CACHE_DIR
+from hydroneimenggu.basin_store import get_basin_store, time_unit_sources
+from hydroneimenggu.experiments import (
+    GAGE_FILES,
+    TASKS,
+    TEST_GAGE_FILE,
+    TIME_UNITS,
+    read_gage_ids,
+)
+from hydroneimenggu.attributes import (
+    MEAN_PRCP_ATTRIBUTE,
+    get_attribute_cache,
+    read_basin_attributes,
+)
+from hydroneimenggu.inference import Seq2SeqForecaster, StreamingForecast
+
+
+def read_windows(store, basin_ids, variables, end, length):
+    """各流域截至 end 的最后 length 个时段，形状为 (流域, 时段, 变量)"""
+    windows = []
+    for basin_id in basin_ids:
+        _, values = store.basin_values(basin_id, variables, end=end)
+        windows.append(values[-length:])
+    return np.stack(windows)
+
+
+def latest_windows(store, basin_ids, variables, issue_time, history, horizon):
+    """
+    各流域截至预报时刻的输入窗口：历史和预见期的降雨 (流域, history + horizon)，
+    以及比降雨早一个时段的其他历史驱动 {变量: (流域, history)}。
+    预见期的降雨取数据集中的实际降雨。
+    """
+    step = store.time[1] - store.time[0]
+    end = pd.Timestamp(issue_time) + horizon * step
+    windows = read_windows(store, basin_ids, variables, end, history + horizon + 1)
+    precip = windows[:, 1:, 0]
+    forcings = {var: windows[:, :history, i] for i, var in enumerate(variables) if i}
+    return precip, forcings
+
+
+def run_benchmark(forecaster, precip, forcings, basin_ids, repeat):
+    # 第一次调用包含加载模型的时间，单独报告
+    forecaster.forecast(basin_ids, precip, forcings)
+    print(f"首次预报（含加载模型）：{forecaster.last_latency['total'] * 1000:.1f} ms")
+    rows = []
+    for _ in range(repeat):
+        forecaster.forecast(basin_ids, precip, forcings)
+        rows.append(forecaster.last_latency)
+    latency = pd.DataFrame(rows) * 1000
+    print(f"{len(basin_ids)} 个流域，{repeat} 次预报的耗时（ms）：")
+    print(latency.describe().loc[["min", "50%", "mean", "max"]].round(2))
+    return latency
+
+
+def run_streaming_benchmark(
+    forecaster, store, basin_ids, variables, issue_time, cycles
+):
+    """
+    流式预报：在预报时刻用 history + 1 个时段初始化滚动缓冲区，之后每个时段只追加
+    最新一个时段的数据并预报，报告每个时段的耗时。
+    """
+    history, horizon = forecaster.history, forecaster.horizon
+    step = store.time[1] - store.time[0]
+    issue_time = pd.Timestamp(issue_time)
+    windows = read_windows(
+        store,
+        basin_ids,
+        variables,
+        issue_time + (cycles + horizon) * step,
+        history + 1 + cycles + horizon,
+    )
+    stream = StreamingForecast(
+        forecaster,
+        basin_ids,
+        issue_time,
+        windows[:, : history + 1, 0],
+        {var: windows[:, : history + 1, i] for i, var in enumerate(variables) if i},
+    )
+    rows = []
+    for cycle in range(cycles):
+        end = history + 1 + cycle
+        begin = time.perf_counter()
+        stream.append(
+            issue_time + (cycle + 1) * step,
+            windows[:, end, 0],
+            {var: windows[:, end, i] for i, var in enumerate(variables) if i},
+        )
+        stream.forecast(windows[:, end + 1 : end + 1 + horizon, 0])
+        rows.append(dict(forecaster.last_latency, cycle=time.perf_counter() - begin))
+    latency = pd.DataFrame(rows) * 1000
+    print(f"{len(basin_ids)} 个流域，流式预报 {cycles} 个时段的耗时（ms）：")
+    print(latency.describe().loc[["min", "50%", "mean", "max"]].round(2))
+    return latency
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seq2Seq 模型 CPU 批量预报耗时")
+    parser.add_argument(
+        "--dataset",
+        default="nmg",
+        choices=list(GAGE_FILES),
+        help="模型的训练数据集，默认 nmg",
+    )
+    parser.add_argument(
+        "--time_unit", default="3h", choices=list(TIME_UNITS), help="时间单位，默认 3h"
+    )
+    parser.add_argument(
+        "--task", default="mtlflowssm", choices=list(TASKS), help="任务，默认 mtlflowssm"
+    )
+    parser.add_argument(
+        "--issue_time", default="2020-08-01 01:00", help="预报时刻，默认 2020-08-01 01:00"
+    )
+    parser.add_argument(
+        "--attr_file",
+        default=None,
+        help="流域属性 .nc 文件，默认 CACHE_DIR 中第一个 *attributes.nc",
+    )
+    parser.add_argument("--repeat", type=int, default=20, help="重复预报次数，默认 20")
+    parser.add_argument(
+        "--cycles",
+        type=int,
+        default=0,
+        help="大于 0 时再测试流式预报：从预报时刻起逐时段追加数据并预报的时段数",
+    )
+    parser.add_argument(
+        "--n_threads", type=int, default=None, help="torch 使用的 CPU 线程数"
+    )
+    args = parser.parse_args()
+
+    basin_ids = list(read_gage_ids(TEST_GAGE_FILE))
+    attr_file = args.attr_file or sorted(
+        glob.glob(os.path.join(CACHE_DIR, "*attributes.nc"))
+    )[0]
+    forecaster = Seq2SeqForecaster.from_experiment(
+        args.dataset,
+        args.time_unit,
+        args.task,
+        RESULT_DIR,
+        read_basin_attributes(attr_file, basin_ids, [MEAN_PRCP_ATTRIBUTE]),
+        n_threads=args.n_threads,
+        # 归一化后的流域属性矩阵缓存在 CACHE_DIR/attribute_matrix 中，统计量变化时重新计算
+        attribute_cache=get_attribute_cache(
+            os.path.join(CACHE_DIR, "attribute_matrix"), attr_file
+        ),
+    )
+    store = get_basin_store(
+        os.path.join(CACHE_DIR, "basin_store", args.time_unit),
+        time_unit_sources(args.time_unit, cache_dir=CACHE_DIR),
+    )
+    precip, forcings = latest_windows(
+        store,
+        basin_ids,
+        TASKS[args.task]["var_t"],
+        args.issue_time,
+        forecaster.history,
+        forecaster.horizon,
+    )
+    run_benchmark(forecaster, precip, forcings, basin_ids, args.repeat)
+    if args.cycles > 0:
+        run_streaming_benchmark(
+            forecaster,
+            store,
+            basin_ids,
+            TASKS[args.task]["var_t"],
+            args.issue_time,
+            args.cycles,
+        )
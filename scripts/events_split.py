@@ -7,14 +7,22 @@ FilePath: /HydroNeimeng/events.py
 Description: 这是默认设置,请设置`customMade`, 打开koroFileHeader查看配置 进行设置: https://github.com/OBKoro1/koro1FileHeader/wiki/%E9%85%8D%E7%BD%AE
 """
 
+import argparse
 import numpy as np
 import pandas as pd
 import re
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pint import UnitRegistry
 from sklearn.model_selection import KFold
 import xarray as xr
-from hydrodatasource.cleaner.dmca_esr import rainfall_runoff_event_identify
+from hydroneimenggu.aggregation import get_basin_loader, hourly_store_dir
+from hydroneimenggu.basin_store import get_basin_store, time_unit_sources
+from hydroneimenggu.common import trace_peak_memory
+from hydroneimenggu.dmca_esr import rainfall_runoff_event_identify
+from hydroneimenggu.timeseries import get_timeseries_cache, read_timeseries_csv
 from definitions import DATASET_DIR, PROJECT_DIR, RESULT_DIR
+from torchhydro import CACHE_DIR
 import xarray as xr
 import os
 
@@ -49,93 +57,270 @@ def get_rr_events(rain, flow, basin_name):
     print(f"flow.units = {flow.units}, multiple = {multiple}")
 
     rr_events = {}
-    try:
-        rr_event = rainfall_runoff_event_identify(
-            rain.to_series(),
-            flow.to_series(),
-        )
-    except Exception as e:
-        print(f"Error processing {basin_name}: {e}")
-        return None
+    # 出错时直接抛出，由 split_basin_events 记录该流域的失败信息
+    rr_event = rainfall_runoff_event_identify(
+        rain.to_series(),
+        flow.to_series(),
+    )
     rr_events[basin_name] = rr_event
 
     return rr_events
 
 
-def read_data_from_csv(csv_file_path, units):
-
+def read_data_from_csv(
+    csv_file_path,
+    units,
+    report_memory=False,
+    cache_dir=None,
+    store_dir=None,
+    time_unit="1h",
+):
+    """
+    读取流域的降雨和流量序列。
+    只解析 time、streamflow、total_precipitation_hourly 三列，并指定数据类型和时间格式；
+    降雨和流量是同一个数组的两行，返回的 DataArray 直接引用该数组，不再复制。
+    :param report_memory: 为 True 时打印读取过程的耗时和峰值内存
+    :param cache_dir: 二进制缓存目录；给定时从缓存中读取（由主进程检查 CSV 并更新缓存），不再解析 CSV
+    :param store_dir: 1h 数据的内存映射数组库目录；给定时从中读取，time_unit 不是 1h 时
+        由 1h 序列现场累加（流量、降雨）或平均（其他变量）得到
+    :param time_unit: 时间尺度，只在给定 store_dir 时使用
+    """
     basename = os.path.basename(csv_file_path)
     basin_name = os.path.splitext(basename)[0]
-    df = pd.read_csv(csv_file_path)
-    df["time"] = pd.to_datetime(df["time"])
-    df.set_index("time", inplace=True)
-
-    # 去掉流量为空的点
-    df_with_flow = df.dropna(subset=["streamflow"])
-
-    rain = xr.DataArray(
-        df_with_flow["total_precipitation_hourly"].values,
-        dims="time",
-        coords={"time": df_with_flow.index},
-        attrs={"units": units, "basin": basin_name},  # 降雨单位为 mm/h
-    )
+    with trace_peak_memory(enabled=report_memory) as usage:
+        variables = ["total_precipitation_hourly", "streamflow"]
+        if store_dir is not None:
+            loader = get_basin_loader(get_basin_store(store_dir), time_unit)
+            time_index, values = loader.basin_values(basin_name, variables)
+            values = np.ascontiguousarray(values.T)
+        elif cache_dir is None:
+            time_index, values = read_timeseries_csv(csv_file_path, variables)
+        else:
+            # 缓存已由主进程检查并更新，这里只读打开，不再逐个检查 CSV
+            cache = get_timeseries_cache(
+                os.path.dirname(csv_file_path), cache_dir, refresh=False
+            )
+            time_index, values = cache.basin_arrays(basin_name, variables)
+        # 去掉流量为空的点（只在确有空值时复制一次）
+        has_flow = ~np.isnan(values[1])
+        if not has_flow.all():
+            values = values[:, has_flow]
+            time_index = time_index[has_flow]
 
-    flow = xr.DataArray(
-        df_with_flow["streamflow"].values,
-        dims="time",
-        coords={"time": df_with_flow.index},
-        attrs={"units": units, "basin": basin_name},  # 流量单位为 mm/h
-    )
+        rain = xr.DataArray(
+            values[0],
+            dims="time",
+            coords={"time": time_index},
+            attrs={"units": units, "basin": basin_name},  # 降雨单位为 mm/h
+        )
+
+        flow = xr.DataArray(
+            values[1],
+            dims="time",
+            coords={"time": time_index},
+            attrs={"units": units, "basin": basin_name},  # 流量单位为 mm/h
+        )
+    if report_memory:
+        print(
+            f"{basename}: {values.shape[1]} time steps read in "
+            f"{usage['seconds']:.2f}s, peak memory {usage['peak_mb']:.1f} MB"
+        )
 
     return rain, flow, basin_name
 
 
-def split_events_based_on_time_units(basin_ids, time_unit="1h"):
+def split_basin_events(
+    csv_file_path,
+    time_unit="1h",
+    report_memory=False,
+    cache_dir=None,
+    store_dir=None,
+):
+    """
+    划分单个流域的降雨径流场次并写出CSV。
+    任何异常都只记录在返回的统计信息中，不会影响其他流域。
+    :return: 统计信息字典，包含流域、状态、场次数、耗时和错误信息
+    """
+    begin = time.perf_counter()
+    basin_name = os.path.splitext(os.path.basename(csv_file_path))[0]
+    summary = {
+        "basin": basin_name,
+        "status": "ok",
+        "n_events": 0,
+        "seconds": 0.0,
+        "error": "",
+    }
+    try:
+        rain, flow, basin_name = read_data_from_csv(
+            csv_file_path,
+            "mm/" + time_unit,
+            report_memory=report_memory,
+            cache_dir=cache_dir,
+            store_dir=store_dir,
+            time_unit=time_unit,
+        )
+        if rain.size == 0:
+            print(f"Skipping {os.path.basename(csv_file_path)}: no data")
+            summary["status"] = "no_data"
+        else:
+            rr_events = get_rr_events(rain, flow, basin_name)
+            all_events_df_list = []
+            # rr_events 是一个字典
+            for basin, events_df in rr_events.items():
+                event_times_df = events_df[["BEGINNING_RAIN", "END_RAIN"]].copy()
+                event_times_df["BASIN"] = basin
+                all_events_df_list.append(event_times_df)
+            all_events_df = pd.concat(all_events_df_list, ignore_index=True)
+
+            output_folder = os.path.join(RESULT_DIR, "events", basin_name)
+            if not os.path.exists(output_folder):
+                os.makedirs(output_folder)
+            output_file = os.path.join(
+                output_folder, f"{basin_name}_{time_unit}_events.csv"
+            )
+            print(f"Writing {output_file}")
+            all_events_df.to_csv(output_file)
+            summary["n_events"] = len(all_events_df)
+    except Exception as e:
+        print(f"Error processing {basin_name}: {e}")
+        summary["status"] = "failed"
+        summary["error"] = f"{type(e).__name__}: {e}"
+    summary["seconds"] = time.perf_counter() - begin
+    return summary
+
+
+def split_events_based_on_time_units(
+    basin_ids,
+    time_unit="1h",
+    workers=1,
+    report_memory=False,
+    use_cache=True,
+    from_1h=False,
+):
+    """
+    对多个流域划分场次。workers 大于 1 时各流域在进程池中并行处理（DMCA-ESR 计算量大且流域间相互独立）。
+    结束时打印并保存每个流域的耗时、场次数和失败信息。
+    :param use_cache: 为 True 时先把该时间尺度的 CSV 转为二进制缓存，各流域从缓存读取
+    :param from_1h: 为 True 时只读取 1h 的 CSV（转为内存映射数组库），3h、1D 序列由 1h 序列
+        现场聚合得到，不再需要单独的 3h、1D 目录；此时不使用 use_cache 的缓存
+    :return: 各流域统计信息的 DataFrame
+    """
     # 定义数据文件路径
-    units = "mm/" + time_unit
-    csv_folder_path = os.path.join(DATASET_DIR, "timeseries", time_unit)
+    csv_folder_path = os.path.join(
+        DATASET_DIR, "timeseries", "1h" if from_1h else time_unit
+    )
     csv_file_names = os.listdir(csv_folder_path)
-    selected_files = [
+    selected_files = sorted(
         csv_file_name
         for csv_file_name in csv_file_names
         if os.path.splitext(csv_file_name)[0] in basin_ids
         and csv_file_name.endswith(".csv")
+    )
+    csv_file_paths = [
+        os.path.join(csv_folder_path, csv_file_name) for csv_file_name in selected_files
     ]
     print(basin_ids)
-    for csv_file_name in selected_files:
-        basin_name = os.path.splitext(csv_file_name)[0]
-        csv_file_path = os.path.join(csv_folder_path, csv_file_name)
-        rain, flow, basin_name = read_data_from_csv(csv_file_path, units)
-        if rain.size == 0:
-            print(f"Skipping {csv_file_name}: no data")
-            continue
-
-        rr_events = get_rr_events(rain, flow, basin_name)
-        if rr_events is None:
-            continue
-
-        all_events_df_list = []
-
-        # rr_events 是一个字典
-        for basin, events_df in rr_events.items():
-            event_times_df = events_df[["BEGINNING_RAIN", "END_RAIN"]]
-            event_times_df["BASIN"] = basin
-            all_events_df_list.append(event_times_df)
-
-        all_events_df = pd.concat(all_events_df_list, ignore_index=True)
-        basin = event_times_df["BASIN"] = basin
-        output_folder = os.path.join(RESULT_DIR, "events", basin)
-        if not os.path.exists(output_folder):
-            os.makedirs(output_folder)
-        output_file = os.path.join(output_folder, f"{basin}_{time_unit}_events.csv")
-        print(f"Writing {output_file}")
+    begin = time.perf_counter()
+    cache_dir = None
+    store_dir = None
+    if from_1h:
+        # 先在主进程中建好（或更新）1h 数组库，各工作进程以只读方式映射
+        store_dir = hourly_store_dir(CACHE_DIR)
+        get_basin_store(store_dir, time_unit_sources("1h", csv_dir=csv_folder_path))
+        print(f"1h basin store ready in {store_dir}")
+    elif use_cache:
+        # 先在主进程中建好（或更新）二进制缓存，各工作进程只读
+        cache_dir = os.path.join(CACHE_DIR, "timeseries", time_unit)
+        get_timeseries_cache(csv_folder_path, cache_dir)
+        print(f"Timeseries cache ready in {cache_dir}")
+    if workers > 1:
+        summaries = []
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(
+                    split_basin_events,
+                    csv_file_path,
+                    time_unit,
+                    report_memory,
+                    cache_dir,
+                    store_dir,
+                )
+                for csv_file_path in csv_file_paths
+            ]
+            for csv_file_path, future in zip(csv_file_paths, futures):
+                try:
+                    summaries.append(future.result())
+                except Exception as e:
+                    # 工作进程本身崩溃时也只记录这个流域
+                    summaries.append(
+                        {
+                            "basin": os.path.splitext(
+                                os.path.basename(csv_file_path)
+                            )[0],
+                            "status": "failed",
+                            "n_events": 0,
+                            "seconds": float("nan"),
+                            "error": f"{type(e).__name__}: {e}",
+                        }
+                    )
+    else:
+        summaries = [
+            split_basin_events(
+                csv_file_path, time_unit, report_memory, cache_dir, store_dir
+            )
+            for csv_file_path in csv_file_paths
+        ]
 
-        all_events_df.to_csv(output_file)
+    summary_df = pd.DataFrame(
+        summaries, columns=["basin", "status", "n_events", "seconds", "error"]
+    )
+    n_failed = (summary_df["status"] == "failed").sum()
+    print(summary_df.to_string(index=False))
+    print(
+        f"{len(summary_df)} basins, {summary_df['n_events'].sum()} events, "
+        f"{n_failed} failed, {time.perf_counter() - begin:.1f}s "
+        f"with {workers} worker(s)"
+    )
+    summary_folder = os.path.join(RESULT_DIR, "events")
+    if not os.path.exists(summary_folder):
+        os.makedirs(summary_folder)
+    summary_df.to_csv(
+        os.path.join(summary_folder, f"split_summary_{time_unit}.csv"), index=False
+    )
+    return summary_df
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="按时间尺度划分各流域的降雨径流场次")
+    parser.add_argument("--time_unit", default="1D", help="时间尺度，如 1h、3h、1D")
+    parser.add_argument(
+        "--workers", type=int, default=1, help="并行使用的进程数，默认 1 为串行"
+    )
+    parser.add_argument(
+        "--report_memory",
+        action="store_true",
+        help="打印每个流域读取数据的耗时和峰值内存",
+    )
+    parser.add_argument(
+        "--no_cache",
+        action="store_true",
+        help="直接解析 CSV，不使用（也不建立）二进制缓存",
+    )
+    parser.add_argument(
+        "--from_1h",
+        action="store_true",
+        help="由 1h 数据现场聚合得到 3h、1D 序列，不读取单独的 3h、1D 目录",
+    )
+    args = parser.parse_args()
     basin_ids = pd.read_csv(
         os.path.join(PROJECT_DIR, "gage_ids/basin_neimenggu.csv"),
         dtype={"id": str},
     )["id"].values.tolist()
-    split_events_based_on_time_units(basin_ids=basin_ids, time_unit="1D")
+    split_events_based_on_time_units(
+        basin_ids=basin_ids,
+        time_unit=args.time_unit,
+        workers=args.workers,
+        report_memory=args.report_memory,
+        use_cache=not args.no_cache,
+        from_1h=args.from_1h,
+    )
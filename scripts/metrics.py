@@ -1,308 +1,455 @@
+import argparse
 import pathlib
-import xarray as xr
 from definitions import PROJECT_DIR, DATASET_DIR, RESULT_DIR
 from torchhydro import CACHE_DIR
+from hydroneimenggu.aggregation import hourly_store_dir
+from hydroneimenggu.basin_store import (
+    get_basin_store,
+    is_basin_store,
+    time_unit_sources,
+)
+from hydroneimenggu.cache_index import find_basin_nc_file, get_basin_file_index
+from hydroneimenggu.event_metrics import compute_basin_event_metrics
+from hydroneimenggu.events import event_time_indices, read_basin_events
+from hydroneimenggu.common import file_fingerprint
+from hydroneimenggu.manifest import Manifest
+from hydroneimenggu.metrics_store import (
+    partition_dir,
+    plan_basin_metrics,
+    prune_metrics_partitions,
+    record_basin_metrics,
+    write_metrics_partition,
+)
+from hydroneimenggu.session import (
+    OBS_FILE_NAME,
+    PRED_FILE_NAME,
+    ProjectSession,
+    find_basin_forcing,
+    forcing_fingerprint,
+)
 import os
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 import pandas as pd
-import numpy as np
 
 
 def compute_flow_metrics(
-    basin_info,
+    session,
     nc_file,
-    basin_columns,
     precip_var,
-    flow_var_obs,
-    flow_var_pred,
     target_basin_id,
     time_style,
-    time_start=None,
-    time_end=None,
+    events,
     station_dict=None,
+    flow_var="streamflow",
 ):
     """
-    计算指定流域在特定时间范围内的流量指标，包括RMSE、相关系数、NSE和径流系数。
+    计算指定流域所有场次的流量指标，包括RMSE、相关系数、NSE和径流系数。
+    events 为 read_basin_events 读取的场次表，起止时间已解析为 datetime。
+    流域的观测、预测和降水序列只对齐一次，所有场次由批量指标引擎一次算完。
     """
-    if time_style == "3h":
-        time_end = pd.to_datetime(time_end) + pd.Timedelta(hours=1)
-        time_start = pd.to_datetime(time_start) + pd.Timedelta(hours=1)
-    else:
-        time_start = pd.to_datetime(time_start)
-        time_end = pd.to_datetime(time_end)
+    # 检索流域信息
+    if target_basin_id not in station_dict:
+        print(f"流域ID {target_basin_id} 未在 station_dict 中找到")
+        return None
+    basin_name = station_dict[target_basin_id]["name"]
     try:
-        ds = xr.open_dataset(nc_file)
-
         # 检查目标流域ID是否存在于数据集中
-        if target_basin_id in ds[basin_columns].values:
-            # 选择指定流域ID的数据
-            basin_data = ds.sel({basin_columns: target_basin_id})
-            flow_obs = xr.open_dataset(flow_var_obs).sel(
-                {basin_columns: target_basin_id}
-            )["streamflow"]
-
-            flow_pred = xr.open_dataset(flow_var_pred).sel(
-                {basin_columns: target_basin_id}
-            )["streamflow"]
-
-            # 应用时间范围过滤（如果指定）
-            if time_start and time_end:
-                try:
-                    flow_obs_time_range = flow_obs.time
-                    flow_pred_time_range = flow_pred.time
-
-                    # 确定观测和预测流量的时间交集
-                    flow_time_start = max(
-                        time_start,
-                        pd.to_datetime(flow_obs_time_range.min().values),
-                        pd.to_datetime(flow_pred_time_range.min().values),
-                    )
-                    flow_time_end = min(
-                        time_end,
-                        pd.to_datetime(flow_obs_time_range.max().values),
-                        pd.to_datetime(flow_pred_time_range.max().values),
-                    )
-
-                    # 选择在调整后的时间范围内的数据
-                    basin_data = basin_data.sel(
-                        time=slice(flow_time_start, flow_time_end)
-                    )
-
-                    if basin_data.time.size == 0:
-                        print(f"流域ID {target_basin_id} 在{nc_file}时间范围内没有数据")
-                        return None
-
-                except Exception as e:
-                    print(f"时间切片错误: {e}")
-                    return None
-
-            # 提取时间序列数据
-            time = basin_data["time"]
-            precip = basin_data[precip_var]
-
-            # 读取在时间范围内的观测和预测流量数据
-            flow_obs = (
-                xr.open_dataset(flow_var_obs)
-                .sel({basin_columns: target_basin_id})
-                .sel(time=slice(flow_time_start, flow_time_end))["streamflow"]
-            )
-            flow_pred = (
-                xr.open_dataset(flow_var_pred)
-                .sel({basin_columns: target_basin_id})
-                .sel(time=slice(flow_time_start, flow_time_end))["streamflow"]
-            )
-
-            # 检索流域信息
-            if target_basin_id in station_dict:
-                basin_info_entry = station_dict[target_basin_id]
-                basin_name = basin_info_entry["name"]
-                basin_area = basin_info_entry["basin_area"]
-            else:
-                print(f"流域ID {target_basin_id} 未在 station_dict 中找到")
-                return None
-
-            # 对齐观测和预测流量数据，确保时间坐标一致
-            flow_obs_aligned, flow_pred_aligned = xr.align(
-                flow_obs, flow_pred, join="inner"
-            )
-            precip_aligned = precip.sel(time=flow_obs_aligned.time)
-
-            # 将对齐后的数据转换为NumPy数组
-            flow_obs_values = flow_obs_aligned.values
-            flow_pred_values = flow_pred_aligned.values
-            precip_values = precip_aligned.values
-
-            # 计算径流系数
-            # 仅在 flow_obs 有值且降水不为零的时间点计算 flow_obs_coeff
-            valid_indices = ~np.isnan(flow_obs_values) & ~np.isnan(precip_values)
-            flow_obs_coeff_total = (
-                np.sum(flow_obs_values[valid_indices])
-                / np.sum(precip_values[valid_indices])
-                if np.sum(precip_values[valid_indices]) != 0
-                else np.nan
-            )
-
-            # 对于 flow_pred_coeff，可以在所有有效时间点计算
-            valid_pred_indices = ~np.isnan(flow_pred_values) & ~np.isnan(precip_values)
-            # valid_pred_indices = valid_indices
-            flow_pred_coeff_total = (
-                np.sum(flow_pred_values[valid_pred_indices])
-                / np.sum(precip_values[valid_pred_indices])
-                if np.sum(precip_values[valid_pred_indices]) != 0
-                else np.nan
-            )
-
-            print(f"flow_obs_coeff_total: {flow_obs_coeff_total}")
-            print(f"flow_pred_coeff_total: {flow_pred_coeff_total}")
-
-            # 计算RMSE
-            rmse = np.sqrt(np.mean((flow_pred_values - flow_obs_values) ** 2))
-
-            # 计算皮尔逊相关系数
-            if len(flow_obs_values) > 1:
-                correlation = np.corrcoef(flow_obs_values, flow_pred_values)[0, 1]
-            else:
-                correlation = np.nan
-
-            # 计算纳什-萨特克利夫效率系数 (NSE)
-            numerator = np.sum((flow_obs_values - flow_pred_values) ** 2)
-            denominator = np.sum((flow_obs_values - np.mean(flow_obs_values)) ** 2)
-            if denominator != 0:
-                nse = 1 - (numerator / denominator)
-            else:
-                nse = np.nan
-
-            metrics = {
-                "basin_id": target_basin_id,
-                "basin_name": basin_name,
-                "event_start": str(flow_time_start),
-                "event_end": str(flow_time_end),
-                "rmse": rmse,
-                "correlation": correlation,
-                "nse": nse,
-                "flow_obs_coeff_total": flow_obs_coeff_total,
-                "flow_pred_coeff_total": flow_pred_coeff_total,
-            }
-
-            # 关闭数据集
-            ds.close()
-
-            return metrics
-        else:
+        if not session.has_basin(target_basin_id, nc_file):
             print(f"流域ID {target_basin_id} 未在文件 {nc_file} 中找到")
             return None
+        time_start = pd.DatetimeIndex(events["BEGINNING_RAIN"])
+        time_end = pd.DatetimeIndex(events["END_RAIN"])
+        if time_style == "3h":
+            time_start = time_start + pd.Timedelta(hours=1)
+            time_end = time_end + pd.Timedelta(hours=1)
+
+        # 确定观测和预测流量的时间交集，并裁剪各场次的起止时间
+        obs_pred_start, obs_pred_end = session.time_bounds(target_basin_id, flow_var)
+        flow_time_start = time_start.where(time_start > obs_pred_start, obs_pred_start)
+        flow_time_end = time_end.where(time_end < obs_pred_end, obs_pred_end)
+
+        # 对齐观测、预测流量和降水数据，确保时间坐标一致
+        aligned = session.aligned_basin(
+            target_basin_id, nc_file, precip_var, flow_var
+        )
+        # 场次起止时间转换为对齐后时间轴上的整数索引
+        starts, ends = event_time_indices(
+            aligned.indexes["time"], flow_time_start, flow_time_end
+        )
+        has_data = ends > starts
+        if not has_data.all():
+            print(
+                f"流域ID {target_basin_id} 有 {(~has_data).sum()} 个场次在{nc_file}时间范围内没有数据"
+            )
+        metrics_df = compute_basin_event_metrics(
+            aligned["obs"].values,
+            aligned["pred"].values,
+            aligned["precip"].values,
+            starts[has_data],
+            ends[has_data],
+            basin_id=target_basin_id,
+            basin_name=basin_name,
+            event_start=flow_time_start[has_data].strftime("%Y-%m-%d %H:%M:%S"),
+            event_end=flow_time_end[has_data].strftime("%Y-%m-%d %H:%M:%S"),
+        )
+        return metrics_df
     except Exception as e:
         print(f"发生错误: {e}")
         return None
 
 
-def read_rainfall_events_summary(csv_file_path):
+def get_nc_files(target_basin_id, time_unit):
     """
-    读取降雨事件总结CSV文件，并返回一个字典，键为流域ID，值为事件列表。
+    在CACHE_DIR目录中查找包含目标流域ID和时间单位的.nc文件。
+    通过持久化的流域-文件索引查找，只有新增或修改过的缓存文件才会被重新读取。
     """
-    summary_df = pd.read_csv(csv_file_path)
-    events_dict = {}
-    for index, row in summary_df.iterrows():
-        basin = row["BASIN"]
-        start_time = row["BEGINNING_RAIN"]
-        end_time = row["END_RAIN"]
-        if basin not in events_dict:
-            events_dict[basin] = []
-        events_dict[basin].append({"Start_Time": start_time, "End_Time": end_time})
-    return events_dict
+    nc_file = find_basin_nc_file(target_basin_id, time_unit, CACHE_DIR)
+    if nc_file is not None:
+        print(f"在文件 {os.path.basename(nc_file)} 中找到流域ID {target_basin_id}")
+    return nc_file
 
 
-def get_nc_files(target_basin_id, time_unit):
+# 1h 数据的内存映射数组库目录，由主进程建立后传给工作进程；3h、1D 驱动数据由其现场聚合得到
+_forcing_store_dir = None
+
+
+def build_forcing_store():
     """
-    在CACHE_DIR目录中查找包含目标流域ID和时间单位的.nc文件。
+    在主进程中把 DATASET_DIR/timeseries/1h 下的 1h 流域CSV合并为一个按 (流域, 时间, 变量) 存放的
+    内存映射数组库（输入未变化时直接沿用，与 events_split.py --from_1h 共用），返回数组库目录；
+    没有 1h CSV 时返回 None。
     """
-    for file_name in os.listdir(CACHE_DIR):
-        if file_name.endswith(".nc") and time_unit in file_name:  # 仅处理 .nc 文件
-            file_path = os.path.join(CACHE_DIR, file_name)
-            try:
-                dataset = xr.open_dataset(file_path)
-                if "basin" in dataset:
-                    basin_ids = dataset["basin"].values
-                    if target_basin_id in basin_ids:
-                        print(f"在文件 {file_name} 中找到流域ID {target_basin_id}")
-                        dataset.close()
-                        return file_path
-                    else:
-                        dataset.close()
-                else:
-                    dataset.close()
-            except Exception as e:
-                print(f"读取文件 {file_name} 时出错: {e}")
-    return None
+    sources = time_unit_sources(
+        "1h", csv_dir=os.path.join(DATASET_DIR, "timeseries", "1h")
+    )
+    if not sources:
+        print("没有 1h 流域CSV，驱动数据从缓存 .nc 文件读取")
+        return None
+    store_dir = hourly_store_dir(CACHE_DIR)
+    get_basin_store(store_dir, sources)
+    return store_dir
 
 
-def compute_metrics_based_on_events(time_unit, project_name, metrics_list):
+def _init_forcing_store(store_dir):
+    global _forcing_store_dir
+    _forcing_store_dir = store_dir
+
+
+def get_forcing_file(target_basin_id, time_unit):
     """
-    根据指定的时间单位和项目名称，计算所有流域和事件的流量指标，并将结果添加到metrics_list中。
+    流域驱动数据所在位置：1h 数组库中有该流域时返回数组库目录，否则返回缓存 .nc 文件。
+    数组库的 1h 序列由 ProjectSession 现场聚合到 time_unit，不再需要单独的 3h、1D 数据；
+    多个进程以只读方式映射同一个数组库，只读取所需流域的数据页。
+    """
+    if _forcing_store_dir is not None and get_basin_store(
+        _forcing_store_dir
+    ).has_basin(target_basin_id):
+        return _forcing_store_dir
+    return get_nc_files(target_basin_id, time_unit)
+
+
+def get_station_dict():
+    """
+    读取流域信息表，返回以流域ID为键、包含名称和面积的字典。
+    """
+    basin_info = pd.read_csv(
+        os.path.join(pathlib.Path(__file__).parent.parent, "gage_ids/basin_info.csv")
+    )
+    return basin_info.set_index("basin_id")[["name", "basin_area"]].to_dict(
+        orient="index"
+    )
+
+
+def get_event_basin_ids():
+    """
+    返回 RESULT_DIR/events 下有场次划分结果的流域ID（排序后，保证结果顺序确定）。
     """
     events_folder_path = os.path.join(RESULT_DIR, "events")
-    basin_ids = [
+    return sorted(
         folder
         for folder in os.listdir(events_folder_path)
         if os.path.isdir(os.path.join(events_folder_path, folder))
-    ]
-    basin_info = pd.read_csv(
-        os.path.join(pathlib.Path(__file__).parent.parent, "gage_ids/basin_info.csv")
     )
-    station_dict = basin_info.set_index("basin_id")[["name", "basin_area"]].to_dict(
-        orient="index"
+
+
+def compute_basin_metrics(session, time_unit, basin_id, station_dict):
+    """
+    计算一个流域所有场次的流量指标，返回指标字典的列表；
+    缺少 .nc 文件或事件文件、或计算出错时返回 None，该流域下次运行时会重新计算。
+    """
+    nc_file = get_forcing_file(basin_id, time_unit)
+    if nc_file is None:
+        print(f"未找到流域ID {basin_id} 的 .nc 文件")
+        return None
+    events_path = os.path.join(
+        RESULT_DIR, "events", basin_id, f"{basin_id}_1D_events.csv"
     )
-    for basin_id in basin_ids:
-        nc_file = get_nc_files(basin_id, time_unit)
-        if nc_file is None:
-            print(f"未找到流域ID {basin_id} 的 .nc 文件")
-            continue
-        events_path = os.path.join(
-            events_folder_path, basin_id, f"{basin_id}_1D_events.csv"
-        )
-        if not os.path.exists(events_path):
-            print(f"事件文件 {events_path} 不存在")
-            continue
-        events_dict = read_rainfall_events_summary(events_path)
-        for event in events_dict.get(basin_id, []):
-            start_time = event["Start_Time"]
-            end_time = event["End_Time"]
-
-            metrics = compute_flow_metrics(
-                basin_info,
-                nc_file,
-                "basin",
-                "total_precipitation_hourly",
-                os.path.join(
-                    RESULT_DIR, project_name, "epochbest_model.pthflow_obs.nc"
-                ),
-                os.path.join(
-                    RESULT_DIR, project_name, "epochbest_model.pthflow_pred.nc"
-                ),
-                basin_id,
-                time_unit,
-                start_time,
-                end_time,
-                station_dict,
+    if not os.path.exists(events_path):
+        print(f"事件文件 {events_path} 不存在")
+        return None
+    events = read_basin_events(events_path, basin_id)
+    if events.empty:
+        return []
+    metrics_df = compute_flow_metrics(
+        session,
+        nc_file,
+        "total_precipitation_hourly",
+        basin_id,
+        time_unit,
+        events,
+        station_dict,
+    )
+    if metrics_df is None:
+        return None
+    return metrics_df.to_dict(orient="records")
+
+
+def compute_metrics_based_on_events(time_unit, project_name, metrics_list):
+    """
+    根据指定的时间单位和项目名称，计算所有流域和事件的流量指标，并将结果添加到metrics_list中。
+    """
+    station_dict = get_station_dict()
+    # 每个项目只打开一次观测、预测和驱动数据文件
+    with ProjectSession(
+        os.path.join(RESULT_DIR, project_name), time_unit=time_unit
+    ) as session:
+        for basin_id in get_event_basin_ids():
+            metrics_list.extend(
+                compute_basin_metrics(session, time_unit, basin_id, station_dict)
+                or []
             )
-            if metrics:
-                metrics_list.append(metrics)
 
 
-def main():
+# 每个（工作）进程各自持有的项目会话和流域信息，避免每个任务重复打开文件
+_worker_sessions = {}
+_worker_station_dict = None
+
+
+def _basin_metrics_task(task):
     """
-    主函数，遍历RESULT_DIR中的所有项目文件夹，根据时间单位计算流量指标，并为每个项目生成单独的CSV文件。
+    计算 (项目, 时间单位, 流域) 的流量指标，串行和进程池模式共用；失败时返回 None。
     """
-    for folder_name in os.listdir(RESULT_DIR):
+    global _worker_station_dict
+    project_name, time_unit, basin_id = task
+    if _worker_station_dict is None:
+        _worker_station_dict = get_station_dict()
+    if (project_name, time_unit) not in _worker_sessions:
+        _worker_sessions[(project_name, time_unit)] = ProjectSession(
+            os.path.join(RESULT_DIR, project_name), time_unit=time_unit
+        )
+    return compute_basin_metrics(
+        _worker_sessions[(project_name, time_unit)],
+        time_unit,
+        basin_id,
+        _worker_station_dict,
+    )
+
+
+def get_test_projects():
+    """
+    返回 RESULT_DIR 中所有测试项目及其时间单位，形如 [(项目名, 时间单位), ...]。
+    """
+    projects = []
+    for folder_name in sorted(os.listdir(RESULT_DIR)):
         folder_path = os.path.join(RESULT_DIR, folder_name)
         if os.path.isdir(folder_path) and folder_name.startswith("test_with_"):
-            # 初始化一个字典来存储不同时间单位的指标
-            project_metrics = {}
             for time_unit in ["1D", "3h"]:
                 if time_unit in folder_name:
-                    print(f"正在处理项目 {folder_name} 的{time_unit}指标")
-                    metrics_list = []
-                    compute_metrics_based_on_events(
-                        time_unit, folder_name, metrics_list
-                    )
-                    project_metrics[time_unit] = metrics_list
-            # 为每个时间单位保存一个单独的CSV文件
-            for time_unit, metrics in project_metrics.items():
-                if metrics:
-                    metrics_df = pd.DataFrame(metrics)
-                    output_folder = os.path.join(
-                        RESULT_DIR, "flow_metrics", folder_name
-                    )
-                    if not os.path.exists(output_folder):
-                        os.makedirs(output_folder)
-                    output_csv = os.path.join(
-                        output_folder, f"{folder_name}_{time_unit}_flow_metrics.csv"
-                    )
-                    metrics_df.to_csv(output_csv, index=False)
-                    print(f"流量指标已保存到 {output_csv}")
-                else:
-                    print(f"项目 {folder_name} 的{time_unit}没有可保存的指标数据。")
+                    projects.append((folder_name, time_unit))
+    return projects
+
+
+def get_output_csv(folder_name, time_unit):
+    return os.path.join(
+        RESULT_DIR,
+        "flow_metrics",
+        folder_name,
+        f"{folder_name}_{time_unit}_flow_metrics.csv",
+    )
+
+
+def save_project_metrics(folder_name, time_unit, metrics):
+    """
+    将一个项目一个时间单位的指标保存为单独的CSV文件。
+    """
+    output_csv = get_output_csv(folder_name, time_unit)
+    if not metrics:
+        print(f"项目 {folder_name} 的{time_unit}没有可保存的指标数据。")
+        if os.path.exists(output_csv):
+            os.remove(output_csv)
+        return
+    metrics_df = pd.DataFrame(metrics)
+    output_folder = os.path.dirname(output_csv)
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+    metrics_df.to_csv(output_csv, index=False)
+    print(f"流量指标已保存到 {output_csv}")
+
+
+def get_basin_input_fingerprints(folder_name, time_unit, basin_id):
+    """
+    一个 (项目, 时间单位, 流域) 指标所依赖的全部输入文件的指纹：
+    观测/预测结果文件、场次CSV和驱动数据（1h 数组库或缓存文件）。
+    """
+    nc_file = find_basin_forcing(basin_id, time_unit, CACHE_DIR, _forcing_store_dir)
+    # 缓存文件可能在查找之后被删除，此时与缓存文件不存在一样记为 None，流域视为需要重新计算
+    cache = None if nc_file is None else forcing_fingerprint(nc_file)
+    project_dir = os.path.join(RESULT_DIR, folder_name)
+    return {
+        "obs": file_fingerprint(os.path.join(project_dir, OBS_FILE_NAME)),
+        "pred": file_fingerprint(os.path.join(project_dir, PRED_FILE_NAME)),
+        "events": file_fingerprint(
+            os.path.join(RESULT_DIR, "events", basin_id, f"{basin_id}_1D_events.csv")
+        ),
+        "cache": None
+        if cache is None
+        else {"file": os.path.basename(nc_file), **cache},
+    }
+
+
+def read_existing_metrics(folder_name, time_unit):
+    """
+    读取已有的指标CSV，返回以流域ID为键的指标字典列表；文件不存在时返回空字典。
+    """
+    output_csv = get_output_csv(folder_name, time_unit)
+    if not os.path.exists(output_csv):
+        return {}
+    existing_df = pd.read_csv(output_csv, dtype={"basin_id": str})
+    return {
+        basin_id: basin_df.to_dict(orient="records")
+        for basin_id, basin_df in existing_df.groupby("basin_id", sort=False)
+    }
+
+
+def get_parquet_store():
+    return os.path.join(RESULT_DIR, "flow_metrics", "flow_metrics.parquet")
+
+
+def main(workers=1, force=False, parquet=False, use_store=False):
+    """
+    主函数，遍历RESULT_DIR中的所有项目文件夹，根据时间单位计算流量指标，并为每个项目生成单独的CSV文件。
+    workers 大于 1 时，把 (项目, 时间单位, 流域) 任务分发到进程池，结果按任务顺序合并，
+    与串行运行得到的CSV相同。
+    RESULT_DIR/flow_metrics/manifest.json 记录每个流域指标所用输入文件的指纹，输入未变化的
+    流域直接沿用已有CSV中的行，只重新计算有变化或上次计算失败的流域；
+    force 为 True 时不检查清单，全部重新计算。
+    parquet 为 True 时，同时把所有项目的指标写入按项目和时间单位分区的 Parquet 数据集
+    RESULT_DIR/flow_metrics/flow_metrics.parquet，可用 load_flow_metrics 按需读取；
+    已不在测试项目中的 (项目, 时间单位) 分区会被删除。
+    1h 流域CSV的内存映射数组库存在时（如 events_split.py --from_1h 已建立），驱动数据从中读取并
+    现场聚合到各项目的时间单位，各工作进程共享同一份只读数据，不再各自打开缓存 .nc 文件；
+    use_store 为 True 时先建立或更新该数组库。
+    """
+    projects = get_test_projects()
+    basin_ids = get_event_basin_ids()
+    manifest = Manifest(os.path.join(RESULT_DIR, "flow_metrics", "manifest.json"))
+    # 先在主进程中建立并保存缓存文件索引，避免各工作进程同时扫描缓存目录
+    get_basin_file_index(CACHE_DIR)
+    store_dir = hourly_store_dir(CACHE_DIR)
+    if use_store:
+        store_dir = build_forcing_store()
+    elif not is_basin_store(store_dir):
+        store_dir = None
+    _init_forcing_store(store_dir)
+
+    tasks = []
+    fingerprints = {}
+    existing = {}
+    changed_projects = set()
+    for folder_name, time_unit in projects:
+        existing[(folder_name, time_unit)] = read_existing_metrics(
+            folder_name, time_unit
+        )
+        if set(existing[(folder_name, time_unit)]) - set(basin_ids):
+            # 有流域的场次结果已被删除，需要重写该项目的CSV
+            changed_projects.add((folder_name, time_unit))
+        for basin_id in basin_ids:
+            task = (folder_name, time_unit, basin_id)
+            tasks.append(task)
+            fingerprints[task] = get_basin_input_fingerprints(*task)
+    # 只沿用上次成功计算且输入未变化的流域；force 为 True 时不检查清单，全部重新计算
+    basin_metrics, tasks = plan_basin_metrics(
+        manifest, tasks, fingerprints, existing, force=force
+    )
+    print(
+        f"{len(basin_metrics)} 个 (项目, 时间单位, 流域) 的输入未变化，"
+        f"需要计算 {len(tasks)} 个"
+    )
+
+    if workers > 1 and len(tasks) > 1:
+        print(f"使用 {workers} 个进程计算")
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_forcing_store,
+            initargs=(store_dir,),
+        ) as executor:
+            # map 按提交顺序返回结果，保证合并后的行顺序与串行一致
+            results = list(executor.map(_basin_metrics_task, tasks))
+    else:
+        results = [_basin_metrics_task(task) for task in tasks]
+        for session in _worker_sessions.values():
+            session.close()
+        _worker_sessions.clear()
+    failed = [task for task, metrics in zip(tasks, results) if metrics is None]
+    if failed:
+        print(f"{len(failed)} 个 (项目, 时间单位, 流域) 计算失败，下次运行时重新计算")
+    # 失败的流域不写入清单
+    basin_metrics.update(record_basin_metrics(manifest, tasks, results, fingerprints))
+
+    changed_projects.update(task[:2] for task in tasks)
+    for folder_name, time_unit in projects:
+        changed = (folder_name, time_unit) in changed_projects
+        missing_partition = parquet and not os.path.exists(
+            partition_dir(get_parquet_store(), folder_name, time_unit)
+        )
+        if not changed and not missing_partition:
+            print(f"项目 {folder_name} 的{time_unit}指标没有变化，跳过")
+            continue
+        metrics = []
+        for basin_id in basin_ids:
+            metrics.extend(basin_metrics[(folder_name, time_unit, basin_id)])
+        if changed:
+            save_project_metrics(folder_name, time_unit, metrics)
+        if parquet:
+            write_metrics_partition(
+                get_parquet_store(), folder_name, time_unit, metrics
+            )
+    if parquet:
+        for folder_name, time_unit in prune_metrics_partitions(
+            get_parquet_store(), projects
+        ):
+            print(f"项目 {folder_name} 已不存在，删除其{time_unit}指标分区")
+    manifest.save()
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="计算各测试项目的场次流量指标")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="并行计算使用的进程数，默认 1 为串行",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="忽略 manifest，重新计算所有项目和流域的指标",
+    )
+    parser.add_argument(
+        "--parquet",
+        action="store_true",
+        help="同时写入按项目和时间单位分区的 Parquet 指标数据集（需要 pyarrow）",
+    )
+    parser.add_argument(
+        "--store",
+        action="store_true",
+        help="先建立或更新 1h 数据的内存映射数组库，驱动数据从中读取并聚合到各项目的时间单位",
+    )
+    args = parser.parse_args()
+    main(
+        workers=args.workers,
+        force=args.force,
+        parquet=args.parquet,
+        use_store=args.store,
+    )
@@ -0,0 +1,123 @@
+"""
+在同一个进程中批量运行训练、测试实验：数据集 × 时间单位 × 任务。
+torchhydro 只导入一次，测试实验直接读取对应训练实验保存的归一化统计量和最优模型。
+指定 --sweep_years 时，每个测试实验只加载一次模型和数据，在所有年份的时段上测试一次，
+再把每个水文年的结果分别写入 <项目名>_<年份> 文件夹。
+
+示例：
+    python run_experiments.py --datasets nmg camels --time_units 1D 3h
+    python run_experiments.py --tasks mtlflowssm --overrides '{"train_epoch": 20}'
+    python run_experiments.py --modes test --sweep_years 2015 2016 2017 2018 2019 2020
+"""
+
+import argparse
+import json
+import logging
+
+from definitions import DATASET_DIR, RESULT_DIR
+from hydroneimenggu.experiments import (
+    GAGE_FILES,
+    MODES,
+    TASKS,
+    TIME_UNITS,
+    experiment_args,
+    experiment_matrix,
+    experiment_name,
+    run_experiments,
+    hydro_year_periods,
+)
+
+logging.basicConfig(level=logging.INFO)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="批量运行训练、测试实验")
+    parser.add_argument(
+        "--datasets",
+        nargs="+",
+        default=["nmg"],
+        choices=list(GAGE_FILES),
+        help="训练数据集，默认 nmg",
+    )
+    parser.add_argument(
+        "--time_units",
+        nargs="+",
+        default=list(TIME_UNITS),
+        choices=list(TIME_UNITS),
+        help="时间单位，默认 1D 和 3h",
+    )
+    parser.add_argument(
+        "--tasks",
+        nargs="+",
+        default=list(TASKS),
+        choices=list(TASKS),
+        help="stlflow 只预测径流，mtlflowssm 同时预测径流和表层土壤含水量，默认两者",
+    )
+    parser.add_argument(
+        "--modes",
+        nargs="+",
+        default=list(MODES),
+        choices=list(MODES),
+        help="train 训练、test 测试，默认先训练再测试",
+    )
+    parser.add_argument("--device", type=int, default=0, help="使用的 GPU 编号，默认 0")
+    parser.add_argument(
+        "--overrides",
+        type=json.loads,
+        default=None,
+        help='JSON 形式的参数，覆盖所有实验的默认参数，如 {"train_epoch": 20}',
+    )
+    parser.add_argument(
+        "--sweep_years",
+        nargs="+",
+        type=int,
+        default=None,
+        help="测试实验一次性测试这些水文年（前一年 10 月 31 日至当年 10 月 31 日），"
+        "每年的结果写入各自的文件夹",
+    )
+    parser.add_argument(
+        "--stop_on_error",
+        action="store_true",
+        help="某个实验出错时停止，默认报告错误后继续下一个实验",
+    )
+    parser.add_argument(
+        "--dry_run",
+        action="store_true",
+        help="只列出要运行的实验及其参数，不运行",
+    )
+    args = parser.parse_args()
+    experiments = experiment_matrix(
+        args.datasets, args.time_units, args.tasks, args.modes
+    )
+    if args.dry_run:
+        for experiment in experiments:
+            print(experiment_name(*experiment))
+            experiment_kwargs = experiment_args(
+                *experiment,
+                DATASET_DIR,
+                RESULT_DIR,
+                device=args.device,
+                overrides=args.overrides,
+            )
+            experiment_kwargs["gage_id"] = f"{len(experiment_kwargs['gage_id'])} 个流域"
+            if experiment[0] == "test" and args.sweep_years:
+                experiment_kwargs["test_period"] = hydro_year_periods(
+                    args.sweep_years, experiment[2]
+                )
+            for key, value in experiment_kwargs.items():
+                if key != "var_c":
+                    print(f"    {key}: {value}")
+    else:
+        results = run_experiments(
+            experiments,
+            DATASET_DIR,
+            RESULT_DIR,
+            device=args.device,
+            overrides=args.overrides,
+            stop_on_error=args.stop_on_error,
+            sweep_years=args.sweep_years,
+        )
+        failed = {name: error for name, error in results.items() if error}
+        print(f"共 {len(results)} 个实验，完成 {len(results) - len(failed)} 个")
+        for name, error in failed.items():
+            print(f"失败：{name}：{error}")
@@ -7,39 +7,71 @@ FilePath: /HydroNeimeng/scripts/timeseries_columns_trans.py
 Description: 这是默认设置,请设置`customMade`, 打开koroFileHeader查看配置 进行设置: https://github.com/OBKoro1/koro1FileHeader/wiki/%E9%85%8D%E7%BD%AE
 """
 
-import pandas as pd
-import os
-
-# 指定文件夹路径
-folder_path = r"C:\Programming\test\test_neimenggu_csv"
-
-# 遍历文件夹中的所有CSV文件
-for filename in os.listdir(folder_path):
-    if filename.endswith(".csv"):
-        file_path = os.path.join(folder_path, filename)
-
-        # 读取CSV文件
-        df = pd.read_csv(file_path)
-
-        # 重命名列
-        if "surface_net_solar_radiation_hourly" in df.columns:
-            df = df.rename(
-                columns={
-                    "surface_net_solar_radiation_hourly": "surface_net_solar_radiation"
-                }
-            )
-
-        # 删除指定的列
-        columns_to_drop = [
-            "node1_flow(m^3/s)",
-            "pet(mm/day)",
-            "et(mm/day)",
-            "prcp(mm/day)",
-        ]
-        df = df.drop(
-            columns=[col for col in columns_to_drop if col in df.columns],
-            errors="ignore",
-        )
-
-        # 保存修改后的文件，文件名不变
-        df.to_csv(file_path, index=False)
+import argparse
+import json
+
+from hydroneimenggu.csv_columns import transform_folder
+
+# 默认的列重命名和删除规则
+DEFAULT_RENAME = {"surface_net_solar_radiation_hourly": "surface_net_solar_radiation"}
+DEFAULT_DROP = [
+    "node1_flow(m^3/s)",
+    "pet(mm/day)",
+    "et(mm/day)",
+    "prcp(mm/day)",
+]
+
+
+def read_spec(spec_file):
+    """
+    读取 JSON 格式的规则文件，形如 {"rename": {"旧列名": "新列名"}, "drop": ["列名"]}。
+    """
+    with open(spec_file, "r", encoding="utf-8") as fp:
+        spec = json.load(fp)
+    return spec.get("rename", {}), spec.get("drop", [])
+
+
+def parse_rename(items):
+    """把 ["旧列名=新列名", ...] 转为字典"""
+    rename = {}
+    for item in items:
+        old, sep, new = item.partition("=")
+        if not sep or not old or not new:
+            raise argparse.ArgumentTypeError(f"重命名规则应为 旧列名=新列名: {item}")
+        rename[old] = new
+    return rename
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="批量重命名、删除流域时间序列CSV的列")
+    parser.add_argument("folder", help="CSV 文件所在的文件夹")
+    parser.add_argument(
+        "--spec",
+        default=None,
+        help='JSON 规则文件，形如 {"rename": {"旧列名": "新列名"}, "drop": ["列名"]}',
+    )
+    parser.add_argument(
+        "--rename",
+        nargs="+",
+        default=None,
+        metavar="OLD=NEW",
+        help="重命名规则，与 --spec 中的规则合并",
+    )
+    parser.add_argument(
+        "--drop", nargs="+", default=None, help="要删除的列，与 --spec 中的规则合并"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1, help="并行使用的进程数，默认 1 为串行"
+    )
+    args = parser.parse_args()
+    if args.spec is None and args.rename is None and args.drop is None:
+        # 未给定任何规则时使用默认规则
+        rename, drop = dict(DEFAULT_RENAME), list(DEFAULT_DROP)
+    else:
+        rename, drop = read_spec(args.spec) if args.spec is not None else ({}, [])
+        rename.update(parse_rename(args.rename or []))
+        drop = list(drop) + list(args.drop or [])
+    summary_df = transform_folder(args.folder, rename, set(drop), workers=args.workers)
+    changed = summary_df[summary_df["status"] != "unchanged"]
+    if not changed.empty:
+        print(changed.to_string(index=False))
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+
+"""Tests for `hydroneimenggu.aggregation`."""
+
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from hydroneimenggu.aggregation import (
+    AggregatedBasinView,
+    aggregate_values,
+    get_basin_loader,
+    label_offset,
+    steps_per_period,
+)
+from hydroneimenggu.basin_store import BasinArrayStore
+
+
+class TestAggregation(unittest.TestCase):
+    """Tests for `hydroneimenggu.aggregation`."""
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        # starts and ends in the middle of a day, with a gap of 5 hours
+        self.time = pd.date_range("2001-01-01 07:00", periods=24 * 5, freq="1h")
+        self.time = self.time.delete(range(30, 35))
+        self.values = np.column_stack(
+            [rng.gamma(0.5, 1.0, self.time.size), rng.normal(size=self.time.size)]
+        )
+        self.values[50, 1] = np.nan
+
+    def test_steps_per_period(self):
+        self.assertEqual(steps_per_period("3h"), 3)
+        self.assertEqual(steps_per_period("1D"), 24)
+        with self.assertRaises(ValueError):
+            steps_per_period("90min")
+
+    def test_matches_resample(self):
+        df = pd.DataFrame(self.values, index=self.time, columns=["sum", "mean"])
+        for time_unit in ["3h", "1D"]:
+            time, values = aggregate_values(
+                self.time, self.values, time_unit, ["sum", "mean"]
+            )
+            resampled = df.resample(time_unit, offset=label_offset(time_unit))
+            counts = resampled["sum"].count().reindex(time)
+            expected_sum = resampled["sum"].sum().reindex(time)
+            expected_sum[counts < steps_per_period(time_unit)] = np.nan
+            np.testing.assert_allclose(values[:, 0], expected_sum.values)
+            np.testing.assert_allclose(
+                values[:, 1], resampled["mean"].mean().reindex(time).values
+            )
+        # the first and last days are partial, so their sums are missing
+        self.assertTrue(np.isnan(values[[0, -1], 0]).all())
+        self.assertFalse(np.isnan(values[[0, -1], 1]).any())
+
+    def test_view_of_store(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            csv_file = os.path.join(tmp_dir, "basin_a.csv")
+            pd.DataFrame(
+                {
+                    "time": self.time,
+                    "streamflow": self.values[:, 0],
+                    "sm_surface": self.values[:, 1],
+                }
+            ).to_csv(csv_file, index=False)
+            store = BasinArrayStore(os.path.join(tmp_dir, "store"), [csv_file])
+            self.assertIs(get_basin_loader(store, "1h"), store)
+            view = get_basin_loader(store, "3h")
+            self.assertIsInstance(view, AggregatedBasinView)
+            self.assertIs(get_basin_loader(store, "3h"), view)
+            expected_time, expected = aggregate_values(
+                self.time, self.values, "3h", ["sum", "mean"]
+            )
+            basin = view.load_basin("basin_a")
+            np.testing.assert_array_equal(basin.index, expected_time)
+            np.testing.assert_allclose(basin.values, expected)
+            event = view.load_basin(
+                "basin_a", ["sm_surface"], "2001-01-02", "2001-01-02 05:00"
+            )
+            self.assertEqual(list(event.index.hour), [1, 4])
+            self.assertEqual(len(view._basin_cache), 2)
+            store.close()
+
+    def test_matches_the_stored_coarser_series(self):
+        # the 3h and 1D CSVs as stored next to the 1h ones: 3h rows are labelled
+        # 01:00, 04:00, ... and hold the sum or mean of that hour and the two
+        # following ones, 1D rows the sum or mean of the day
+        rng = np.random.default_rng(1)
+        hourly = pd.DataFrame(
+            {
+                "total_precipitation_hourly": rng.gamma(0.5, 1.0, 24 * 4),
+                "sm_surface": rng.random(24 * 4),
+            },
+            index=pd.date_range("2001-01-01", periods=24 * 4, freq="1h", name="time"),
+        )
+        stored = {"1h": hourly}
+        for time_unit, start in [("3h", "2001-01-01 01:00"), ("1D", "2001-01-01")]:
+            last_step = pd.Timedelta(time_unit) - pd.Timedelta("1h")
+            labels = pd.date_range(start, hourly.index[-1] - last_step, freq=time_unit)
+            periods = [hourly.loc[label : label + last_step] for label in labels]
+            stored[time_unit] = pd.DataFrame(
+                {
+                    "total_precipitation_hourly": [
+                        period["total_precipitation_hourly"].sum() for period in periods
+                    ],
+                    "sm_surface": [period["sm_surface"].mean() for period in periods],
+                },
+                index=labels.rename("time"),
+            )
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            stores = {}
+            for time_unit, df in stored.items():
+                csv_file = os.path.join(tmp_dir, time_unit, "basin_a.csv")
+                os.makedirs(os.path.dirname(csv_file))
+                df.reset_index().to_csv(csv_file, index=False)
+                stores[time_unit] = BasinArrayStore(
+                    os.path.join(tmp_dir, "store", time_unit), [csv_file]
+                )
+            for time_unit in ["3h", "1D"]:
+                expected = stores[time_unit].load_basin("basin_a")
+                derived = get_basin_loader(stores["1h"], time_unit).load_basin(
+                    "basin_a"
+                )
+                # the partial periods at the ends have a mean but no sum
+                partial = derived.drop(expected.index)
+                self.assertTrue(partial["total_precipitation_hourly"].isna().all())
+                derived = derived.loc[expected.index]
+                np.testing.assert_allclose(derived.values, expected.values)
+            # the 00:00 hour falls in the period that starts at 22:00 the day before
+            derived = get_basin_loader(stores["1h"], "3h").load_basin("basin_a")
+            self.assertEqual(list(derived.index.hour[:3]), [22, 1, 4])
+            for store in stores.values():
+                store.close()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+"""Tests for `hydroneimenggu.attributes`."""
+
+
+import json
+import os
+import tempfile
+import time
+import unittest
+
+import numpy as np
+import xarray as xr
+
+from hydroneimenggu.attributes import AttributeMatrixCache, matrix_key
+
+
+class TestAttributes(unittest.TestCase):
+    """Tests for `hydroneimenggu.attributes`."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.attr_file = os.path.join(self.tmp_dir.name, "attributes.nc")
+        self.stat_file = os.path.join(self.tmp_dir.name, "dapengscaler_stat.json")
+        self.cache_dir = os.path.join(self.tmp_dir.name, "attribute_matrix")
+        xr.Dataset(
+            {
+                "area": ("basin", [100.0, 300.0, 500.0]),
+                "slp_dg_sav": ("basin", [2.0, np.nan, 6.0]),
+            },
+            coords={"basin": ["a", "b", "c"]},
+        ).to_netcdf(self.attr_file)
+        self._write_stats(area_mean=300.0)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _write_stats(self, area_mean):
+        with open(self.stat_file, "w") as fp:
+            json.dump(
+                {
+                    "area": [0, 1, area_mean, 200.0],
+                    "slp_dg_sav": [0, 1, 4.0, 2.0],
+                },
+                fp,
+            )
+
+    def test_matrix_is_cached_until_the_stats_change(self):
+        variables = ["slp_dg_sav", "area"]
+        cache = AttributeMatrixCache(self.cache_dir, self.attr_file)
+        matrix = cache.matrix(["c", "a"], self.stat_file, variables)
+        np.testing.assert_allclose(matrix.to_numpy(), [[1.0, 1.0], [-1.0, -1.0]])
+        self.assertEqual(list(matrix.index), ["c", "a"])
+        missing = cache.matrix(["b"], self.stat_file, variables)
+        self.assertTrue(np.isnan(missing.loc["b", "slp_dg_sav"]))
+        key = matrix_key(["c", "a"], variables, self.stat_file, self.attr_file)
+        matrix_file = os.path.join(self.cache_dir, f"{key}.npy")
+        saved = os.stat(matrix_file).st_mtime_ns
+
+        # another process reads the saved matrix
+        other = AttributeMatrixCache(self.cache_dir, self.attr_file)
+        np.testing.assert_allclose(
+            other.matrix(["c", "a"], self.stat_file, variables), matrix
+        )
+        self.assertEqual(os.stat(matrix_file).st_mtime_ns, saved)
+
+        # new statistics make the matrix stale, also in memory
+        time.sleep(0.01)
+        self._write_stats(area_mean=100.0)
+        for instance in [cache, other]:
+            matrix = instance.matrix(["c", "a"], self.stat_file, variables)
+            np.testing.assert_allclose(matrix["area"], [2.0, 0.0])
+
+    def test_caches_in_other_processes_keep_each_others_entries(self):
+        first = AttributeMatrixCache(self.cache_dir, self.attr_file)
+        second = AttributeMatrixCache(self.cache_dir, self.attr_file)
+        first.matrix(["a"], self.stat_file, ["area"])
+        second.matrix(["b"], self.stat_file, ["area"])
+        with open(os.path.join(self.cache_dir, "manifest.json")) as fp:
+            entries = json.load(fp)
+        keys = [
+            matrix_key([basin], ["area"], self.stat_file, self.attr_file)
+            for basin in ["a", "b"]
+        ]
+        self.assertEqual(sorted(entries), sorted(keys))
+
+        # a third one reads both matrices from disk
+        third = AttributeMatrixCache(self.cache_dir, self.attr_file)
+        saved = {
+            key: os.stat(os.path.join(self.cache_dir, f"{key}.npy")).st_mtime_ns
+            for key in keys
+        }
+        np.testing.assert_allclose(third.matrix(["a"], self.stat_file, ["area"]), -1)
+        np.testing.assert_allclose(third.matrix(["b"], self.stat_file, ["area"]), 0)
+        for key in keys:
+            matrix_file = os.path.join(self.cache_dir, f"{key}.npy")
+            self.assertEqual(os.stat(matrix_file).st_mtime_ns, saved[key])
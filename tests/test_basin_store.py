@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+"""Tests for `hydroneimenggu.basin_store`."""
+
+
+import os
+import pickle
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from hydroneimenggu.basin_store import BasinArrayStore, is_basin_store
+
+
+class TestBasinArrayStore(unittest.TestCase):
+    """Tests for `hydroneimenggu.basin_store`."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.csv_file = os.path.join(self.tmp_dir.name, "basin_a.csv")
+        self.csv_df = pd.DataFrame(
+            {
+                "time": pd.date_range("2001-01-01 06:00", periods=24, freq="1h"),
+                "streamflow": np.linspace(0.1, 2.4, 24),
+                "total_precipitation_hourly": np.arange(24) / 7.0,
+            }
+        )
+        self.csv_df.to_csv(self.csv_file, index=False)
+        self.nc_file = os.path.join(self.tmp_dir.name, "timeseries_1h_batch.nc")
+        self.nc_ds = xr.Dataset(
+            {
+                "total_precipitation_hourly": (
+                    ("basin", "time"),
+                    np.arange(96, dtype=np.float32).reshape(2, 48),
+                )
+            },
+            coords={
+                "basin": ["basin_a", "basin_b"],
+                "time": pd.date_range("2001-01-01", periods=48, freq="1h"),
+            },
+        )
+        self.nc_ds.to_netcdf(self.nc_file)
+        self.store_dir = os.path.join(self.tmp_dir.name, "store")
+        self.store = BasinArrayStore(self.store_dir, [self.csv_file, self.nc_file])
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp_dir.cleanup()
+
+    def test_layout(self):
+        self.assertTrue(is_basin_store(self.store_dir))
+        self.assertEqual(self.store.basins, ["basin_a", "basin_b"])
+        self.assertEqual(
+            self.store.variables, ["streamflow", "total_precipitation_hourly"]
+        )
+        self.assertEqual(self.store.data.shape, (2, 48, 2))
+        self.assertEqual(self.store.data.dtype, np.float64)
+        self.assertFalse(self.store.data.flags.writeable)
+
+    def test_load_basin(self):
+        basin_b = self.store.load_basin("basin_b", ["total_precipitation_hourly"])
+        np.testing.assert_array_equal(
+            basin_b["total_precipitation_hourly"].values, np.arange(48, 96)
+        )
+        # the CSV comes first and wins where both sources have basin_a
+        basin_a = self.store.load_basin("basin_a")
+        csv_rows = basin_a.index.isin(self.csv_df["time"])
+        np.testing.assert_array_equal(
+            basin_a["total_precipitation_hourly"].values[csv_rows],
+            self.csv_df["total_precipitation_hourly"].values,
+        )
+        np.testing.assert_array_equal(
+            basin_a["total_precipitation_hourly"].values[~csv_rows],
+            np.arange(48)[~csv_rows],
+        )
+        self.assertEqual(basin_a["streamflow"].isna().sum(), 24)
+        event = self.store.load_basin(
+            "basin_a", start="2001-01-01 08:00", end="2001-01-01 10:00"
+        )
+        np.testing.assert_array_equal(
+            event["streamflow"].values, self.csv_df["streamflow"].values[2:5]
+        )
+
+    def test_to_dataset_and_pickle(self):
+        ds = self.store.to_dataset()
+        np.testing.assert_array_equal(
+            ds["total_precipitation_hourly"].sel(basin="basin_b").values,
+            np.arange(48, 96),
+        )
+        copy = pickle.loads(pickle.dumps(self.store))
+        self.assertIsNone(copy._data)
+        np.testing.assert_array_equal(copy.data, self.store.data)
+
+    def test_rebuild_when_source_changes(self):
+        self.assertFalse(self.store.refresh())
+        self.nc_ds["total_precipitation_hourly"] += 1
+        self.nc_ds.to_netcdf(self.nc_file)
+        os.utime(self.nc_file, ns=(0, 0))
+        self.assertTrue(self.store.refresh())
+        np.testing.assert_array_equal(
+            self.store.load_basin("basin_b")["total_precipitation_hourly"].values,
+            np.arange(49, 97),
+        )
+
+    def test_sources_without_time_are_skipped(self):
+        attr_file = os.path.join(self.tmp_dir.name, "nmg_1h_attributes.nc")
+        xr.Dataset(
+            {"area": ("basin", [1.0, 2.0, 3.0])},
+            coords={"basin": ["basin_a", "basin_b", "basin_c"]},
+        ).to_netcdf(attr_file)
+        store = BasinArrayStore(
+            os.path.join(self.tmp_dir.name, "store_attr"),
+            [self.csv_file, attr_file, self.nc_file],
+        )
+        self.assertEqual(store.basins, self.store.basins)
+        self.assertEqual(store.variables, self.store.variables)
+        np.testing.assert_array_equal(store.data, self.store.data)
+        self.assertTrue(store.is_fresh())
+        store.close()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+
+"""Tests for `hydroneimenggu.cache_index`."""
+
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import xarray as xr
+
+from hydroneimenggu import cache_index
+from hydroneimenggu.cache_index import BasinFileIndex
+
+
+class FlakyIndex(BasinFileIndex):
+    """An index whose scans fail until `failing` is cleared"""
+
+    failing = True
+
+    def _scan_file(self, file_path):
+        if self.failing:
+            raise OSError("transient read error")
+        return super(FlakyIndex, self)._scan_file(file_path)
+
+
+class TestCacheIndex(unittest.TestCase):
+    """Tests for `hydroneimenggu.cache_index`."""
+
+    def test_failed_scan_is_retried(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            nc_file = os.path.join(cache_dir, "basins_3h.nc")
+            xr.Dataset(coords={"basin": ["a", "b"]}).to_netcdf(nc_file)
+            index = FlakyIndex(cache_dir)
+            self.assertNotIn("basins_3h.nc", index.files)
+            self.assertIsNone(index.find("b"))
+
+            # the file is unchanged, but the failed scan left no entry
+            index.failing = False
+            self.assertTrue(index.refresh())
+            self.assertEqual(index.find("b", "3h"), nc_file)
+            self.assertEqual(BasinFileIndex(cache_dir).find("a"), nc_file)
+
+    def test_file_deleted_during_refresh_is_forgotten(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            nc_file = os.path.join(cache_dir, "basins_3h.nc")
+            xr.Dataset(coords={"basin": ["a"]}).to_netcdf(nc_file)
+            index = BasinFileIndex(cache_dir)
+            self.assertEqual(index.find("a"), nc_file)
+            # listed, but gone when its fingerprint is taken
+            with mock.patch.object(cache_index, "file_fingerprint", return_value=None):
+                self.assertTrue(index.refresh())
+            self.assertIsNone(index.find("a"))
+            self.assertNotIn("basins_3h.nc", index.files)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+
+"""Tests for `hydroneimenggu.csv_columns`."""
+
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from hydroneimenggu.csv_columns import plan_columns, transform_csv, transform_folder
+
+RENAME = {"surface_net_solar_radiation_hourly": "surface_net_solar_radiation"}
+DROP = {"pet(mm/day)", "prcp(mm/day)"}
+CONTENT = (
+    "time,streamflow,pet(mm/day),surface_net_solar_radiation_hourly\n"
+    "2020-06-01 01:00:00,0.10,1.5,1.0e+06\n"
+    "2020-06-01 04:00:00,,2,000123\n"
+    "2020-06-01 07:00:00,NaN,-0.000,3.14159265358979323846\n"
+)
+EXPECTED = (
+    "time,streamflow,surface_net_solar_radiation\n"
+    "2020-06-01 01:00:00,0.10,1.0e+06\n"
+    "2020-06-01 04:00:00,,000123\n"
+    "2020-06-01 07:00:00,NaN,3.14159265358979323846\n"
+)
+
+
+class TestCsvColumns(unittest.TestCase):
+    """Tests for `hydroneimenggu.csv_columns`."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.csv_file = self._write("basin.csv", CONTENT)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _write(self, filename, content):
+        file_path = os.path.join(self.tmp_dir.name, filename)
+        with open(file_path, "w", newline="") as fp:
+            fp.write(content)
+        return file_path
+
+    def _read(self, file_path):
+        with open(file_path, "r", newline="") as fp:
+            return fp.read()
+
+    def test_plan_columns(self):
+        keep, new = plan_columns(["a", "pet(mm/day)", "b"], {"b": "c"}, DROP)
+        self.assertEqual(keep, ["a", "b"])
+        self.assertEqual(new, ["a", "c"])
+        self.assertEqual(plan_columns(["a"], RENAME, DROP), (["a"], ["a"]))
+
+    def test_values_keep_their_formatting(self):
+        summary = transform_csv(self.csv_file, RENAME, DROP)
+        self.assertEqual(summary["status"], "changed")
+        self.assertEqual(summary["dropped"], "pet(mm/day)")
+        self.assertEqual(
+            summary["renamed"],
+            "surface_net_solar_radiation_hourly->surface_net_solar_radiation",
+        )
+        self.assertEqual(self._read(self.csv_file).replace(os.linesep, "\n"), EXPECTED)
+        self.assertEqual(os.listdir(self.tmp_dir.name), ["basin.csv"])
+
+    def test_unchanged_file_is_not_touched(self):
+        csv_file = self._write("done.csv", EXPECTED)
+        os.utime(csv_file, ns=(1_000_000_000, 1_000_000_000))
+        summary = transform_csv(csv_file, RENAME, DROP)
+        self.assertEqual(summary["status"], "unchanged")
+        self.assertEqual(os.stat(csv_file).st_mtime_ns, 1_000_000_000)
+        self.assertEqual(self._read(csv_file), EXPECTED)
+
+    def test_failure_leaves_the_original(self):
+        with mock.patch("os.replace", side_effect=OSError("disk full")):
+            summary = transform_csv(self.csv_file, RENAME, DROP)
+        self.assertEqual(summary["status"], "failed")
+        self.assertEqual(summary["error"], "OSError: disk full")
+        self.assertEqual(self._read(self.csv_file), CONTENT)
+        self.assertEqual(os.listdir(self.tmp_dir.name), ["basin.csv"])
+
+    def test_transform_folder(self):
+        self._write("done.csv", EXPECTED)
+        self._write("broken.csv", "")
+        self._write("notes.txt", CONTENT)
+        summary = transform_folder(self.tmp_dir.name, RENAME, DROP, workers=2)
+        self.assertEqual(
+            dict(zip(summary["file"], summary["status"])),
+            {"basin.csv": "changed", "broken.csv": "failed", "done.csv": "unchanged"},
+        )
+        self.assertEqual(self._read(self.csv_file).replace(os.linesep, "\n"), EXPECTED)
+        notes = os.path.join(self.tmp_dir.name, "notes.txt")
+        self.assertEqual(self._read(notes), CONTENT)
@@ -0,0 +1,353 @@
+#!/usr/bin/env python
+
+"""Tests for `hydroneimenggu.dmca_esr`."""
+
+
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from hydroneimenggu.dmca_esr import (
+    EPS,
+    _segment_reduce,
+    _walk_left,
+    _walk_right,
+    movmean,
+    rainfall_runoff_event_identify,
+    step1_step2_tr_and_fluctuations_timeseries,
+    step3_core_identification,
+    step10_checks_on_overlapping_events,
+    window_fluctuations,
+)
+
+
+def walk_left_loop(start, stop, cont):
+    k = start
+    while k > stop and cont[k]:
+        k -= 1
+    return k
+
+
+def walk_right_loop(start, stop, cont):
+    k = start
+    while k < stop and cont[k]:
+        k += 1
+    return k
+
+
+def baseflow_loop(beginning_flow, end_flow, flow):
+    baseflow = np.copy(flow)
+    bounds = [k for pair in zip(beginning_flow, end_flow) for k in pair]
+    for index_beg, index_end in zip(bounds[:-1], bounds[1:]):
+        segment = flow[index_beg : index_end + 1]
+        if np.isnan(segment).sum() >= len(segment) * 0.9:
+            baseflow[index_beg : index_end + 1] = np.nan
+        elif index_end - index_beg == 1:
+            baseflow[index_beg] = flow[index_beg]
+            baseflow[index_end] = flow[index_end]
+        elif flow[index_beg] < flow[index_end]:
+            increment = (flow[index_end] - flow[index_beg]) / (index_end - index_beg)
+            for m in range(index_beg + 1, index_end):
+                baseflow[m] = baseflow[index_beg] + increment * (m - index_beg)
+        elif flow[index_beg] > flow[index_end]:
+            increment = (flow[index_beg] - flow[index_end]) / (index_end - index_beg)
+            for m in range(index_beg + 1, index_end):
+                baseflow[m] = baseflow[index_beg] - increment * (m - index_beg)
+    for m in range(len(baseflow)):
+        baseflow[m] = min(baseflow[m], flow[m])
+    return baseflow
+
+
+def identify_events_loop(
+    rain, flow, rain_min=0.001, max_window=150, multiple=24, flow_threshold=0.0001
+):
+    """The per-event loops of the steps 4 to 11 of notebook/get_events.ipynb
+
+    Two changes let it run where the notebook fails: the positions are kept
+    as integers instead of int(np.where(time == t)[0]), which NumPy 2 rejects,
+    and series without any event core, or whose last run of overlapping
+    events has several overlaps, give results instead of IndexErrors.
+    """
+    time = rain.index.to_numpy()
+    rain = rain.to_numpy() / multiple
+    flow = flow.to_numpy() / multiple
+    n = rain.size
+    tr, fluct_rain, fluct_flow, fluct_bivariate = (
+        step1_step2_tr_and_fluctuations_timeseries(rain, flow, rain_min, max_window)
+    )
+    beginning_core, end_core = step3_core_identification(fluct_bivariate)
+
+    def quiet_after(end):
+        return (
+            end + 2 < n
+            and np.fabs(fluct_rain[end + 1]) < EPS
+            and np.fabs(fluct_rain[end + 2]) < EPS
+        )
+
+    def quiet_before(beginning):
+        return (
+            beginning >= 2
+            and np.fabs(fluct_rain[beginning - 1]) < EPS
+            and np.fabs(fluct_rain[beginning - 2]) < EPS
+        )
+
+    # step 4
+    end_rain = end_core.copy()
+    for g in range(end_core.size):
+        if quiet_after(end_core[g]):
+            if np.fabs(rain[end_core[g]]) < EPS:
+                while (
+                    end_rain[g] > beginning_core[g]
+                    and np.fabs(rain[end_rain[g]]) < EPS
+                ):
+                    end_rain[g] -= 1
+            else:
+                bound = beginning_core[g + 1] if g + 1 < beginning_core.size else n
+                while end_rain[g] < bound and rain[end_rain[g]] > rain_min:
+                    end_rain[g] += 1
+                end_rain[g] -= 1
+        else:
+            while end_rain[g] >= beginning_core[g] and rain[end_rain[g]] > rain_min:
+                end_rain[g] -= 1
+            while end_rain[g] >= beginning_core[g] and rain[end_rain[g]] < rain_min:
+                end_rain[g] -= 1
+    # step 5
+    beginning_rain = beginning_core.copy()
+    for g in range(beginning_core.size):
+        if (
+            quiet_before(beginning_core[g])
+            and np.fabs(rain[beginning_core[g]]) < EPS
+        ):
+            while (
+                beginning_rain[g] < end_rain[g]
+                and np.fabs(rain[beginning_rain[g]]) < EPS
+            ):
+                beginning_rain[g] += 1
+        else:
+            bound = end_rain[g - 1] if g >= 1 else -1
+            while beginning_rain[g] > bound and rain[beginning_rain[g]] > rain_min:
+                beginning_rain[g] -= 1
+            beginning_rain[g] += 1
+    # step 6
+    events = list(zip(beginning_rain, end_rain, beginning_core, end_core))
+    if events and events[0][0] == 0:
+        events = events[1:]
+    if events and events[-1][1] == n - 1:
+        events = events[:-2]
+    events = [
+        event
+        for event in events
+        if not (
+            event[0] > event[1]
+            or rain[event[0] - 1] > rain_min
+            or rain[event[1] + 1] > rain_min
+        )
+    ]
+    # steps 7 and 8
+    checked = []
+    for g, (b_rain, e_rain, b_core, e_core) in enumerate(events):
+        if quiet_after(e_core):
+            e_flow = e_rain
+            bound = events[g + 1][2] + tr if g + 1 < len(events) else n
+            bound = min(bound, n)
+            while e_flow < bound and fluct_flow[e_flow] <= 0:
+                e_flow += 1
+            while e_flow < bound and fluct_flow[e_flow] > 0:
+                e_flow += 1
+            e_flow -= 1
+        else:
+            e_flow = e_core
+            while e_flow >= b_core and fluct_flow[e_flow] <= 0:
+                e_flow -= 1
+        b_flow = b_rain if quiet_before(b_core) else b_core
+        while b_flow < e_rain and fluct_flow[b_flow] >= 0:
+            b_flow += 1
+        checked.append([b_rain, e_rain, b_flow, e_flow])
+    # step 9
+    events = [
+        [b_rain, e_rain, b_flow, e_flow]
+        for b_rain, e_rain, b_flow, e_flow in checked
+        if not (
+            e_flow <= b_flow
+            or fluct_flow[b_flow] > 0
+            or fluct_flow[e_flow] < 0
+            or b_flow < b_rain
+            or e_flow < e_rain
+        )
+    ]
+    # step 10
+    markers = [
+        g
+        for g in range(len(events) - 1)
+        if events[g][1] > events[g + 1][0] or events[g][3] > events[g + 1][2]
+    ]
+    dropped = set()
+    q = 0
+    while q < len(markers) - 1:
+        to_group = [markers[q]]
+        while q < len(markers) - 1 and markers[q] == markers[q + 1] - 1:
+            to_group.append(markers[q + 1])
+            q += 1
+        events[to_group[0]][1] = events[to_group[-1] + 1][1]
+        events[to_group[0]][3] = events[to_group[-1] + 1][3]
+        dropped.update(to_group[1:])
+        dropped.add(to_group[-1] + 1)
+        q += 1
+    events = [event for g, event in enumerate(events) if g not in dropped]
+    # step 11
+    beginning_flow = [event[2] for event in events]
+    end_flow = [event[3] for event in events]
+    runoff = flow - baseflow_loop(beginning_flow, end_flow, flow)
+    rows = []
+    hours = np.timedelta64(1, "s") * 60 * 60 * multiple
+    for b_rain, e_rain, b_flow, e_flow in events:
+        duration_rain = (time[e_rain] - time[b_rain]) / hours
+        duration_runoff = (time[e_flow] - time[b_flow]) / hours
+        volume_rain = np.nansum(rain[b_rain:e_rain]) * multiple
+        volume_runoff = np.nansum(runoff[b_flow:e_flow]) * multiple
+        with np.errstate(divide="ignore", invalid="ignore"):
+            runoff_ratio = np.float64(volume_runoff) / volume_rain
+        peak = flow[b_flow:e_flow].max() if e_flow > b_flow else np.nan
+        if (
+            peak < flow_threshold
+            or duration_rain > 2400
+            or duration_runoff > 2400
+            or volume_rain == 0
+            or volume_runoff == 0
+            or runoff_ratio > 1
+        ):
+            continue
+        rows.append(
+            {
+                "BEGINNING_RAIN": time[b_rain],
+                "END_RAIN": time[e_rain],
+                "DURATION_RAIN": duration_rain,
+                "BEGINNING_FLOW": time[b_flow],
+                "END_FLOW": time[e_flow],
+                "DURATION_RUNOFF": duration_runoff,
+                "VOLUME_RAIN": volume_rain,
+                "VULUME_RUNOFF": volume_runoff,
+                "RUNOFF_RATIO": runoff_ratio,
+            }
+        )
+    return pd.DataFrame(rows)
+
+
+class TestDmcaEsr(unittest.TestCase):
+    """Tests for `hydroneimenggu.dmca_esr`."""
+
+    def setUp(self):
+        self.rng = np.random.default_rng(42)
+
+    def test_walks_match_loops(self):
+        cont = self.rng.random(200) < 0.7
+        start = self.rng.integers(0, 200, 50)
+        stop = self.rng.integers(-1, 201, 50)
+        np.testing.assert_array_equal(
+            _walk_left(start, stop, cont),
+            [walk_left_loop(a, b, cont) for a, b in zip(start, stop)],
+        )
+        np.testing.assert_array_equal(
+            _walk_right(start, stop, cont),
+            [walk_right_loop(a, b, cont) for a, b in zip(start, stop)],
+        )
+
+    def test_window_fluctuations_match_movmean(self):
+        x_int = np.cumsum(self.rng.gamma(0.5, 2.0, 500))
+        half_widths = np.arange(1, 20)
+        fluct = np.hstack(
+            [
+                window_fluctuations(x_int, half_widths, begin, min(begin + 64, 500))
+                for begin in range(0, 500, 64)
+            ]
+        )
+        for h, row in zip(half_widths, fluct):
+            np.testing.assert_allclose(
+                row, x_int - movmean(x_int, 2 * h + 1), rtol=0, atol=1e-9
+            )
+
+    def test_segment_reduce(self):
+        values = self.rng.random(100)
+        starts = np.array([0, 10, 40, 40, 95])
+        ends = np.array([5, 30, 40, 60, 100])
+        np.testing.assert_allclose(
+            _segment_reduce(np.add, values, starts, ends, 0.0),
+            [values[a:b].sum() for a, b in zip(starts, ends)],
+        )
+        peaks = _segment_reduce(np.maximum, values, starts, ends)
+        self.assertTrue(np.isnan(peaks[2]))
+        np.testing.assert_array_equal(
+            np.delete(peaks, 2),
+            [values[a:b].max() for a, b in zip(starts, ends) if b > a],
+        )
+
+    def test_overlapping_events_are_merged(self):
+        beginning_rain = np.array([0, 10, 15, 30, 50, 60])
+        end_rain = np.array([5, 20, 25, 35, 65, 70])
+        beginning_flow = beginning_rain + 1
+        end_flow = end_rain + 2
+        merged = step10_checks_on_overlapping_events(
+            beginning_rain, end_rain, beginning_flow, end_flow
+        )
+        # the 2nd and 3rd events overlap and become one; the last two overlap
+        # too, but as in the loop version an overlap that is only the last
+        # marker is left as it is
+        np.testing.assert_array_equal(merged[0], [0, 10, 30, 50, 60])
+        np.testing.assert_array_equal(merged[1], [5, 25, 35, 65, 70])
+        np.testing.assert_array_equal(merged[3], [7, 27, 37, 67, 72])
+
+    def test_rainfall_runoff_event_identify(self):
+        n = 3000
+        rain = np.zeros(n)
+        for start in range(100, n - 200, 300):
+            rain[start : start + 12] = self.rng.gamma(2.0, 2.0, 12)
+        kernel = np.exp(-np.arange(100) / 15.0)
+        flow = np.convolve(rain, kernel / kernel.sum())[:n] * 0.4 + 0.01
+        time = pd.date_range("2001-01-01", periods=n, freq="1h")
+        events = rainfall_runoff_event_identify(
+            pd.Series(rain, time), pd.Series(flow, time), multiple=1
+        )
+        self.assertGreater(len(events), 0)
+        self.assertTrue((events["BEGINNING_RAIN"] <= events["END_RAIN"]).all())
+        self.assertTrue((events["BEGINNING_FLOW"] < events["END_FLOW"]).all())
+        self.assertTrue(events["BEGINNING_RAIN"].is_monotonic_increasing)
+        self.assertTrue((events["RUNOFF_RATIO"] <= 1).all())
+
+    def test_events_match_the_loop_version(self):
+        n = 1500
+        time = pd.date_range("2001-01-01", periods=n, freq="1h")
+        series = []
+        for _ in range(5):
+            # separated storms and the flow they produce
+            rain = np.zeros(n)
+            for start in self.rng.integers(0, n - 20, 12):
+                rain[start : start + self.rng.integers(2, 15)] += self.rng.gamma(2, 2)
+            kernel = np.exp(-np.arange(80) / self.rng.uniform(5, 25))
+            flow = np.convolve(rain, kernel / kernel.sum())[:n] * 0.4 + 0.01
+            series.append((rain, flow))
+        for _ in range(3):
+            # noise without any relation between rain and flow
+            rain = self.rng.gamma(0.3, 1.0, n) * (self.rng.random(n) < 0.2)
+            series.append((rain, self.rng.gamma(1.0, 0.1, n)))
+        series.append((np.full(n, 0.5), np.full(n, 0.2)))
+        series.append((np.zeros(n), np.zeros(n)))
+        n_events = []
+        for rain, flow in series:
+            args = (pd.Series(rain, time), pd.Series(flow, time))
+            expected = identify_events_loop(*args, multiple=1)
+            events = rainfall_runoff_event_identify(*args, multiple=1)
+            n_events.append(len(events))
+            self.assertEqual(len(events), len(expected))
+            if len(expected) == 0:
+                continue
+            for column in events.columns:
+                if events[column].dtype.kind == "M":
+                    np.testing.assert_array_equal(events[column], expected[column])
+                else:
+                    np.testing.assert_allclose(
+                        events[column], expected[column], rtol=1e-9, atol=1e-12
+                    )
+        # the storms give events, the flat and empty series none
+        self.assertGreater(min(n_events[:5]), 0)
+        self.assertEqual(n_events[-2:], [0, 0])
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+
+"""Tests for `hydroneimenggu.event_metrics`."""
+
+
+import unittest
+
+import numpy as np
+
+from hydroneimenggu.event_metrics import METRICS_COLUMNS, compute_basin_event_metrics
+
+
+def _single_event_metrics(obs, pred, precip):
+    """The per-event definitions used by scripts/metrics.py before batching"""
+    valid = ~np.isnan(obs) & ~np.isnan(precip)
+    obs_coeff = (
+        np.sum(obs[valid]) / np.sum(precip[valid])
+        if np.sum(precip[valid]) != 0
+        else np.nan
+    )
+    valid = ~np.isnan(pred) & ~np.isnan(precip)
+    pred_coeff = (
+        np.sum(pred[valid]) / np.sum(precip[valid])
+        if np.sum(precip[valid]) != 0
+        else np.nan
+    )
+    rmse = np.sqrt(np.mean((pred - obs) ** 2))
+    correlation = np.corrcoef(obs, pred)[0, 1] if len(obs) > 1 else np.nan
+    denominator = np.sum((obs - np.mean(obs)) ** 2)
+    nse = 1 - np.sum((obs - pred) ** 2) / denominator if denominator != 0 else np.nan
+    return [rmse, correlation, nse, obs_coeff, pred_coeff]
+
+
+class TestEventMetrics(unittest.TestCase):
+    """Tests for `hydroneimenggu.event_metrics`."""
+
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        self.obs = rng.gamma(1.0, 1.0, 500)
+        self.pred = self.obs + rng.normal(0, 0.3, 500)
+        self.precip = rng.gamma(0.3, 2.0, 500)
+        self.obs[[50, 51, 300]] = np.nan
+        self.precip[400] = np.nan
+        # overlapping, unsorted, single-sample and trailing events
+        self.starts = np.array([0, 40, 45, 200, 120, 299, 490, 395])
+        self.ends = np.array([30, 60, 100, 201, 260, 310, 500, 410])
+
+    def test_matches_single_event_definitions(self):
+        df = compute_basin_event_metrics(
+            self.obs, self.pred, self.precip, self.starts, self.ends, "b1", "n1"
+        )
+        self.assertEqual(list(df.columns), METRICS_COLUMNS)
+        self.assertEqual(len(df), len(self.starts))
+        for i, (start, end) in enumerate(zip(self.starts, self.ends)):
+            with np.errstate(divide="ignore", invalid="ignore"):
+                expected = _single_event_metrics(
+                    self.obs[start:end], self.pred[start:end], self.precip[start:end]
+                )
+            np.testing.assert_allclose(
+                df.iloc[i, 4:].to_numpy(dtype=float), expected, rtol=1e-10
+            )
+
+    def test_empty_events(self):
+        df = compute_basin_event_metrics(
+            self.obs, self.pred, self.precip, np.array([10, 5]), np.array([10, 9])
+        )
+        self.assertTrue(df.loc[0, METRICS_COLUMNS[4:]].isna().all())
+        self.assertFalse(np.isnan(df.loc[1, "rmse"]))
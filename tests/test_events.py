@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+
+"""Tests for `hydroneimenggu.events`."""
+
+
+import os
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from hydroneimenggu.events import (
+    event_time_indices,
+    events_by_basin,
+    read_basin_events,
+    read_events_table,
+)
+
+EVENTS_CSV = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "csv",
+    "neimenggu_20205510_events.csv",
+)
+
+
+class TestEvents(unittest.TestCase):
+    """Tests for `hydroneimenggu.events`."""
+
+    def test_read_events_table(self):
+        events = read_events_table(EVENTS_CSV)
+        self.assertEqual(list(events.columns), ["BASIN", "BEGINNING_RAIN", "END_RAIN"])
+        self.assertTrue(pd.api.types.is_datetime64_any_dtype(events["BEGINNING_RAIN"]))
+        self.assertEqual(
+            events["BEGINNING_RAIN"].iloc[0], pd.Timestamp("2001-03-28 14:00:00")
+        )
+        # parsed once and served from the cache while the file is unchanged
+        self.assertIs(read_events_table(EVENTS_CSV), events)
+
+    def test_events_by_basin(self):
+        grouped = events_by_basin(read_events_table(EVENTS_CSV))
+        self.assertEqual(list(grouped), ["neimenggu_20205510"])
+        basin_events = read_basin_events(EVENTS_CSV, "neimenggu_20205510")
+        pd.testing.assert_frame_equal(grouped["neimenggu_20205510"], basin_events)
+        self.assertTrue(read_basin_events(EVENTS_CSV, "other").empty)
+
+    def test_event_time_indices(self):
+        time_index = pd.date_range("2001-01-01", periods=10, freq="1D")
+        series = pd.Series(np.arange(10), index=time_index)
+        start_times = pd.to_datetime(
+            ["2001-01-02 00:00", "2001-01-03 12:00", "2001-02-01 00:00"]
+        )
+        end_times = pd.to_datetime(
+            ["2001-01-04 00:00", "2001-01-05 12:00", "2001-02-05 00:00"]
+        )
+        starts, ends = event_time_indices(time_index, start_times, end_times)
+        for start, end, start_time, end_time in zip(
+            starts, ends, start_times, end_times
+        ):
+            np.testing.assert_array_equal(
+                series.iloc[start:end].to_numpy(),
+                series.loc[start_time:end_time].to_numpy(),
+            )
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+"""Tests for `hydroneimenggu.experiments`."""
+
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from hydroneimenggu.experiments import (
+    experiment_args,
+    experiment_matrix,
+    read_gage_ids,
+    split_test_results,
+    hydro_year_periods,
+)
+
+
+class TestExperiments(unittest.TestCase):
+    """Tests for `hydroneimenggu.experiments`."""
+
+    def test_matrix_trains_before_testing(self):
+        experiments = experiment_matrix(
+            ["nmg", "camels"], ["3h"], ["mtlflowssm"], modes=["test", "train"]
+        )
+        self.assertEqual(
+            experiments,
+            [
+                ("train", "nmg", "3h", "mtlflowssm"),
+                ("train", "camels", "3h", "mtlflowssm"),
+                ("test", "nmg", "3h", "mtlflowssm"),
+                ("test", "camels", "3h", "mtlflowssm"),
+            ],
+        )
+        with self.assertRaises(ValueError):
+            experiment_matrix(["nmg"], ["2h"])
+
+    def test_train_args(self):
+        args = experiment_args("train", "camels", "1D", "stlflow", "data", "results")
+        self.assertEqual(
+            os.path.basename(args["sub"]), "train_with_camels_1D_era5land_stlflow"
+        )
+        self.assertEqual(args["gage_id"], list(read_gage_ids("basin_us.csv")))
+        self.assertEqual(args["model_hyperparam"]["en_input_size"], 16)
+        self.assertEqual(args["model_hyperparam"]["output_size"], 1)
+        self.assertEqual(args["loss_param"]["data_gap"], [0])
+        self.assertEqual(args["min_time_unit"], "D")
+        self.assertNotIn("weight_path", args)
+
+    def test_test_args_use_the_training_run(self):
+        args = experiment_args(
+            "test",
+            "camels",
+            "3h",
+            "mtlflowssm",
+            "data",
+            "results",
+            device=1,
+            overrides={"batch_size": 64},
+        )
+        train_dir = os.path.join("results", "train_with_camels_3h_era5land_mtlflowssm")
+        self.assertEqual(
+            args["stat_dict_file"], os.path.join(train_dir, "dapengscaler_stat.json")
+        )
+        self.assertEqual(args["weight_path"], os.path.join(train_dir, "best_model.pth"))
+        self.assertFalse(args["train_mode"])
+        # trained on CAMELS, evaluated on the Neimenggu basins
+        self.assertEqual(args["gage_id"], list(read_gage_ids("basin_neimenggu.csv")))
+        self.assertEqual(args["model_hyperparam"]["forecast_length"], 8)
+        self.assertEqual(args["model_hyperparam"]["de_input_size"], 18)
+        self.assertEqual(args["ctx"], [1])
+        self.assertEqual(args["loss_param"]["device"], [1])
+        self.assertEqual(args["batch_size"], 64)
+
+    def test_hydro_year_periods(self):
+        self.assertEqual(
+            hydro_year_periods([2016, 2015], "3h"),
+            {
+                2015: ["2015-06-01-01", "2015-10-31-01"],
+                2016: ["2015-10-31-01", "2016-10-31-01"],
+            },
+        )
+        self.assertEqual(
+            hydro_year_periods([2020], "1D"), {2020: ["2019-10-31", "2020-10-31"]}
+        )
+
+    def test_split_test_results(self):
+        time = pd.date_range("2015-06-01 01:00", "2016-10-31 01:00", freq="3h")
+        ds = xr.Dataset(
+            {"streamflow": (("basin", "time"), np.random.rand(2, time.size))},
+            coords={"basin": ["a", "b"], "time": time},
+        )
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            ds.to_netcdf(os.path.join(tmp_dir, "pred.nc"))
+            folders = split_test_results(
+                tmp_dir,
+                {
+                    f"test_{year}": period
+                    for year, period in hydro_year_periods([2015, 2016], "3h").items()
+                },
+                tmp_dir,
+                file_names=["pred.nc"],
+            )
+            self.assertEqual(
+                [os.path.basename(folder) for folder in folders],
+                ["test_2015", "test_2016"],
+            )
+            with xr.open_dataset(os.path.join(folders[1], "pred.nc")) as year_ds:
+                expected = ds.sel(time=slice("2015-10-31 01:00", "2016-10-31 01:00"))
+                xr.testing.assert_equal(year_ds.load(), expected)
@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+
+"""Tests for `hydroneimenggu.inference`."""
+
+
+import importlib.util
+import json
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from hydroneimenggu.attributes import MEAN_PRCP_ATTRIBUTE
+from hydroneimenggu.experiments import VAR_C, model_hyperparam
+from hydroneimenggu.inference import (
+    Seq2SeqForecaster,
+    StreamingForecast,
+    model_kwargs,
+    seq2seq_inputs,
+)
+from hydroneimenggu.scaling import (
+    mean_precipitation,
+    normalize,
+    read_scaler_params,
+    read_stat_dict,
+)
+
+# recorded with torchhydro 0.2.0 (hydroutils 0.2.0): the statistics of
+# DapengScaler's cal_stat_all and the values of _prcp_norm and _trans_norm, for
+# a training run whose configuration log-normalizes only sm_surface and
+# streamflow; the mean precipitation is hydrodatasource's pre_mm_syr / (8760 / 3)
+TORCHHYDRO_CONFIG = {
+    "data_cfgs": {
+        "scaler": "DapengScaler",
+        "scaler_params": {
+            "prcp_norm_cols": ["streamflow"],
+            "gamma_norm_cols": ["sm_surface"],
+            "pbm_norm": False,
+        },
+    }
+}
+TORCHHYDRO_PRE_MM_SYR = [400.0, 300.0]
+TORCHHYDRO_STATS = {
+    "total_precipitation_hourly": [
+        0.0405,
+        2.3465,
+        1.3908749999999999,
+        1.7248504962387319,
+    ],
+    "sm_surface": [
+        -0.3857155003298761,
+        -0.16745138268264398,
+        -0.27636288841613665,
+        0.09152142673639282,
+    ],
+    "streamflow": [
+        -0.6106623038377298,
+        -0.06076861724841766,
+        -0.2820901904379645,
+        0.21400981263823507,
+    ],
+}
+TORCHHYDRO_VALUES = {
+    "total_precipitation_hourly": (
+        [[1.609, 2.561, 0.018], [2.132, 1.49, 7.361]],
+        [[0.12646, 0.678392, -0.795939], [0.429675, 0.057469, 3.461242]],
+    ),
+    "sm_surface": (
+        [[0.095, 0.216, 0.129], [0.341, 0.332, 0.186]],
+        [[-1.231866, 0.308401, -0.673806], [1.217076, 1.162946, 0.018401]],
+    ),
+    "streamflow": (
+        [[0.0666, 0.0499, 0.0217], [0.0006, 0.0073, 0.087]],
+        [[0.858341, 0.60457, -0.096603], [-2.202526, -0.718503, 1.358736]],
+    ),
+}
+
+HAS_TORCHHYDRO = all(
+    importlib.util.find_spec(name) is not None for name in ["torch", "torchhydro"]
+)
+
+
+class GeneralSeq2Seq(object):
+    # the signature of torchhydro 0.2.0's GeneralSeq2Seq
+    def __init__(
+        self,
+        en_input_size,
+        de_input_size,
+        output_size,
+        hidden_size,
+        forecast_length,
+        hindcast_output_window=0,
+        teacher_forcing_ratio=0.5,
+    ):
+        pass
+
+
+def write_forecaster_files(tmp_dir):
+    """Statistics and attributes of random basins a forecaster can be built from"""
+    variables = VAR_C + ["total_precipitation_hourly", "sm_surface", "streamflow"]
+    stat_dict = {var: [0.0, 1.0, 0.2, 0.4] for var in variables}
+    rng = np.random.default_rng(0)
+    attributes = pd.DataFrame(
+        rng.random((3, len(VAR_C) + 1)),
+        index=["a", "b", "c"],
+        columns=VAR_C + [MEAN_PRCP_ATTRIBUTE],
+    )
+    stat_file = os.path.join(tmp_dir, "dapengscaler_stat.json")
+    with open(stat_file, "w") as fp:
+        json.dump(stat_dict, fp)
+    return stat_file, stat_dict, attributes
+
+
+class TestInference(unittest.TestCase):
+    """Tests for `hydroneimenggu.inference`."""
+
+    def test_normalize_round_trip(self):
+        stat_dict = {"streamflow": [0.0, 1.0, 0.3, 0.5], "area": [0, 1, 100.0, 50.0]}
+        flow = np.array([[0.0, 1.5, 4.0], [0.2, 0.0, 9.0]])
+        mean_prcp = mean_precipitation([2920.0, 5840.0], "3h")
+        np.testing.assert_allclose(mean_prcp, [1.0, 2.0])
+        normed = normalize(flow, "streamflow", stat_dict, mean_prcp=mean_prcp)
+        np.testing.assert_allclose(
+            normed[1, 2], (np.log10(np.sqrt(4.5) + 0.1) - 0.3) / 0.5
+        )
+        np.testing.assert_allclose(
+            normalize(normed, "streamflow", stat_dict, mean_prcp, to_norm=False), flow
+        )
+        np.testing.assert_allclose(normalize([150.0], "area", stat_dict), [1.0])
+        with self.assertRaises(ValueError):
+            normalize(flow, "streamflow", stat_dict)
+
+    def test_normalize_matches_torchhydro(self):
+        with tempfile.TemporaryDirectory() as train_dir:
+            self.assertIsNone(read_scaler_params(train_dir))
+            stat_file = os.path.join(train_dir, "dapengscaler_stat.json")
+            with open(stat_file, "w") as fp:
+                json.dump(TORCHHYDRO_STATS, fp)
+            # torchhydro names the configuration log after the end of training
+            with open(os.path.join(train_dir, "01_June_202003_00PM.json"), "w") as fp:
+                json.dump(TORCHHYDRO_CONFIG, fp)
+            scaler_params = read_scaler_params(train_dir)
+            stat_dict = read_stat_dict(stat_file)
+        self.assertEqual(scaler_params["gamma_norm_cols"], ("sm_surface",))
+        mean_prcp = mean_precipitation(TORCHHYDRO_PRE_MM_SYR, "3h")
+        for var, (values, expected) in TORCHHYDRO_VALUES.items():
+            normed = normalize(
+                values, var, stat_dict, mean_prcp, scaler_params=scaler_params
+            )
+            np.testing.assert_allclose(normed, expected, atol=1e-6)
+            np.testing.assert_allclose(
+                normalize(
+                    normed,
+                    var,
+                    stat_dict,
+                    mean_prcp,
+                    to_norm=False,
+                    scaler_params=scaler_params,
+                ),
+                values,
+            )
+        # DapengScaler's defaults would log-normalize the precipitation
+        precip, expected = TORCHHYDRO_VALUES["total_precipitation_hourly"]
+        self.assertFalse(
+            np.allclose(
+                normalize(precip, "total_precipitation_hourly", stat_dict), expected
+            )
+        )
+
+    def test_seq2seq_inputs(self):
+        history, horizon = 4, 2
+        precip = np.arange(2 * (history + horizon), dtype=float).reshape(2, -1)
+        attributes = np.array([[10.0, 11.0], [20.0, 21.0]])
+        forcings = -np.arange(2 * history, dtype=float).reshape(2, history, 1)
+        encoder, decoder = seq2seq_inputs(precip, attributes, history, forcings)
+        self.assertEqual(encoder.shape, (history, 2, 4))
+        self.assertEqual(decoder.shape, (horizon, 2, 3))
+        # precipitation, attributes, then the other forcings
+        np.testing.assert_array_equal(encoder[:, 1, 0], precip[1, :history])
+        np.testing.assert_array_equal(encoder[:, 1, 1:3], [[20.0, 21.0]] * history)
+        np.testing.assert_array_equal(encoder[:, 1, 3], forcings[1, :, 0])
+        np.testing.assert_array_equal(decoder[:, 0, 0], precip[0, history:])
+        _, decoder = seq2seq_inputs(precip, attributes, history)
+        self.assertEqual(decoder.shape, (horizon, 2, 3))
+
+    def test_streaming_inputs_match_the_full_windows(self):
+        rng = np.random.default_rng(1)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            stat_file, stat_dict, attributes = write_forecaster_files(tmp_dir)
+            forecaster = Seq2SeqForecaster(
+                "best_model.pth", stat_file, attributes, "3h", "mtlflowssm"
+            )
+        history, horizon = forecaster.history, forecaster.horizon
+        precip = rng.random((2, history + horizon + 20))
+        sm = rng.random((2, history + horizon + 20))
+        time = pd.date_range("2020-06-01 01:00", periods=precip.shape[1], freq="3h")
+        stream = StreamingForecast(
+            forecaster,
+            ["c", "a"],
+            time[history],
+            precip[:, : history + 1],
+            {"sm_surface": sm[:, : history + 1]},
+        )
+        for end in range(history + 1, history + 20):
+            stream.append(time[end], precip[:, end], {"sm_surface": sm[:, end]})
+        encoder, decoder = stream.inputs(precip[:, end + 1 : end + 1 + horizon])
+        expected = seq2seq_inputs(
+            normalize(
+                precip[:, end - history + 1 : end + 1 + horizon],
+                "total_precipitation_hourly",
+                stat_dict,
+            ),
+            forecaster._attributes[[2, 0]],
+            history,
+            normalize(sm[:, end - history : end], "sm_surface", stat_dict)[
+                :, :, np.newaxis
+            ],
+        )
+        np.testing.assert_allclose(encoder, expected[0], rtol=1e-6)
+        np.testing.assert_allclose(decoder, expected[1], rtol=1e-6)
+        with self.assertRaises(ValueError):
+            stream.append(time[end + 2], precip[:, 0], {"sm_surface": sm[:, 0]})
+
+
+    def test_model_kwargs(self):
+        hyperparam = model_hyperparam("3h", "stlflow")
+        self.assertEqual(model_kwargs(GeneralSeq2Seq, hyperparam), hyperparam)
+        # the prec_window of the older training scripts
+        old = dict(hyperparam, prec_window=2, dropout=0.1)
+        del old["hindcast_output_window"]
+        kwargs = model_kwargs(GeneralSeq2Seq, old)
+        self.assertEqual(kwargs["hindcast_output_window"], 2)
+        self.assertNotIn("prec_window", kwargs)
+        self.assertNotIn("dropout", kwargs)
+        GeneralSeq2Seq(**kwargs)
+
+    @unittest.skipUnless(HAS_TORCHHYDRO, "needs torch and torchhydro")
+    def test_forecast_runs_the_model(self):
+        import torch
+        from torchhydro.models.model_dict_function import pytorch_model_dict
+
+        model_class = pytorch_model_dict["Seq2Seq"]
+        hyperparam = model_hyperparam("3h", "mtlflowssm")
+        rng = np.random.default_rng(2)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            stat_file, _, attributes = write_forecaster_files(tmp_dir)
+            weight_path = os.path.join(tmp_dir, "best_model.pth")
+            torch.save(
+                model_class(**model_kwargs(model_class, hyperparam)).state_dict(),
+                weight_path,
+            )
+            forecaster = Seq2SeqForecaster(
+                weight_path, stat_file, attributes, "3h", "mtlflowssm"
+            )
+            history, horizon = forecaster.history, forecaster.horizon
+            ds = forecaster.forecast(
+                ["c", "a"],
+                rng.random((2, history + horizon)),
+                {"sm_surface": rng.random((2, history))},
+            )
+        self.assertEqual(list(ds.data_vars), forecaster.var_out)
+        for var in forecaster.var_out:
+            self.assertEqual(ds[var].dims, ("basin", "lead"))
+            self.assertEqual(ds[var].shape, (2, horizon))
+            self.assertTrue(np.isfinite(ds[var].values).all())
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+"""Tests for `hydroneimenggu.manifest`."""
+
+
+import os
+import tempfile
+import unittest
+
+from hydroneimenggu.manifest import Manifest
+
+
+class TestManifest(unittest.TestCase):
+    """Tests for `hydroneimenggu.manifest`."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.manifest_file = os.path.join(self.tmp_dir.name, "sub", "manifest.json")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_round_trip(self):
+        manifest = Manifest(self.manifest_file)
+        self.assertEqual(manifest.entries, {})
+        inputs = {"csv": {"mtime_ns": 1, "size": 2}, "params": ["3h", None]}
+        manifest.set("a", {"inputs": inputs, "n": 3})
+        manifest.set("b", {"inputs": None})
+        manifest.save()
+        # no temporary file is left next to it
+        folder = os.path.dirname(self.manifest_file)
+        self.assertEqual(os.listdir(folder), ["manifest.json"])
+        loaded = Manifest(self.manifest_file)
+        self.assertEqual(loaded.entries, manifest.entries)
+        self.assertEqual(loaded.pop("b"), {"inputs": None})
+        self.assertIsNone(loaded.pop("b"))
+        loaded.save()
+        self.assertEqual(list(Manifest(self.manifest_file).entries), ["a"])
+
+    def test_is_fresh(self):
+        manifest = Manifest(self.manifest_file)
+        inputs = {"csv": {"mtime_ns": 1, "size": 2}}
+        self.assertFalse(manifest.is_fresh("a", inputs))
+        manifest.set("a", {"inputs": inputs})
+        self.assertTrue(manifest.is_fresh("a", {"csv": {"mtime_ns": 1, "size": 2}}))
+        self.assertFalse(manifest.is_fresh("a", {"csv": {"mtime_ns": 5, "size": 2}}))
+        self.assertFalse(manifest.is_fresh("a", {}))
+        self.assertFalse(manifest.is_fresh("b", inputs))
+
+    def test_unreadable_file_gives_an_empty_manifest(self):
+        os.makedirs(os.path.dirname(self.manifest_file))
+        with open(self.manifest_file, "w") as fp:
+            fp.write('{"a": {"inputs": ')
+        manifest = Manifest(self.manifest_file)
+        self.assertEqual(manifest.entries, {})
+        self.assertFalse(manifest.is_fresh("a", None))
+        # the next save replaces the broken file
+        manifest.set("a", {"inputs": None})
+        manifest.save()
+        self.assertTrue(Manifest(self.manifest_file).is_fresh("a", None))
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+
+"""Tests for `hydroneimenggu.metrics_store`."""
+
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from hydroneimenggu.event_metrics import METRICS_COLUMNS
+from hydroneimenggu.manifest import Manifest
+from hydroneimenggu.metrics_store import (
+    load_flow_metrics,
+    partition_dir,
+    plan_basin_metrics,
+    prune_metrics_partitions,
+    record_basin_metrics,
+    write_metrics_partition,
+)
+
+
+def metrics_rows(basin_ids, nse):
+    return [
+        {
+            "basin_id": basin_id,
+            "basin_name": f"basin {basin_id}",
+            "event_start": "2020-07-01 01:00",
+            "event_end": "2020-07-03 22:00",
+            "rmse": 1.5,
+            "correlation": 0.8,
+            "nse": value,
+            "flow_obs_coeff_total": 0.3,
+            "flow_pred_coeff_total": np.nan,
+        }
+        for basin_id, value in zip(basin_ids, nse)
+    ]
+
+
+def run_basin_metrics(manifest_file, written, compute, force=False):
+    """One incremental run of the metrics, the way scripts/metrics.py does it
+
+    Returns the computed tasks and the rows written per basin.
+    """
+    tasks = [("nmg", "3h", "01"), ("nmg", "3h", "02")]
+    fingerprints = {task: {"events": {"size": 1}} for task in tasks}
+    manifest = Manifest(manifest_file)
+    basin_metrics, to_compute = plan_basin_metrics(
+        manifest, tasks, fingerprints, {("nmg", "3h"): written}, force=force
+    )
+    results = [compute(task) for task in to_compute]
+    basin_metrics.update(
+        record_basin_metrics(manifest, to_compute, results, fingerprints)
+    )
+    manifest.save()
+    return to_compute, {task[2]: rows for task, rows in basin_metrics.items() if rows}
+
+
+class TestMetricsStore(unittest.TestCase):
+    """Tests for `hydroneimenggu.metrics_store`."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store_dir = os.path.join(self.tmp_dir.name, "flow_metrics")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_partitions_are_written_and_read(self):
+        write_metrics_partition(
+            self.store_dir, "nmg", "3h", metrics_rows(["01", "02"], [0.5, 0.7])
+        )
+        write_metrics_partition(
+            self.store_dir, "nmg", "1D", metrics_rows(["01"], [0.6])
+        )
+        write_metrics_partition(
+            self.store_dir, "camels", "3h", metrics_rows(["03"], [0.1])
+        )
+        self.assertTrue(os.path.isdir(partition_dir(self.store_dir, "nmg", "3h")))
+
+        df = load_flow_metrics(self.store_dir)
+        self.assertEqual(len(df), 4)
+        self.assertEqual(
+            set(df.columns), set(METRICS_COLUMNS + ["project", "time_unit"])
+        )
+        row = df[(df["project"] == "nmg") & (df["time_unit"] == "3h")].sort_values(
+            "basin_id"
+        )
+        # ids keep their leading zeros, times and floats their types
+        self.assertEqual(list(row["basin_id"]), ["01", "02"])
+        np.testing.assert_allclose(row["nse"], [0.5, 0.7])
+        self.assertTrue(row["flow_pred_coeff_total"].isna().all())
+        self.assertEqual(
+            pd.Timestamp(row["event_start"].iloc[0]), pd.Timestamp("2020-07-01 01:00")
+        )
+
+        # only the asked partitions and columns are read
+        df = load_flow_metrics(
+            self.store_dir, columns=["basin_id", "nse"], time_units=["3h"]
+        )
+        self.assertEqual(
+            sorted(df.columns), ["basin_id", "nse", "project", "time_unit"]
+        )
+        self.assertEqual(sorted(df["basin_id"]), ["01", "02", "03"])
+        df = load_flow_metrics(self.store_dir, projects=["camels"])
+        self.assertEqual(list(df["basin_id"]), ["03"])
+
+    def test_writing_replaces_the_partition(self):
+        write_metrics_partition(
+            self.store_dir, "nmg", "3h", metrics_rows(["01", "02"], [0.5, 0.7])
+        )
+        write_metrics_partition(
+            self.store_dir, "nmg", "1D", metrics_rows(["01"], [0.6])
+        )
+        write_metrics_partition(
+            self.store_dir, "nmg", "3h", metrics_rows(["02"], [0.9])
+        )
+        df = load_flow_metrics(self.store_dir, time_units=["3h"])
+        self.assertEqual(list(df["basin_id"]), ["02"])
+        np.testing.assert_allclose(df["nse"], [0.9])
+        # no metrics remove the partition, the others are kept
+        write_metrics_partition(self.store_dir, "nmg", "3h", [])
+        self.assertFalse(os.path.exists(partition_dir(self.store_dir, "nmg", "3h")))
+        df = load_flow_metrics(self.store_dir)
+        self.assertEqual(list(df["time_unit"]), ["1D"])
+
+    def test_partitions_of_removed_projects_are_pruned(self):
+        for project, time_unit in [("nmg", "3h"), ("nmg", "1D"), ("old", "3h")]:
+            write_metrics_partition(
+                self.store_dir, project, time_unit, metrics_rows(["01"], [0.5])
+            )
+        removed = prune_metrics_partitions(self.store_dir, [("nmg", "3h")])
+        self.assertEqual(removed, [("nmg", "1D"), ("old", "3h")])
+        self.assertFalse(os.path.exists(os.path.join(self.store_dir, "project=old")))
+        df = load_flow_metrics(self.store_dir)
+        self.assertEqual(
+            sorted(zip(df["project"], df["time_unit"])), [("nmg", "3h")]
+        )
+        self.assertEqual(prune_metrics_partitions(self.tmp_dir.name + "/none", []), [])
+
+    def test_failed_basins_are_computed_again(self):
+        manifest_file = os.path.join(self.tmp_dir.name, "manifest.json")
+
+        def compute(task):
+            return metrics_rows([task[2]], [0.5])
+
+        def failing_02(task):
+            return None if task[2] == "02" else compute(task)
+
+        computed, written = run_basin_metrics(manifest_file, {}, failing_02)
+        self.assertEqual(len(computed), 2)
+        self.assertEqual(sorted(written), ["01"])
+        self.assertNotIn("nmg/3h/02", Manifest(manifest_file).entries)
+        # the rerun computes only the basin that failed
+        computed, written = run_basin_metrics(manifest_file, written, compute)
+        self.assertEqual(computed, [("nmg", "3h", "02")])
+        self.assertEqual(sorted(written), ["01", "02"])
+        computed, written = run_basin_metrics(manifest_file, written, compute)
+        self.assertEqual(computed, [])
+        # force ignores the manifest, and a failure under force is retried later
+        computed, written = run_basin_metrics(
+            manifest_file, written, failing_02, force=True
+        )
+        self.assertEqual(len(computed), 2)
+        computed, written = run_basin_metrics(manifest_file, written, compute)
+        self.assertEqual(computed, [("nmg", "3h", "02")])
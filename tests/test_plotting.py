@@ -0,0 +1,300 @@
+#!/usr/bin/env python
+
+"""Tests for `hydroneimenggu.plotting`."""
+
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from hydroneimenggu.plotting import (
+    EventPlotJob,
+    EventPlotRenderer,
+    PanelPlotRenderer,
+    RenderCache,
+    YearPlotJob,
+    bucket_max,
+    flow_to_discharge,
+    minmax_envelope,
+)
+
+
+def write_results(root, time_unit="3h", periods=40, start="2020-06-01 01:00"):
+    """A test project, a forcing cache file, event tables and basin_info.csv
+
+    Returns the result, cache and project folders and the basin_info.csv path.
+    """
+    result_dir = os.path.join(root, "results")
+    cache_dir = os.path.join(root, "cache")
+    project_name = f"test_with_nmg_{time_unit}_mtlflowssm"
+    project_dir = os.path.join(result_dir, project_name)
+    os.makedirs(project_dir)
+    os.makedirs(cache_dir)
+    rng = np.random.default_rng(2)
+    basins = ["b1", "b2"]
+    time = pd.date_range(start, periods=periods, freq=time_unit)
+
+    def series():
+        return (("basin", "time"), rng.random((len(basins), periods)))
+
+    coords = {"basin": basins, "time": time}
+    for name in ["epochbest_model.pthflow_obs.nc", "epochbest_model.pthflow_pred.nc"]:
+        xr.Dataset(
+            {"streamflow": series(), "sm_surface": series()}, coords=coords
+        ).to_netcdf(os.path.join(project_dir, name))
+    xr.Dataset({"total_precipitation_hourly": series()}, coords=coords).to_netcdf(
+        os.path.join(cache_dir, f"nmg_timeseries_{time_unit}.nc")
+    )
+    for basin in basins:
+        os.makedirs(os.path.join(result_dir, "events", basin))
+        pd.DataFrame(
+            {
+                "BASIN": [basin, basin],
+                "BEGINNING_RAIN": ["2020-06-01 00:00", "2020-06-03 00:00"],
+                "END_RAIN": ["2020-06-02 00:00", "2020-06-04 00:00"],
+            }
+        ).to_csv(
+            os.path.join(result_dir, "events", basin, f"{basin}_1D_events.csv"),
+            index=False,
+        )
+    basin_info_file = os.path.join(root, "basin_info.csv")
+    pd.DataFrame(
+        {"basin_id": basins, "name": ["甲", "乙"], "basin_area": [10.0, 20.0]}
+    ).to_csv(basin_info_file, index=False)
+    return result_dir, cache_dir, project_name, basin_info_file
+
+
+class TestPlotting(unittest.TestCase):
+    """Tests for `hydroneimenggu.plotting`."""
+
+    def test_flow_to_discharge(self):
+        # 24 mm a day over 3.6 km^2 is 1 mm/h, i.e. 1 m^3/s
+        self.assertAlmostEqual(flow_to_discharge(24.0, "1D", 3.6), 1.0)
+        self.assertAlmostEqual(flow_to_discharge(3.0, "3h", 3.6), 1.0)
+        self.assertAlmostEqual(flow_to_discharge(1.0, "1h", 3.6), 1.0)
+
+    def test_renderer_reuses_figure(self):
+        rng = np.random.default_rng(0)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with EventPlotRenderer() as renderer:
+                figure = renderer.figure
+                for i, n in enumerate([30, 10, 0]):
+                    time = pd.date_range("2001-01-01", periods=n, freq="3h")
+                    flow = rng.random(n)
+                    renderer.render(
+                        os.path.join(tmp_dir, f"{i}.png"),
+                        time,
+                        rng.random(n),
+                        flow,
+                        flow * 1.1,
+                        "basin",
+                    )
+                    self.assertIs(renderer.figure, figure)
+                    self.assertEqual(len(renderer.ax_precip.patches), n)
+                    self.assertEqual(len(renderer.ax_flow.lines), 2)
+            self.assertIsNone(renderer.figure)
+            self.assertEqual(sorted(os.listdir(tmp_dir)), ["0.png", "1.png", "2.png"])
+
+    def test_render_does_not_depend_on_previous_event(self):
+        rng = np.random.default_rng(1)
+        events = []
+        for n, freq in [(40, "1D"), (5, "3h"), (0, "3h")]:
+            time = pd.date_range("2001-01-01", periods=n, freq=freq)
+            events.append((time, rng.random(n), rng.random(n), rng.random(n)))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+
+            def render(renderer, i, prefix):
+                output_file = os.path.join(tmp_dir, f"{prefix}{i}.png")
+                renderer.render(output_file, *events[i], "basin")
+                with open(output_file, "rb") as fp:
+                    return fp.read()
+
+            with EventPlotRenderer() as renderer:
+                in_sequence = [render(renderer, i, "seq") for i in range(3)]
+            for i in range(3):
+                with EventPlotRenderer() as renderer:
+                    self.assertEqual(render(renderer, i, "alone"), in_sequence[i])
+
+    def test_render_without_obs(self):
+        time = pd.date_range("2001-01-01", periods=10, freq="1D")
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with EventPlotRenderer(show_obs=False) as renderer:
+                renderer.render(
+                    os.path.join(tmp_dir, "pred.png"),
+                    time,
+                    np.ones(10),
+                    None,
+                    np.arange(10.0),
+                    "basin",
+                )
+                self.assertEqual(len(renderer.ax_flow.lines), 1)
+                self.assertGreaterEqual(renderer.ax_flow.get_ylim()[1], 9)
+            self.assertTrue(os.path.exists(os.path.join(tmp_dir, "pred.png")))
+
+    def test_panel_renderer(self):
+        rng = np.random.default_rng(2)
+        panels = []
+        for year in (2015, 2016, 2017):
+            time = pd.date_range(f"{year}-01-01", f"{year}-10-31", freq="1D")
+            panels.append(
+                (year, time, rng.random(time.size), None, rng.random(time.size))
+            )
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_file = os.path.join(tmp_dir, "panels.png")
+            with PanelPlotRenderer(show_obs=False) as renderer:
+                renderer.render(output_file, panels, "basin")
+            self.assertTrue(os.path.getsize(output_file) > 0)
+
+    def test_minmax_envelope_keeps_extremes(self):
+        rng = np.random.default_rng(3)
+        time = pd.date_range("2001-01-01", periods=10000, freq="1h")
+        values = rng.gamma(1.0, 2.0, time.size)
+        values[5000:5100] = np.nan
+        kept_time, kept = minmax_envelope(time, values, 100)
+        self.assertLessEqual(kept.size, 2 * 100 + 2)
+        self.assertEqual(kept_time[0], time[0])
+        self.assertEqual(kept_time[-1], time[-1])
+        # every bucket spans the same range as in the full series
+        for bucket in np.array_split(np.arange(time.size), 100):
+            in_bucket = (kept_time >= time[bucket[0]]) & (kept_time <= time[bucket[-1]])
+            if np.isnan(values[bucket]).all():
+                # the gap still breaks the line
+                self.assertTrue(np.isnan(kept[in_bucket]).all())
+                continue
+            self.assertEqual(np.nanmax(kept[in_bucket]), np.nanmax(values[bucket]))
+            self.assertEqual(np.nanmin(kept[in_bucket]), np.nanmin(values[bucket]))
+        short_time, short = minmax_envelope(time[:150], values[:150], 100)
+        np.testing.assert_array_equal(short, values[:150])
+
+    def test_bucket_max(self):
+        time = pd.date_range("2001-01-01", periods=12, freq="1h")
+        values = np.array([0, 3, 1, 0, 0, 0, np.nan, np.nan, np.nan, 5, 0, 2.0])
+        step_time, maxima = bucket_max(time, values, 4)
+        np.testing.assert_array_equal(step_time, time[::3])
+        np.testing.assert_array_equal(maxima, [3, 0, np.nan, 5])
+
+    def test_downsampled_render(self):
+        rng = np.random.default_rng(4)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with EventPlotRenderer(downsample=True) as renderer:
+                for n in (8000, 50):
+                    time = pd.date_range("2001-01-01", periods=n, freq="1h")
+                    renderer.render(
+                        os.path.join(tmp_dir, f"{n}.png"),
+                        time,
+                        rng.random(n),
+                        rng.random(n),
+                        rng.random(n),
+                        "basin",
+                    )
+                    # one fill instead of a bar per time step
+                    self.assertEqual(len(renderer.ax_precip.collections), 1)
+                    self.assertEqual(len(renderer.ax_precip.patches), 0)
+                self.assertLessEqual(
+                    renderer.obs_line.get_xdata().size, 2 * renderer.n_bins + 2
+                )
+
+    def test_render_cache(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            manifest_file = os.path.join(tmp_dir, "plot_manifest.json")
+            output_file = os.path.join(tmp_dir, "basin", "event.png")
+            inputs = {
+                "files": {"pred": {"mtime_ns": 1, "size": 2}},
+                "window": (pd.Timestamp("2001-01-01"), pd.Timestamp("2001-01-02")),
+            }
+            cache = RenderCache(manifest_file)
+            cache.record(output_file, inputs)
+            cache.save()
+            # recorded, but the image itself is missing
+            self.assertFalse(RenderCache(manifest_file).is_fresh(output_file, inputs))
+            os.makedirs(os.path.dirname(output_file))
+            open(output_file, "wb").close()
+            cache = RenderCache(manifest_file)
+            self.assertTrue(cache.is_fresh(output_file, inputs))
+            inputs["files"]["pred"]["size"] = 3
+            self.assertFalse(cache.is_fresh(output_file, inputs))
+
+    def test_event_plot_job(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            result_dir, cache_dir, project_name, basin_info_file = write_results(
+                tmp_dir
+            )
+            job = EventPlotJob(
+                result_dir,
+                cache_dir,
+                basin_info_file,
+                var="sm_surface",
+                file_label="sm_surface",
+                manifest_name="plot_manifest_sm_surface.json",
+            )
+            tasks = job.tasks("3h", project_name)
+            self.assertEqual(len(tasks), 4)
+            self.assertEqual(
+                os.path.basename(tasks[0][6]),
+                "甲_sm_surface_2020-06-01 01:00:00-2020-06-02 01:00:00.png",
+            )
+            self.assertEqual(job.run(tasks), 4)
+            self.assertTrue(all(os.path.exists(task[6]) for task in tasks))
+            # nothing changed, nothing to render
+            self.assertEqual(job.run(job.tasks("3h", project_name)), 0)
+
+            # other renderer settings render the images again, in two processes
+            job.renderer_kwargs = {"dpi": 50}
+            self.assertEqual(job.run(job.tasks("3h", project_name), workers=2), 4)
+            self.assertTrue(
+                os.path.exists(
+                    os.path.join(result_dir, "events", "plot_manifest_sm_surface.json")
+                )
+            )
+
+    def test_year_plot_job(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            result_dir, cache_dir, project_name, basin_info_file = write_results(
+                tmp_dir, "1D", periods=500, start="2019-06-01"
+            )
+            job = YearPlotJob(
+                result_dir,
+                cache_dir,
+                basin_info_file,
+                renderer_kwargs={"show_obs": False},
+            )
+            # no data in 2018, b3 is not a station
+            years = [2018, 2019, 2020]
+            self.assertEqual(job.run("1D", project_name, ["b1", "b2", "b3"], years), 4)
+            project_folder = os.path.join(result_dir, "year", project_name)
+            self.assertEqual(sorted(os.listdir(project_folder)), ["2019", "2020"])
+            self.assertEqual(
+                sorted(os.listdir(os.path.join(project_folder, "2020"))),
+                ["乙.png", "甲.png"],
+            )
+            inputs = job.inputs("1D", project_name, "b1", None, ["2020"])
+            self.assertNotIn("obs", inputs["files"])
+            self.assertEqual(inputs["params"]["renderer"], {"show_obs": False})
+            self.assertEqual(job.run("1D", project_name, ["b1", "b2"], years), 0)
+
+            # the renderer settings are inputs of the images
+            job.renderer_kwargs["dpi"] = 50
+            self.assertEqual(job.run("1D", project_name, ["b1"], years), 2)
+
+            panels = YearPlotJob(
+                result_dir,
+                cache_dir,
+                basin_info_file,
+                var="sm_surface",
+                file_label="sm_surface",
+                manifest_name="plot_manifest_sm_surface.json",
+                panels=True,
+            )
+            self.assertEqual(panels.run("1D", project_name, ["b1"], years), 1)
+            self.assertTrue(
+                os.path.exists(
+                    os.path.join(project_folder, "甲_sm_surface_2018-2020.png")
+                )
+            )
+            self.assertIn(
+                "obs", panels.inputs("1D", project_name, "b1", None, years)["files"]
+            )
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+
+"""Tests for `hydroneimenggu.session`."""
+
+
+import os
+import pickle
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from hydroneimenggu.basin_store import DATA_FILE, get_basin_store
+from hydroneimenggu.common import file_fingerprint
+from hydroneimenggu.session import (
+    OBS_FILE_NAME,
+    PRED_FILE_NAME,
+    ProjectSession,
+    find_basin_forcing,
+    forcing_fingerprint,
+)
+
+BASINS = ["b1", "b2", "b3"]
+
+
+def write_dataset(nc_file, variables, start, periods):
+    time = pd.date_range(start, periods=periods, freq="1D")
+    rng = np.random.default_rng(periods)
+    xr.Dataset(
+        {
+            var: (("basin", "time"), rng.random((len(BASINS), periods)))
+            for var in variables
+        },
+        coords={"basin": BASINS, "time": time},
+    ).to_netcdf(nc_file)
+
+
+def write_hourly_csvs(csv_dir, basins, start, days):
+    """1h precipitation CSVs of some basins, as in DATASET_DIR/timeseries/1h"""
+    os.makedirs(csv_dir)
+    time = pd.date_range(start, periods=24 * days, freq="1h", name="time")
+    rng = np.random.default_rng(days)
+    csv_files = []
+    for basin in basins:
+        csv_file = os.path.join(csv_dir, f"{basin}.csv")
+        pd.DataFrame(
+            {"total_precipitation_hourly": rng.gamma(0.5, 1.0, time.size)},
+            index=time,
+        ).reset_index().to_csv(csv_file, index=False)
+        csv_files.append(csv_file)
+    return csv_files
+
+
+class TestSession(unittest.TestCase):
+    """Tests for `hydroneimenggu.session`."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.project_dir = self.tmp_dir.name
+        # the predictions begin two days after the observations and end two
+        # days later; the forcing covers part of both
+        write_dataset(
+            os.path.join(self.project_dir, OBS_FILE_NAME),
+            ["streamflow", "sm_surface"],
+            "2020-06-01",
+            10,
+        )
+        write_dataset(
+            os.path.join(self.project_dir, PRED_FILE_NAME),
+            ["streamflow", "sm_surface"],
+            "2020-06-03",
+            10,
+        )
+        self.forcing_file = os.path.join(self.project_dir, "forcing.nc")
+        write_dataset(
+            self.forcing_file, ["total_precipitation_hourly"], "2020-06-02", 7
+        )
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_basin_cache_keeps_the_recently_used_series(self):
+        with ProjectSession(self.project_dir, max_cached_basins=2) as session:
+            b1 = session.obs_series("b1")
+            session.obs_series("b2")
+            self.assertIs(session.obs_series("b1"), b1)
+            # b2 is now the least recently used and is dropped for b3
+            session.obs_series("b3")
+            self.assertEqual(
+                list(session._basin_cache),
+                [
+                    (session.obs_file, "b1", "streamflow"),
+                    (session.obs_file, "b3", "streamflow"),
+                ],
+            )
+            self.assertIs(session.obs_series("b1"), b1)
+            # variables and files are cached separately
+            session.obs_series("b1", "sm_surface")
+            self.assertEqual(len(session._basin_cache), 2)
+            self.assertNotIn(
+                (session.obs_file, "b3", "streamflow"), session._basin_cache
+            )
+            with xr.open_dataset(session.obs_file) as ds:
+                np.testing.assert_array_equal(
+                    b1, ds["streamflow"].sel(basin="b1").to_numpy()
+                )
+            # the files stay open, once each
+            self.assertEqual(list(session._datasets), [session.obs_file])
+            session.pred_series("b1")
+            self.assertEqual(len(session._datasets), 2)
+        self.assertEqual(session._datasets, {})
+        self.assertEqual(len(session._basin_cache), 0)
+
+    def test_pickled_session_reopens_the_files(self):
+        session = ProjectSession(self.project_dir)
+        expected = session.obs_series("b2").to_numpy()
+        copy = pickle.loads(pickle.dumps(session))
+        self.assertEqual(copy._datasets, {})
+        np.testing.assert_array_equal(copy.obs_series("b2"), expected)
+        copy.close()
+        session.close()
+
+    def test_aligned_basin(self):
+        with ProjectSession(self.project_dir) as session:
+            aligned = session.aligned_basin(
+                "b2", self.forcing_file, "total_precipitation_hourly"
+            )
+            time = pd.date_range("2020-06-03", "2020-06-08", freq="1D")
+            self.assertEqual(list(aligned.indexes["time"]), list(time))
+            self.assertEqual(list(aligned.data_vars), ["obs", "pred", "precip"])
+            np.testing.assert_array_equal(
+                aligned["obs"], session.obs_series("b2").sel(time=time)
+            )
+            np.testing.assert_array_equal(
+                aligned["pred"], session.pred_series("b2").sel(time=time)
+            )
+            np.testing.assert_array_equal(
+                aligned["precip"],
+                session.basin_series(
+                    self.forcing_file, "b2", "total_precipitation_hourly"
+                ).sel(time=time),
+            )
+
+    def test_time_bounds(self):
+        with ProjectSession(self.project_dir) as session:
+            self.assertEqual(
+                session.time_bounds("b1"),
+                (pd.Timestamp("2020-06-03"), pd.Timestamp("2020-06-10")),
+            )
+        # predictions entirely after the observations: the range is empty,
+        # its start after its end, and nothing is aligned
+        write_dataset(
+            os.path.join(self.project_dir, PRED_FILE_NAME),
+            ["streamflow", "sm_surface"],
+            "2020-07-01",
+            5,
+        )
+        with ProjectSession(self.project_dir) as session:
+            start, end = session.time_bounds("b1")
+            self.assertEqual(start, pd.Timestamp("2020-07-01"))
+            self.assertEqual(end, pd.Timestamp("2020-06-10"))
+            self.assertGreater(start, end)
+            aligned = session.aligned_basin(
+                "b1", self.forcing_file, "total_precipitation_hourly"
+            )
+            self.assertEqual(aligned.sizes["time"], 0)
+
+    def test_hourly_store_is_aggregated_to_the_time_unit(self):
+        csv_files = write_hourly_csvs(
+            os.path.join(self.project_dir, "1h"), ["b1", "b2"], "2020-06-02", 8
+        )
+        store_dir = os.path.join(self.project_dir, "store")
+        store = get_basin_store(store_dir, csv_files)
+        cache_dir = os.path.join(self.project_dir, "cache")
+        os.makedirs(cache_dir)
+        nc_file = os.path.join(cache_dir, "nmg_timeseries_1D.nc")
+        write_dataset(nc_file, ["total_precipitation_hourly"], "2020-06-02", 7)
+        # the store when it has the basin, otherwise the cache file
+        self.assertEqual(
+            find_basin_forcing("b2", "1D", cache_dir, store_dir), store_dir
+        )
+        self.assertEqual(
+            find_basin_forcing("b3", "1D", cache_dir, store_dir), nc_file
+        )
+        self.assertEqual(find_basin_forcing("b2", "1D", cache_dir), nc_file)
+        self.assertEqual(
+            forcing_fingerprint(store_dir),
+            file_fingerprint(os.path.join(store_dir, DATA_FILE)),
+        )
+        with ProjectSession(self.project_dir, time_unit="1D") as session:
+            self.assertTrue(session.has_basin("b2", store_dir))
+            self.assertFalse(session.has_basin("b3", store_dir))
+            aligned = session.aligned_basin(
+                "b2", store_dir, "total_precipitation_hourly"
+            )
+            time = pd.date_range("2020-06-03", "2020-06-09", freq="1D")
+            self.assertEqual(list(aligned.indexes["time"]), list(time))
+            hourly = pd.read_csv(csv_files[1], index_col="time", parse_dates=True)
+            daily = hourly["total_precipitation_hourly"].resample("1D").sum()
+            np.testing.assert_allclose(aligned["precip"], daily.loc[time])
+        store.close()
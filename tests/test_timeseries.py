@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+
+"""Tests for `hydroneimenggu.timeseries`."""
+
+
+import os
+import tempfile
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from hydroneimenggu import timeseries
+from hydroneimenggu.timeseries import (
+    TimeseriesCache,
+    get_timeseries_cache,
+    parse_times,
+    read_timeseries_csv,
+)
+
+
+def refresh_cache(csv_dir, cache_dir):
+    return TimeseriesCache(csv_dir, cache_dir, refresh=False).refresh()
+
+
+class TestTimeseries(unittest.TestCase):
+    """Tests for `hydroneimenggu.timeseries`."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.csv_file = os.path.join(self.tmp_dir.name, "basin.csv")
+        self.df = pd.DataFrame(
+            {
+                "time": pd.date_range("2001-01-01", periods=48, freq="1h"),
+                "streamflow": np.linspace(0.1, 4.8, 48),
+                "total_precipitation_hourly": np.arange(48) / 7.0,
+                "temperature_2m": np.ones(48),
+            }
+        )
+        self.df.loc[5, "streamflow"] = np.nan
+        self.df.to_csv(self.csv_file, index=False)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_read_timeseries_csv(self):
+        time, values = read_timeseries_csv(
+            self.csv_file, ["total_precipitation_hourly", "streamflow"]
+        )
+        self.assertTrue((time == pd.DatetimeIndex(self.df["time"])).all())
+        self.assertEqual(values.shape, (2, 48))
+        self.assertTrue(values[0].flags["C_CONTIGUOUS"])
+        np.testing.assert_array_equal(
+            values[0], self.df["total_precipitation_hourly"].to_numpy()
+        )
+        np.testing.assert_array_equal(values[1], self.df["streamflow"].to_numpy())
+
+    def test_parse_times(self):
+        times = parse_times(np.array(["2001-01-01 00:00:00", "2001-01-01 03:00:00"]))
+        self.assertEqual(times[1], pd.Timestamp("2001-01-01 03:00"))
+        # dates without a time of day are parsed too
+        days = parse_times(np.array(["2001-01-01", "2001-01-02"]))
+        self.assertEqual(days[1], pd.Timestamp("2001-01-02"))
+
+    def test_timeseries_cache(self):
+        # a second basin with another time range, a gap and fewer columns
+        other = self.df.iloc[10:60:2][["time", "streamflow"]].copy()
+        other["time"] = other["time"] + pd.Timedelta("30h")
+        other.to_csv(os.path.join(self.tmp_dir.name, "other.csv"), index=False)
+        cache_dir = os.path.join(self.tmp_dir.name, "cache")
+        cache = TimeseriesCache(self.tmp_dir.name, cache_dir)
+        self.assertEqual(cache.basins, ["basin", "other"])
+        self.assertTrue(cache.is_fresh())
+        for basin in cache.basins:
+            csv_file = os.path.join(self.tmp_dir.name, f"{basin}.csv")
+            columns = list(pd.read_csv(csv_file, nrows=0).columns[1:])
+            time, values = read_timeseries_csv(csv_file, columns)
+            cached = cache.load_basin(basin, columns)
+            self.assertTrue((cached.index == time).all())
+            np.testing.assert_array_equal(cached.to_numpy().T, values)
+        # a modified CSV makes the cache stale and it is rebuilt
+        self.df["streamflow"] = 1.0
+        self.df.to_csv(self.csv_file, index=False)
+        os.utime(self.csv_file, ns=(0, 0))
+        self.assertFalse(cache.is_fresh())
+        self.assertTrue(cache.refresh())
+        self.assertTrue(
+            (cache.load_basin("basin", ["streamflow"])["streamflow"] == 1.0).all()
+        )
+
+    def test_only_changed_csvs_are_parsed(self):
+        other_file = os.path.join(self.tmp_dir.name, "other.csv")
+        self.df.iloc[::3].to_csv(other_file, index=False)
+        cache_dir = os.path.join(self.tmp_dir.name, "cache")
+        cache = TimeseriesCache(self.tmp_dir.name, cache_dir)
+        # the other basin gets longer, which also extends the shared time axis
+        longer = self.df.copy()
+        longer["time"] = longer["time"] + pd.Timedelta("12h")
+        longer.to_csv(other_file, index=False)
+        os.utime(other_file, ns=(0, 0))
+        with mock.patch.object(
+            timeseries, "read_timeseries_csv", wraps=read_timeseries_csv
+        ) as read_csv:
+            self.assertTrue(cache.refresh())
+        self.assertEqual(
+            [call.args[0] for call in read_csv.call_args_list], [other_file]
+        )
+        for basin, csv_file in [("basin", self.csv_file), ("other", other_file)]:
+            columns = list(pd.read_csv(csv_file, nrows=0).columns[1:])
+            time, values = read_timeseries_csv(csv_file, columns)
+            cached = cache.load_basin(basin, columns)
+            self.assertTrue((cached.index == time).all())
+            np.testing.assert_array_equal(cached.to_numpy().T, values)
+        # a forced refresh parses everything
+        with mock.patch.object(
+            timeseries, "read_timeseries_csv", wraps=read_timeseries_csv
+        ) as read_csv:
+            self.assertTrue(cache.refresh(force=True))
+        self.assertEqual(read_csv.call_count, 2)
+
+    def test_concurrent_refresh_builds_once(self):
+        cache_dir = os.path.join(self.tmp_dir.name, "cache")
+        with ProcessPoolExecutor(max_workers=3) as executor:
+            rebuilt = list(
+                executor.map(
+                    refresh_cache, [self.tmp_dir.name] * 3, [cache_dir] * 3
+                )
+            )
+        self.assertEqual(sorted(rebuilt), [False, False, True])
+        self.assertTrue(TimeseriesCache(self.tmp_dir.name, cache_dir).is_fresh())
+
+    def test_get_timeseries_cache_refreshes_once(self):
+        cache_dir = os.path.join(self.tmp_dir.name, "cache")
+        cache = get_timeseries_cache(self.tmp_dir.name, cache_dir)
+        self.assertTrue(cache.is_fresh())
+        os.utime(self.csv_file, ns=(0, 0))
+        with mock.patch.object(TimeseriesCache, "refresh") as refresh:
+            self.assertIs(get_timeseries_cache(self.tmp_dir.name, cache_dir), cache)
+        refresh.assert_not_called()
+        self.assertFalse(cache.is_fresh())